@@ -0,0 +1,94 @@
+import glob
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import final
+
+logger = logging.getLogger(__name__)
+
+# Pages copied per backup step. Each step only holds a read lock on the
+# database for as long as it takes to copy this many pages.
+BACKUP_PAGES_PER_STEP = 64
+# Seconds to sleep between backup steps, spreading the copy's disk reads out
+# so the bot's own queries don't queue behind them.
+BACKUP_STEP_SLEEP = 0.01
+
+
+@final
+class BackupResult:
+    """Where a backup ended up and what it cost."""
+
+    def __init__(self, path: str, duration: float, size: int) -> None:
+        self.path = path
+        self.duration = duration
+        self.size = size
+
+
+def backup_database(
+    db_file: str,
+    backup_dir: str,
+    keep: int,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    sleep: float = BACKUP_STEP_SLEEP,
+) -> BackupResult:
+    """
+    Makes a snapshot of the database while it's in use, using SQLite's online
+    backup API, then removes the oldest snapshots so only keep are left.
+    This blocks, so run it in a worker thread.
+
+    Args:
+        db_file (str): The database to back up.
+        backup_dir (str): The directory to put snapshots in.
+        keep (int): How many snapshots to keep.
+        pages (int): Pages to copy per step.
+        sleep (float): Seconds to sleep between steps.
+
+    Returns:
+        BackupResult: The path, duration and size of the new snapshot.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_file))[0]
+    path = os.path.join(
+        backup_dir, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}.sqlite"
+    )
+    # Write to a temporary name so a half done backup is never mistaken
+    # for a snapshot.
+    partial_path = path + ".partial"
+
+    start = time.monotonic()
+    try:
+        with closing(sqlite3.connect(db_file)) as source:
+            with closing(sqlite3.connect(partial_path)) as target:
+                # backup()'s own sleep only applies when the database is
+                # busy, so sleep after every step here instead.
+                source.backup(
+                    target,
+                    pages=pages,
+                    progress=lambda *_: time.sleep(sleep),
+                )
+        os.replace(partial_path, path)
+    except BaseException:
+        # Rotation only looks at finished snapshots, so nothing else would
+        # ever remove it.
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    result = BackupResult(
+        path, time.monotonic() - start, os.path.getsize(path)
+    )
+
+    _rotate_backups(backup_dir, stem, keep)
+    return result
+
+
+def _rotate_backups(backup_dir: str, stem: str, keep: int) -> None:
+    """Remove all but the keep newest snapshots of a database."""
+    # The timestamp in the name sorts the snapshots from oldest to newest.
+    snapshots = sorted(
+        glob.glob(os.path.join(glob.escape(backup_dir), f"{stem}-*.sqlite"))
+    )
+    for old_snapshot in snapshots[: max(len(snapshots) - keep, 0)]:
+        logger.debug("removing old backup %s", old_snapshot)
+        os.remove(old_snapshot)
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import signal
+import time
+from typing import override
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import storage
+from config import Config
+from health_server import HealthServer
+from loop_monitor import LoopMonitor
+from metrics import metrics
+from rest_scheduler import Priority, RestScheduler
+from traffic import TrafficRecorder
+from view_registry import ViewRegistry
+
+logger = logging.getLogger(__name__)
+
+# -----------------------STATIC VARS----------------------
+# test guild, discord bot testing grounds
+# TEST_GUILD = discord.Object(put ID of guild here)
+
+# Seconds to wait for running interaction callbacks when shutting down.
+INTERACTION_DRAIN_TIMEOUT = 15.0
+# Seconds to wait for pending writes and the WAL checkpoint on shutdown.
+DB_CLOSE_TIMEOUT = 10.0
+# Names discord.py gives the tasks running interaction callbacks.
+INTERACTION_TASK_PREFIXES = (
+    "discord-ui-view-dispatch-",
+    "discord-ui-modal-dispatch-",
+    "discord-ui-dynamic-item-",
+    "CommandTree-invoker",
+)
+# Cogs loaded before connecting to Discord.
+EARLY_LOAD_EXTENSIONS = [
+    "cogs.drinks_handler",
+    "cogs.backup_handler",
+    "cogs.diagnostics_handler",
+]
+# Cogs loaded once connected, they need the guild cache.
+LATE_LOAD_EXTENSIONS = [
+    "cogs.configure_drinks_handler",
+    "cogs.role_sync_handler",
+]
+
+
+async def check_interaction(
+    interaction: discord.Interaction, handler: str
+) -> bool:
+    """
+    Interaction check run before every command and persistent view callback.
+    Times the callback for the metrics, records it if traffic recording is
+    on, and turns interactions away while the bot is shutting down so
+    nothing new is started that might not get to finish.
+
+    Args:
+        interaction (discord.Interaction): The interaction to check.
+        handler (str): Name of what handles the interaction, for metrics.
+
+    Returns:
+        bool: If the interaction should be handled.
+    """
+    client = interaction.client
+    if isinstance(client, PanternBot) and client.shutting_down:
+        if interaction.type is not discord.InteractionType.autocomplete:
+            _ = await interaction.response.send_message(
+                "The bot is restarting, please try again in a moment.",
+                ephemeral=True,
+            )
+        return False
+    if isinstance(client, PanternBot) and client.traffic_recorder:
+        client.traffic_recorder.record(interaction, handler)
+
+    # Checks run inside the task that runs the callback, so the callback
+    # is done when the task is.
+    task = asyncio.current_task()
+    if task:
+        start = time.perf_counter()
+        task.add_done_callback(
+            lambda _: metrics.observe_interaction(
+                handler, time.perf_counter() - start
+            )
+        )
+    return True
+
+
+class PanternTree(app_commands.CommandTree):
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        handler = (
+            interaction.command.qualified_name
+            if interaction.command
+            else "unknown_command"
+        )
+        if interaction.type is discord.InteractionType.autocomplete:
+            handler += "_autocomplete"
+        return await check_interaction(interaction, handler)
+
+
+# -----------------------MAIN CLASS-----------------------
+class PanternBot(commands.Bot):
+    def __init__(self, config: Config, command_prefix: str) -> None:
+        # Set up intents and initialize the bot.
+        intents = discord.Intents.default()
+        intents.members = True
+        intents.message_content = True
+
+        self.config: Config = config
+        self.db: storage.Storage = storage.open_database(
+            config.db_file, config.db_partitions, config.sqlite_profile
+        )
+        self.shutting_down: bool = False
+        self.loop_monitor: LoopMonitor = LoopMonitor()
+        self.view_registry: ViewRegistry = ViewRegistry(self)
+        self.rest: RestScheduler = RestScheduler()
+        self.health_server: HealthServer | None = (
+            HealthServer(self, config.metrics_host, config.metrics_port)
+            if config.metrics_port
+            else None
+        )
+        self.traffic_recorder: TrafficRecorder | None = (
+            TrafficRecorder(config.traffic_record_file)
+            if config.traffic_record_file
+            else None
+        )
+        self._shutdown_task: asyncio.Task[None] | None = None
+        super().__init__(
+            intents=intents,
+            command_prefix=command_prefix,
+            description="D sektionens egna bot!",
+            activity=discord.Game(name="Blockbattle"),
+            tree_cls=PanternTree,
+        )
+
+    @override
+    async def close(self) -> None:
+        """
+        Shuts down gracefully: stops accepting interactions, lets running
+        callbacks finish, flushes pending database writes and checkpoints the
+        database before disconnecting. Each step has a deadline so a stuck
+        callback can't hold up a restart.
+        """
+        if not self.shutting_down:
+            self.shutting_down = True
+            logger.info("Shutting down, no longer accepting interactions")
+            try:
+                await asyncio.wait_for(
+                    self._drain_interactions(), INTERACTION_DRAIN_TIMEOUT
+                )
+            except TimeoutError:
+                logger.warning("Interactions still running at shutdown")
+            try:
+                await asyncio.wait_for(self.db.close(), DB_CLOSE_TIMEOUT)
+                logger.info("Database flushed and closed")
+            except TimeoutError:
+                logger.warning("Timed out closing the database")
+            self.loop_monitor.stop()
+            if self.health_server:
+                await self.health_server.stop()
+            if self.traffic_recorder:
+                await asyncio.to_thread(self.traffic_recorder.close)
+                logger.info(
+                    "Recorded %d interaction(s) to %s",
+                    self.traffic_recorder.event_count,
+                    self.traffic_recorder.path,
+                )
+        await super().close()
+
+    async def _drain_interactions(self) -> None:
+        """Wait for every running interaction callback to finish."""
+        current = asyncio.current_task()
+        running = [
+            task
+            for task in asyncio.all_tasks()
+            if task is not current
+            and task.get_name().startswith(INTERACTION_TASK_PREFIXES)
+        ]
+        if running:
+            logger.info("Waiting for %d interaction(s)", len(running))
+            _ = await asyncio.wait(running)
+
+    async def on_ready(self) -> None:
+        # login, probably want to log more info here
+        if self.user is None:
+            # Failed login
+            logger.critical("Failed login, quitting")
+            quit()
+
+        logger.info("Logged in as %s (ID: %s)", self.user, self.user.id)
+
+        logger.info("Loading late cogs:")
+        await self.load_extensions(LATE_LOAD_EXTENSIONS)
+        logger.info("Done loading late cogs")
+
+        try:
+            # We might want to make a command that deals with this instead.
+            # Syncing on every startup is excessive and eats both time and
+            # our allowed api calls.
+            synced = await self.rest.run(Priority.NORMAL, self.tree.sync)
+            logger.info("Synced %d command(s).", len(synced))
+        except Exception as e:
+            logger.error("Failed to sync commands: %s", e)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        # Nobody can click the views in a guild we've left.
+        evicted = self.view_registry.evict_guild(guild.id)
+        logger.info("Left guild %s, evicted %d view(s)", guild.id, evicted)
+
+    @override
+    async def setup_hook(self) -> None:
+        # Shut down gracefully when the container is stopped.
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except NotImplementedError:
+            # Signal handlers aren't available on windows.
+            pass
+
+        self.loop_monitor.start()
+        # Brings the database up to the current schema, so upgrading is
+        # just starting the new version. Does nothing if it already is.
+        await self.db.create_tables()
+        await self.db.connect()
+        if self.health_server:
+            await self.health_server.start()
+
+        # Do any data processing to get data into memory here:
+        mappings = await self.db.load_role_mappings()
+        logger.info("loaded %d role mapping(s)", len(mappings))
+        await self.db.load_drink_names()
+        logger.info(
+            "loaded drink names for %d guild(s)", len(self.db.drink_names)
+        )
+
+        # Load cogs:
+        logger.info("loading cogs:")
+        await self.load_extensions(EARLY_LOAD_EXTENSIONS)
+        logger.info("done loading cogs")
+
+        # Sync app commands with Discord:
+        # await self.tree.sync()
+        # self.tree.copy_global_to(guild=TEST_GUILD)
+        # await self.tree.sync(guild=TEST_GUILD)
+
+    @override
+    async def reload_extension(
+        self, name: str, *, package: str | None = None
+    ) -> None:
+        """
+        Reloads an extension in place. Everything kept on the bot survives,
+        like the database connections, their caches and pending writes, and
+        the REST queue. The extension's views are evicted first, so its
+        setup registers fresh ones running the new code. If the new code
+        fails to load, discord.py sets the old code up again, which brings
+        its views back.
+        """
+        if name in self.extensions:
+            evicted = self.view_registry.evict_module(name)
+            logger.info("evicted %d view(s) of %s", evicted, name)
+        await super().reload_extension(name, package=package)
+
+    async def load_extensions(self, extensions: list[str]) -> None:
+        """Load extensions one after another, logging how long each took.
+        An extension that fails to load is logged and skipped."""
+        for extension in extensions:
+            try:
+                start = time.perf_counter()
+                await self.load_extension(extension)
+                logger.info(
+                    "%s loaded in %.3fs",
+                    extension,
+                    time.perf_counter() - start,
+                )
+            except Exception:
+                logger.exception("Failed to load extension %s.", extension)
+
+    def _on_sigterm(self) -> None:
+        logger.info("Received SIGTERM")
+        if not self._shutdown_task:
+            self._shutdown_task = asyncio.create_task(self.close())
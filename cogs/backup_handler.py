@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+from typing import final, override
+
+from discord.ext import commands, tasks
+
+from backup import backup_database
+from bot import PanternBot
+from config import DEFAULT_BACKUP_INTERVAL_HOURS
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@final
+class BackupHandler(commands.Cog):
+    """Backs up the database on a schedule without stopping the bot."""
+
+    def __init__(
+        self, bot: PanternBot, backup_dir: str, interval: float, keep: int
+    ) -> None:
+        self.bot = bot
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.backup_loop.change_interval(hours=interval)
+
+    @override
+    async def cog_load(self) -> None:
+        _ = self.backup_loop.start()
+
+    @override
+    async def cog_unload(self) -> None:
+        self.backup_loop.cancel()
+
+    @tasks.loop(hours=DEFAULT_BACKUP_INTERVAL_HOURS)
+    async def backup_loop(self) -> None:
+        # The backup copies a few pages at a time in a worker thread, so
+        # neither the event loop nor the database is held up for long.
+        # Partitioned databases are backed up one file at a time.
+        for db_file in self.bot.db.db_files:
+            try:
+                result = await asyncio.to_thread(
+                    backup_database,
+                    db_file,
+                    self.backup_dir,
+                    self.keep,
+                )
+            except Exception:
+                metrics.backup_failures += 1
+                logger.exception("Database backup of %s failed", db_file)
+                continue
+            metrics.observe_backup(
+                os.path.basename(db_file), result.duration, result.size
+            )
+            logger.info(
+                "Backed up database to %s (%d bytes) in %.2fs",
+                result.path,
+                result.size,
+                result.duration,
+            )
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: PanternBot) -> None:
+    logger.info("cogs.backup_handler begin loading")
+    backup_dir = bot.config.backup_dir
+    if not backup_dir:
+        logger.info("BACKUP_DIR not set, backups disabled")
+        return
+    interval = bot.config.backup_interval_hours
+    keep = bot.config.backup_keep
+    logger.info(
+        "backing up to %s every %s hour(s), keeping %d",
+        backup_dir,
+        interval,
+        keep,
+    )
+    await bot.add_cog(BackupHandler(bot, backup_dir, interval, keep))
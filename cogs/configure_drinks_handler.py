@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 from typing import final, override
 
 import discord
@@ -13,9 +14,12 @@ from discord import (
 )
 from discord.ext import commands
 
-import db_handler
+import storage
 from helpers import CogSetting
-from main import PanternBot
+from bot import PanternBot, check_interaction
+from rest_scheduler import Priority, RestScheduler
+
+logger = logging.getLogger(__name__)
 
 
 class ConfigureDrinksView(ui.LayoutView):
@@ -23,12 +27,14 @@ class ConfigureDrinksView(ui.LayoutView):
         self,
         guild_id: int,
         drink_list: list[str],
-        db: db_handler.DBHandler,
+        db: storage.Storage,
+        rest: RestScheduler,
     ):
         super().__init__(timeout=None)
         self.guild_id: int = guild_id
         self.drink_list: list[str] = drink_list
-        self.db: db_handler.DBHandler = db
+        self.db: storage.Storage = db
+        self.rest: RestScheduler = rest
         self.message: InteractionMessage | PartialMessage | None = None
 
         self.text: ui.TextDisplay[ConfigureDrinksView] = ui.TextDisplay(
@@ -54,6 +60,12 @@ class ConfigureDrinksView(ui.LayoutView):
 
         _ = self.add_item(self.text).add_item(self.row)
 
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        return await check_interaction(interaction, "ConfigureDrinksView")
+
     async def add_drink_button(
         self,
         interaction: discord.Interaction,
@@ -73,59 +85,81 @@ class ConfigureDrinksView(ui.LayoutView):
 
         self.drink_list = await self.db.get_drink_option_list(self.guild_id)
         self.text.content = _get_drink_string(self.drink_list)
-        _ = await self.message.edit(view=self)
+        message = self.message
+        # Edits that pile up while waiting are merged, the one that gets
+        # sent shows the latest list either way.
+        _ = await self.rest.edit(message.id, lambda: message.edit(view=self))
 
     @classmethod
-    async def create(cls, guild_id: int, db: db_handler.DBHandler):
+    async def create(
+        cls, guild_id: int, db: storage.Storage, rest: RestScheduler
+    ):
         drink_list = await db.get_drink_option_list(guild_id)
-        return ConfigureDrinksView(guild_id, drink_list, db)
+        return ConfigureDrinksView(guild_id, drink_list, db, rest)
 
     @classmethod
     async def create_deactivated(
-        cls, message: PartialMessage, guild_id: int, db: db_handler.DBHandler
+        cls,
+        message: PartialMessage,
+        guild_id: int,
+        db: storage.Storage,
+        rest: RestScheduler,
     ):
         drink_list = await db.get_drink_option_list(guild_id)
-        view = ConfigureDrinksView(guild_id, drink_list, db)
+        view = ConfigureDrinksView(guild_id, drink_list, db, rest)
         view.message = message
-        view.remove_button.disabled = True
-        view.add_button.disabled = True
-        view.stop()
+        view.deactivate()
         return view
 
+    def deactivate(self) -> None:
+        """Disables the buttons and stops listening for interactions."""
+        self.remove_button.disabled = True
+        self.add_button.disabled = True
+        self.stop()
 
-class AddDrinkModal(ui.Modal, title="add drink"):
+
+class AddDrinkModal(ui.Modal, title="add drinks"):
     def __init__(self, drinks_view: ConfigureDrinksView):
         super().__init__()
         self.drinks_view: ConfigureDrinksView = drinks_view
 
     name: ui.Label[AddDrinkModal] = ui.Label(
-        text="What drink would you like to add",
-        component=ui.TextInput(placeholder="name"),
+        text="What drinks would you like to add",
+        description="One drink per line.",
+        component=ui.TextInput(
+            placeholder="name", style=discord.TextStyle.paragraph
+        ),
     )
 
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        return await check_interaction(interaction, "AddDrinkModal")
+
     @override
     async def on_submit(self, interaction: discord.Interaction):
         assert isinstance(self.name.component, ui.TextInput)
-        if (
-            self.name.component.value
-            in await self.drinks_view.db.get_drink_option_list(
-                self.drinks_view.guild_id
-            )
-        ):
-            _ = await interaction.response.send_message(
-                f"{self.name.component.value} already exists in the list."
-            )
-        await self.drinks_view.db.add_drink_option(
-            self.drinks_view.guild_id, self.name.component.value
+        names = _parse_drink_names(self.name.component.value)
+        added = await self.drinks_view.db.add_drink_options(
+            self.drinks_view.guild_id, names
         )
+        skipped = [name for name in names if name not in added]
+
+        message: list[str] = []
+        if added:
+            message.append(f"Adding {', '.join(added)} to the list of drinks!")
+        if skipped:
+            message.append(f"{', '.join(skipped)} already exists in the list.")
         _ = await interaction.response.send_message(
-            f"Adding {self.name.component.value} to the list of drinks!",
+            "\n".join(message) or "No drinks given.",
             ephemeral=True,
         )
-        await self.drinks_view.update_drink_list()
+        if added:
+            await self.drinks_view.update_drink_list()
 
 
-class RemoveDrinkModal(ui.Modal, title="remove drink"):
+class RemoveDrinkModal(ui.Modal, title="remove drinks"):
     def __init__(
         self, drinks_view: ConfigureDrinksView, drinks_list: list[str]
     ):
@@ -142,41 +176,60 @@ class RemoveDrinkModal(ui.Modal, title="remove drink"):
                 _get_drink_string(drinks_list)
             )
             self.input_name: ui.Label[RemoveDrinkModal] = ui.Label(
-                text="What drink would you like to remove",
-                component=ui.TextInput(placeholder="name"),
+                text="What drinks would you like to remove",
+                description="One drink per line.",
+                component=ui.TextInput(
+                    placeholder="name", style=discord.TextStyle.paragraph
+                ),
             )
             _ = self.add_item(self.long_list)  # pyright: ignore
             _ = self.add_item(self.input_name)
         else:
             self.select_name: ui.Label[RemoveDrinkModal] = ui.Label(
-                text="What drink would you like to remove",
+                text="What drinks would you like to remove",
                 component=ui.Select(
-                    placeholder="select a drink",
+                    placeholder="select drinks",
                     options=[
                         discord.SelectOption(label=name, value=name)
                         for name in self.drinks_list
                     ],
-                    max_values=1,
+                    max_values=max(len(self.drinks_list), 1),
                 ),
             )
             _ = self.add_item(self.select_name)
 
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        return await check_interaction(interaction, "RemoveDrinkModal")
+
     @override
     async def on_submit(self, interaction: discord.Interaction):
         assert self.drinks_view.message
-        value: str
+        values: list[str]
         if self.large_input:
             assert isinstance(self.input_name.component, ui.TextInput)
-            value = self.input_name.component.value
+            values = [
+                name
+                for name in _parse_drink_names(self.input_name.component.value)
+                if name in self.drinks_list
+            ]
         else:
             assert isinstance(self.select_name.component, ui.Select)
-            value = self.select_name.component.values[0]
+            values = self.select_name.component.values
+
+        if not values:
+            _ = await interaction.response.send_message(
+                "None of those drinks are in the list.", ephemeral=True
+            )
+            return
 
-        await self.drinks_view.db.remove_drink_option(
-            self.drinks_view.guild_id, value
+        await self.drinks_view.db.remove_drink_options(
+            self.drinks_view.guild_id, values
         )
         _ = await interaction.response.send_message(
-            f"Removing {value} from the list of drinks!",
+            f"Removing {', '.join(values)} from the list of drinks!",
             ephemeral=True,
         )
 
@@ -222,9 +275,10 @@ class ConfigureDrinksHandler(commands.Cog):
             for role_id in allowed_roles_raw.split():
                 role = interaction.guild.get_role(int(role_id))
                 if not role:
-                    print(
-                        f"Error role with id {role_id} doesn't exist\
-                        in Guild: {interaction.guild.name}"
+                    logger.error(
+                        "Role with id %s doesn't exist in Guild: %s",
+                        role_id,
+                        interaction.guild.name,
                     )
                 if role in user_roles:
                     return True
@@ -239,10 +293,20 @@ class ConfigureDrinksHandler(commands.Cog):
         assert interaction.guild_id
 
         view: ConfigureDrinksView = await ConfigureDrinksView.create(
-            interaction.guild_id, self.bot.db
+            interaction.guild_id, self.bot.db, self.bot.rest
         )
         _ = await interaction.response.send_message(view=view)
-        view.message = await interaction.original_response()
+        view.message = await self.bot.rest.run(
+            Priority.INTERACTION, interaction.original_response
+        )
+        # Stops the view on the previous config message, if it's still live.
+        old_view = self.bot.view_registry.register(
+            "ConfigureDrinksView",
+            interaction.guild_id,
+            view.message.id,
+            view,
+            replace=True,
+        )
 
         old_config = await self.bot.db.get_setting(
             interaction.guild_id,
@@ -254,15 +318,18 @@ class ConfigureDrinksHandler(commands.Cog):
             channel = interaction.guild.get_channel_or_thread(channel_id)
             if isinstance(channel, abc.Messageable):
                 message = channel.get_partial_message(message_id)
-                # WARN: This doesn't properly remove the existing class afaik,
-                # which in theory could lead to memory leaks. But then again...
-                # It's python.
-                old_view: ConfigureDrinksView = (
-                    await ConfigureDrinksView.create_deactivated(
-                        message, interaction.guild_id, self.bot.db
+                if isinstance(old_view, ConfigureDrinksView):
+                    old_view.deactivate()
+                else:
+                    old_view = await ConfigureDrinksView.create_deactivated(
+                        message,
+                        interaction.guild_id,
+                        self.bot.db,
+                        self.bot.rest,
                     )
+                _ = await self.bot.rest.edit(
+                    message.id, lambda: message.edit(view=old_view)
                 )
-                _ = await message.edit(view=old_view)
 
             await self.bot.db.update_setting(
                 interaction.guild_id,
@@ -279,6 +346,11 @@ class ConfigureDrinksHandler(commands.Cog):
             )
 
 
+def _parse_drink_names(text: str) -> list[str]:
+    """Splits modal input into drink names, one per non-empty line."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
 def _get_drink_string(drink_list: list[str]) -> str:
     message = ["These are the currently available drinks", "```"]
     for drink_name in drink_list:
@@ -291,27 +363,29 @@ def _get_drink_string(drink_list: list[str]) -> str:
 # This setup is required for the cog to setup and run,
 # and is run when the cog is loaded with bot.load_extensions().
 async def setup(bot: PanternBot) -> None:
-    print("\tcogs.configure_drinks_handler begin loading")
-    print("\t\tloading config from database:")
+    logger.info("cogs.configure_drinks_handler begin loading")
+    logger.info("loading config from database:")
     # Holds guild_id and a string id with <channel_id>|<message_id>
-    settings = await bot.db.get_settings(
+    config_count = 0
+    async for guild_id, config_message in bot.db.iterate_settings(
         CogSetting.CONFIGURE_DRINKS_HANDLER, "config_message"
-    )
-    if settings:
-        for guild_id in settings:
-            guild = bot.get_guild(guild_id)
-            print(f"\t\t\t loaded config for guild: {guild}, id: {guild_id}")
-            view = await ConfigureDrinksView.create(guild_id, bot.db)
-            if guild:
-                channel_id, message_id = map(
-                    int, settings[guild_id].split("|")
-                )
-                channel = guild.get_channel_or_thread(channel_id)
-                if isinstance(channel, abc.Messageable):
-                    view.message = channel.get_partial_message(message_id)
+    ):
+        guild = bot.get_guild(guild_id)
+        logger.debug("loaded config for guild: %s, id: %s", guild, guild_id)
+        view = await ConfigureDrinksView.create(guild_id, bot.db, bot.rest)
+        channel_id, message_id = map(int, config_message.split("|"))
+        if guild:
+            channel = guild.get_channel_or_thread(channel_id)
+            if isinstance(channel, abc.Messageable):
+                view.message = channel.get_partial_message(message_id)
 
-            bot.add_view(view)
+        _ = bot.view_registry.register(
+            "ConfigureDrinksView", guild_id, message_id, view, replace=True
+        )
+        config_count += 1
+    if not config_count:
+        logger.info("no config entries in database!")
     else:
-        print("\t\t\t no config entries in database!")
+        logger.info("loaded config for %d guild(s)", config_count)
 
     await bot.add_cog(ConfigureDrinksHandler(bot))
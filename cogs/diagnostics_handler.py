@@ -0,0 +1,269 @@
+import io
+import logging
+import time
+from typing import Literal, final, override
+
+import discord
+from discord import Permissions, app_commands
+from discord.ext import commands
+
+from bot import PanternBot
+from memory import (
+    AllocationTracer,
+    format_bytes,
+    format_usage,
+    memory_usage,
+)
+from profiler import profile_loop
+from rest_scheduler import Priority
+
+logger = logging.getLogger(__name__)
+
+
+@final
+class DiagnosticsHandler(commands.Cog):
+    """Commands for admins to look into how the bot is performing."""
+
+    def __init__(self, bot: PanternBot) -> None:
+        self.bot = bot
+        self.profiling: bool = False
+        self.tracer: AllocationTracer = AllocationTracer()
+
+    @override
+    async def cog_unload(self) -> None:
+        if self.tracer.tracing:
+            self.tracer.stop()
+
+    @app_commands.command()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    @app_commands.describe(stacks="Attach the stacks that blocked the loop.")
+    async def loop_lag(
+        self, interaction: discord.Interaction, stacks: bool = False
+    ) -> None:
+        """
+        Shows how far behind the event loop has been running.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            stacks (bool): Attach the captured blocking stacks as a file.
+        """
+        monitor = self.bot.loop_monitor
+        content = f"```\n{monitor.summary()}\n```"
+        if not stacks or not monitor.blocked_stacks:
+            _ = await interaction.response.send_message(
+                content, ephemeral=True
+            )
+            return
+
+        report: list[str] = []
+        for blocked in monitor.blocked_stacks:
+            captured_at = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(blocked.captured_at)
+            )
+            report.append(
+                f"{captured_at}, blocked for over {blocked.blocked_for:.3f}s:"
+            )
+            report.append(blocked.stack)
+        _ = await interaction.response.send_message(
+            content,
+            file=discord.File(
+                io.BytesIO("\n".join(report).encode()),
+                filename="blocking_stacks.txt",
+            ),
+            ephemeral=True,
+        )
+
+    @app_commands.command()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    @app_commands.describe(seconds="How long to profile for.")
+    async def profile(
+        self,
+        interaction: discord.Interaction,
+        seconds: app_commands.Range[int, 1, 300] = 30,
+    ) -> None:
+        """
+        Profiles the bot for a while and uploads the results. Owner only.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            seconds (int): How long to profile for.
+        """
+        if not await self.bot.is_owner(interaction.user):
+            _ = await interaction.response.send_message(
+                "Only the bot owner can do this.", ephemeral=True
+            )
+            return
+        if self.profiling:
+            _ = await interaction.response.send_message(
+                "Already profiling, wait for that to finish.", ephemeral=True
+            )
+            return
+
+        _ = await interaction.response.defer(ephemeral=True, thinking=True)
+        self.profiling = True
+        try:
+            stats, collapsed = await profile_loop(seconds)
+        finally:
+            self.profiling = False
+        _ = await interaction.followup.send(
+            f"Profiled for {seconds}s. Open the collapsed stacks with a "
+            + "flame graph tool like speedscope or flamegraph.pl.",
+            files=[
+                discord.File(
+                    io.BytesIO(stats.encode()), filename="profile_stats.txt"
+                ),
+                discord.File(
+                    io.BytesIO(collapsed.encode()),
+                    filename="profile_stacks.collapsed",
+                ),
+            ],
+            ephemeral=True,
+        )
+
+    @app_commands.command()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    async def memory(self, interaction: discord.Interaction) -> None:
+        """
+        Shows what the bot holds in memory, by subsystem.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+        """
+        _ = await interaction.response.send_message(
+            f"```\n{format_usage(memory_usage(self.bot))}\n```",
+            ephemeral=True,
+        )
+
+    @app_commands.command()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    @app_commands.describe(
+        action="Start tracing, diff against the start or stop tracing."
+    )
+    async def memory_trace(
+        self,
+        interaction: discord.Interaction,
+        action: Literal["start", "diff", "stop"],
+    ) -> None:
+        """
+        Traces allocations to find what is growing. Owner only.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            action (str): What to do with the trace.
+        """
+        if not await self.bot.is_owner(interaction.user):
+            _ = await interaction.response.send_message(
+                "Only the bot owner can do this.", ephemeral=True
+            )
+            return
+
+        if action == "start":
+            _ = await interaction.response.defer(ephemeral=True, thinking=True)
+            await self.tracer.start()
+            _ = await interaction.followup.send(
+                "Tracing allocations, the baseline is now. Tracing slows the "
+                + "bot down, stop it when done.",
+                ephemeral=True,
+            )
+            return
+
+        if not self.tracer.tracing:
+            _ = await interaction.response.send_message(
+                "Not tracing, start it first.", ephemeral=True
+            )
+            return
+
+        if action == "stop":
+            self.tracer.stop()
+            _ = await interaction.response.send_message(
+                "Stopped tracing allocations.", ephemeral=True
+            )
+            return
+
+        _ = await interaction.response.defer(ephemeral=True, thinking=True)
+        growth, report = await self.tracer.diff()
+        _ = await interaction.followup.send(
+            f"{format_bytes(growth)} more allocated than at the baseline. "
+            + "The sites that grew the most are attached.",
+            file=discord.File(
+                io.BytesIO(report.encode()), filename="memory_diff.txt"
+            ),
+            ephemeral=True,
+        )
+
+    @app_commands.command()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    @app_commands.describe(
+        extension="The extension to reload.",
+        sync="Sync commands with Discord after, if they changed.",
+    )
+    async def reload(
+        self,
+        interaction: discord.Interaction,
+        extension: str,
+        sync: bool = False,
+    ) -> None:
+        """
+        Reloads an extension without restarting the bot. Owner only.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            extension (str): The extension to reload.
+            sync (bool): Sync commands with Discord after reloading.
+        """
+        if not await self.bot.is_owner(interaction.user):
+            _ = await interaction.response.send_message(
+                "Only the bot owner can do this.", ephemeral=True
+            )
+            return
+        if extension not in self.bot.extensions:
+            _ = await interaction.response.send_message(
+                f"{extension} isn't loaded.", ephemeral=True
+            )
+            return
+
+        _ = await interaction.response.defer(ephemeral=True, thinking=True)
+        start = time.perf_counter()
+        try:
+            await self.bot.reload_extension(extension)
+        except commands.ExtensionError as e:
+            logger.exception("Failed to reload %s", extension)
+            _ = await interaction.followup.send(
+                f"Failed to reload {extension}, still running the old code: "
+                + str(e),
+                ephemeral=True,
+            )
+            return
+        reloaded = (
+            f"Reloaded {extension} in {time.perf_counter() - start:.2f}s, "
+            + f"{len(self.bot.view_registry)} live view(s)."
+        )
+        logger.info(reloaded)
+        if sync:
+            synced = await self.bot.rest.run(
+                Priority.NORMAL, self.bot.tree.sync
+            )
+            reloaded += f" Synced {len(synced)} command(s)."
+        _ = await interaction.followup.send(reloaded, ephemeral=True)
+
+    @reload.autocomplete("extension")
+    async def reload_autocomplete(
+        self, _interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        return [
+            app_commands.Choice(name=name, value=name)
+            for name in sorted(self.bot.extensions)
+            if current in name
+        ]
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: PanternBot) -> None:
+    await bot.add_cog(DiagnosticsHandler(bot))
@@ -1,3 +1,6 @@
+import asyncio
+import logging
+import time
 import typing
 from typing import final, override
 
@@ -5,25 +8,37 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-import db_handler
-from main import PanternBot
+import storage
+from bot import PanternBot, check_interaction
+from deadline_scheduler import DeadlineScheduler
+from rest_scheduler import Priority, RestScheduler
+
+logger = logging.getLogger(__name__)
+
+# Discord doesn't allow more options than this in a select menu.
+MAX_SELECT_OPTIONS = 25
+# Longest a tally can be set to stay open for, in minutes (a week).
+MAX_TALLY_MINUTES = 7 * 24 * 60
+# Drinks on each page of /mydrinks.
+HISTORY_PAGE_SIZE = 15
+# Most drinks listed in the totals of /mydrinks.
+MAX_HISTORY_TOTALS = 10
 
 
 class ChooseDrinkView(discord.ui.View):
-    # TODO: Make a custom timeout value.
     def __init__(
         self,
         message_id: int,
         guild_id: int,
         drink_list: list[str],
-        db: db_handler.DBHandler,
+        db: storage.Storage,
     ) -> None:
         # Having this field is kind of ugly now that we keep the message_id,
         # but I can't be arsed to fix it rn.
-        self.message: discord.Message | None = None
+        self.message: discord.Message | discord.PartialMessage | None = None
         self.message_id: int = message_id
-        self.db: db_handler.DBHandler = db
-        self._count: int = 0
+        self.guild_id: int = guild_id
+        self.db: storage.Storage = db
         super().__init__(timeout=None)
         selector: ChooseDrinkSelector = ChooseDrinkSelector(
             message_id, guild_id, drink_list, db
@@ -33,34 +48,41 @@ class ChooseDrinkView(discord.ui.View):
 
     @classmethod
     async def create(
-        cls, message_id: int, guild_id: int, db: db_handler.DBHandler
+        cls, message_id: int, guild_id: int, db: storage.Storage
     ):
         drink_list = await db.get_drink_option_list(guild_id)
         return ChooseDrinkView(message_id, guild_id, drink_list, db)
 
-    async def increment_count(self) -> None:
-        """
-        Increments the amount of drinks had in this poll.
-        """
-        self._count += 1
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        return await check_interaction(interaction, "ChooseDrinkView")
 
-    async def decrement_count(self) -> None:
+    async def close(self, total: int, rest: RestScheduler) -> None:
         """
-        Decrement the amount of drinks had in this poll.
-        """
-        self._count -= 1
+        Disables the menu and shows how many drinks were had. Removing the
+        tally from the database is left to the caller, so it can be done
+        for many tallies at once.
 
-    async def remove(self) -> None:
+        Args:
+            total (int): How many drinks were logged on the tally.
+            rest (RestScheduler): Sends the edit of the tally message.
+        """
         self.selector.disabled = True
-        # TODO: remove debug statement
-        print(self.id + " timed out")
-        if self.message:
-            _ = await self.message.edit(
-                content="Drinks have been drunk!\n-# Total drinks: "
-                + str(self._count),
-                view=self,
+        # Stopping takes the view out of the view store.
+        self.stop()
+        logger.debug("%s closed", self.id)
+        message = self.message
+        if message:
+            _ = await rest.edit(
+                message.id,
+                lambda: message.edit(
+                    content="Drinks have been drunk!\n-# Total drinks: "
+                    + str(total),
+                    view=self,
+                ),
             )
-        await self.db.remove_tally(self.message_id)
 
 
 class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
@@ -69,9 +91,9 @@ class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
         message_id: int,
         guild_id: int,
         drink_list: list[str],
-        db: db_handler.DBHandler,
+        db: storage.Storage,
     ) -> None:
-        self.db: db_handler.DBHandler = db
+        self.db: storage.Storage = db
         options = [
             discord.SelectOption(
                 label="nothing",
@@ -80,7 +102,9 @@ class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
             )
         ]
 
-        for drink in drink_list:
+        # Guilds with more drinks than fit in the menu can log the rest with
+        # /drank instead.
+        for drink in drink_list[: MAX_SELECT_OPTIONS - 1]:
             options.append(discord.SelectOption(label=drink, value=drink))
         super().__init__(
             placeholder="Please select your drink",
@@ -91,7 +115,7 @@ class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
     @override
     async def callback(self, interaction: discord.Interaction) -> None:
         if not interaction.guild_id:
-            print("Guild does not exist")
+            logger.error("Guild does not exist")
             _ = await interaction.response.send_message(
                 "ERROR, failed to find guild, please contact an admin"
             )
@@ -101,8 +125,8 @@ class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
                 ReferenceError("This should actually be impossible to reach")
             )
         if not self.view.message:
-            print(
-                "Message does not exist in guild " + str(interaction.guild_id)
+            logger.error(
+                "Message does not exist in guild %s", interaction.guild_id
             )
             _ = await interaction.response.send_message(
                 "ERROR, failed to find message, please contact an admin"
@@ -113,16 +137,22 @@ class ChooseDrinkSelector(discord.ui.Select[ChooseDrinkView]):
             await self.db.remove_drunk_drink(
                 interaction.guild_id, self.view.message.id, interaction.user.id
             )
-            await self.view.decrement_count()
         else:
-            edited = await self.db.set_drunk_drink(
-                interaction.guild_id,
-                self.view.message.id,
-                interaction.user.id,
-                self.values[0],
-            )
-            if edited:
-                await self.view.increment_count()
+            try:
+                _ = await self.db.set_drunk_drink(
+                    interaction.guild_id,
+                    self.view.message.id,
+                    interaction.user.id,
+                    self.values[0],
+                )
+            except ValueError:
+                # The menu isn't updated when drinks are removed, so it can
+                # still offer them.
+                _ = await interaction.response.send_message(
+                    f"{self.values[0]} is no longer on the list of drinks.",
+                    ephemeral=True,
+                )
+                return
         _ = await interaction.response.send_message(
             f"You have selected {self.values[0]}!",
             ephemeral=True,
@@ -164,6 +194,82 @@ class ShowFurtherTallyView(discord.ui.View):
         )
 
 
+@final
+class DrinkHistoryView(discord.ui.View):
+    """
+    Pages through the drinks a user has logged, newest first. Every page is
+    read from where the previous one ended, and the start of each page seen
+    is kept so going back doesn't need counting either.
+    """
+
+    def __init__(
+        self,
+        db: storage.Storage,
+        guild_id: int,
+        user_id: int,
+        totals: dict[str, int],
+    ) -> None:
+        super().__init__()
+        self.db = db
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.totals = totals
+        # The cursor of every page up to the one shown, None for the first.
+        self.page_starts: list[int | None] = [None]
+        self.next_page: int | None = None
+
+    @override
+    async def interaction_check(
+        self, interaction: discord.Interaction
+    ) -> bool:
+        return await check_interaction(interaction, "DrinkHistoryView")
+
+    async def show_page(self) -> str:
+        """Loads the last page in page_starts and renders it."""
+        history, self.next_page = await self.db.get_drink_history(
+            self.guild_id,
+            self.user_id,
+            HISTORY_PAGE_SIZE,
+            self.page_starts[-1],
+        )
+        self.newer.disabled = len(self.page_starts) == 1
+        self.older.disabled = self.next_page is None
+
+        content = [
+            f"You have logged {sum(self.totals.values())} drink(s) here.",
+            "```",
+        ]
+        for drink, count in list(self.totals.items())[:MAX_HISTORY_TOTALS]:
+            content.append(f"{drink}: {count}")
+        content.append("```")
+        content.append(f"Page {len(self.page_starts)}, newest first:")
+        for drink, created_at in history:
+            content.append(
+                f"- {drink} <t:{created_at}:f>" if created_at else f"- {drink}"
+            )
+        return "\n".join(content)
+
+    @discord.ui.button(label="Newer", style=discord.ButtonStyle.gray)
+    async def newer(
+        self,
+        interaction: discord.Interaction,
+        _button: discord.ui.Button[typing.Self],
+    ):
+        _ = self.page_starts.pop()
+        content = await self.show_page()
+        _ = await interaction.response.edit_message(content=content, view=self)
+
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.gray)
+    async def older(
+        self,
+        interaction: discord.Interaction,
+        _button: discord.ui.Button[typing.Self],
+    ):
+        self.page_starts.append(self.next_page)
+        content = await self.show_page()
+        _ = await interaction.response.edit_message(content=content, view=self)
+
+
 @final
 class DrinkHandler(commands.Cog):
     def __init__(self, bot: PanternBot) -> None:
@@ -173,22 +279,76 @@ class DrinkHandler(commands.Cog):
             callback=self.tally_drinks_callback,
         )
         self.bot.tree.add_command(self.ctx_tally_drinks)
+        # One task closes every tally with a duration when it runs out.
+        self.tally_closer = DeadlineScheduler(self.close_tallies)
+
+    @override
+    async def cog_load(self) -> None:
+        self.tally_closer.start()
 
     @override
     async def cog_unload(self) -> None:
+        self.tally_closer.stop()
         _ = self.bot.tree.remove_command(
             self.ctx_tally_drinks.name, type=self.ctx_tally_drinks.type
         )
 
+    async def close_tallies(self, message_ids: list[int]) -> None:
+        """
+        Closes a batch of tallies: disables their menus, shows the totals
+        and removes them from the database. The votes are counted and the
+        tallies removed with one query each for the whole batch.
+
+        Args:
+            message_ids (list[int]): The message ids of the tallies.
+        """
+        views = [
+            view
+            for message_id in message_ids
+            if isinstance(
+                view := self.bot.view_registry.get(message_id),
+                ChooseDrinkView,
+            )
+        ]
+        totals = await self.bot.db.count_votes(
+            [(view.guild_id, view.message_id) for view in views]
+        )
+        results = await asyncio.gather(
+            *(
+                view.close(totals.get(view.message_id, 0), self.bot.rest)
+                for view in views
+            ),
+            return_exceptions=True,
+        )
+        for view, result in zip(views, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Failed to edit closed tally %s: %s",
+                    view.message_id,
+                    result,
+                )
+        for message_id in message_ids:
+            _ = self.bot.view_registry.evict(message_id)
+        await self.bot.db.remove_tallies(message_ids)
+        logger.info("Closed %d tally(s)", len(message_ids))
+
     @app_commands.command()
     @app_commands.guild_only()
-    async def drink(self, interaction: discord.Interaction) -> None:
+    @app_commands.describe(
+        minutes="Close the tally after this many minutes, stays open if unset."
+    )
+    async def drink(
+        self,
+        interaction: discord.Interaction,
+        minutes: app_commands.Range[int, 1, MAX_TALLY_MINUTES] | None = None,
+    ) -> None:
         """
         Sends a tally for users to select what drink they had at an event.
 
         Args:
             interaction (discord.Interaction): The interaction object passed
                                                from calling this.
+            minutes (int | None): How long the tally stays open for.
         """
         if not interaction.guild_id:
             # If we reach this and don't have a guild id despite this
@@ -198,16 +358,93 @@ class DrinkHandler(commands.Cog):
         if not (isinstance(interaction.channel, discord.abc.Messageable)):
             # Channel is not writeable, this is not good
             raise (ValueError("channel doesn't exist, failing"))
-        _ = await interaction.response.send_message("Pick a drink:")
-        message = await interaction.original_response()
+        closes_at = int(time.time()) + minutes * 60 if minutes else None
+        _ = await interaction.response.send_message(
+            f"Pick a drink! Closes <t:{closes_at}:R>."
+            if closes_at
+            else "Pick a drink:"
+        )
+        message = await self.bot.rest.run(
+            Priority.INTERACTION, interaction.original_response
+        )
         view = await ChooseDrinkView.create(
             message.id, interaction.guild_id, self.bot.db
         )
-        updated_message = await message.edit(view=view)
+        updated_message = await self.bot.rest.run(
+            Priority.INTERACTION, lambda: message.edit(view=view)
+        )
         view.message = updated_message
+        _ = self.bot.view_registry.register(
+            "ChooseDrinkView", interaction.guild_id, updated_message.id, view
+        )
         await self.bot.db.create_tally(
-            updated_message.id, interaction.guild_id
+            updated_message.id,
+            interaction.guild_id,
+            interaction.channel_id,
+            closes_at,
         )
+        if closes_at:
+            self.tally_closer.schedule(updated_message.id, closes_at)
+
+    @app_commands.command()
+    @app_commands.guild_only()
+    @app_commands.describe(drink="What you drank.")
+    async def drank(
+        self, interaction: discord.Interaction, drink: str
+    ) -> None:
+        """
+        Logs a drink on the latest tally in this server.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            drink (str): The name of the drink.
+        """
+        if not interaction.guild_id:
+            raise ValueError("Cannot find guild id")
+
+        drink_names = self.bot.db.drink_names.get(interaction.guild_id)
+        if not drink_names or drink not in drink_names:
+            _ = await interaction.response.send_message(
+                f"{drink} is not on the list of drinks.", ephemeral=True
+            )
+            return
+        message_id = await self.bot.db.get_latest_tally(interaction.guild_id)
+        if not message_id:
+            _ = await interaction.response.send_message(
+                "There is no tally to log drinks on.", ephemeral=True
+            )
+            return
+
+        try:
+            _ = await self.bot.db.set_drunk_drink(
+                interaction.guild_id, message_id, interaction.user.id, drink
+            )
+        except ValueError:
+            # Removed since the check above.
+            _ = await interaction.response.send_message(
+                f"{drink} is no longer on the list of drinks.", ephemeral=True
+            )
+            return
+        _ = await interaction.response.send_message(
+            f"You have selected {drink}!", ephemeral=True
+        )
+
+    @drank.autocomplete("drink")
+    async def drank_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        if not interaction.guild_id:
+            return []
+        drink_names = self.bot.db.drink_names.get(interaction.guild_id)
+        if not drink_names:
+            return []
+        return [
+            app_commands.Choice(name=name, value=name)
+            for name in drink_names.starting_with(
+                current, MAX_SELECT_OPTIONS
+            )
+        ]
 
     @app_commands.guild_only()
     async def tally_drinks_callback(
@@ -245,19 +482,112 @@ class DrinkHandler(commands.Cog):
             "\n".join(content), view=ShowFurtherTallyView(drink_tally)
         )
 
+    @app_commands.command()
+    @app_commands.guild_only()
+    @app_commands.describe(days="How many days back to include.")
+    async def drinkstats(
+        self,
+        interaction: discord.Interaction,
+        days: app_commands.Range[int, 1, 36500] = 30,
+    ) -> None:
+        """
+        Shows what has been drunk in this server over the last few days.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+            days (int): How many days back to include.
+        """
+        if not interaction.guild_id:
+            raise ValueError("Cannot find guild id")
+
+        now = int(time.time())
+        # Hourly buckets give an exact window for short spans, daily ones
+        # keep long spans cheap.
+        drink_stats = await self.bot.db.get_drink_stats(
+            interaction.guild_id,
+            now - days * 24 * 60 * 60,
+            now,
+            hourly=days <= 2,
+        )
+
+        drink_count = sum(drink_stats.values())
+        if drink_count == 0:
+            _ = await interaction.response.send_message(
+                f"Nobody logged anything in the last {days} day(s).",
+                ephemeral=True,
+            )
+            return
+
+        content = [
+            f"Total drinks drunk in the last {days} day(s): {drink_count}",
+            "```",
+        ]
+        for drink, count in drink_stats.items():
+            content.append(f"{drink}: {count}")
+        content.append("```")
+        _ = await interaction.response.send_message(
+            "\n".join(content), ephemeral=True
+        )
+
+    @app_commands.command()
+    @app_commands.guild_only()
+    async def mydrinks(self, interaction: discord.Interaction) -> None:
+        """
+        Shows what you have drunk in this server, newest first.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+        """
+        if not interaction.guild_id:
+            raise ValueError("Cannot find guild id")
+
+        totals = await self.bot.db.get_user_drink_stats(
+            interaction.guild_id, interaction.user.id
+        )
+        if not totals:
+            _ = await interaction.response.send_message(
+                "You haven't logged any drinks here yet.", ephemeral=True
+            )
+            return
+
+        view = DrinkHistoryView(
+            self.bot.db, interaction.guild_id, interaction.user.id, totals
+        )
+        _ = await interaction.response.send_message(
+            await view.show_page(), view=view, ephemeral=True
+        )
+
 
 # ----------------------MAIN PROGRAM----------------------
 # This setup is required for the cog to setup and run,
 # and is run when the cog is loaded with bot.load_extensions().
 async def setup(bot: PanternBot) -> None:
-    print("\tcogs.drinks_handler begin loading")
-    print("\t\tloading tallies from database:")
-    tallies = await bot.db.get_all_tallies()
-    for message_id, guild_id in tallies:
-        print(f"\t\t\tloading tally in message: {message_id}")
-        bot.add_view(
-            await ChooseDrinkView.create(message_id, guild_id, bot.db)
+    logger.info("cogs.drinks_handler begin loading")
+    logger.info("loading tallies from database:")
+    tally_count = 0
+    async for message_id, guild_id, channel_id in bot.db.iterate_all_tallies():
+        logger.debug("loading tally in message: %s", message_id)
+        view = await ChooseDrinkView.create(message_id, guild_id, bot.db)
+        if channel_id:
+            # Lets the tally message be edited when it closes.
+            view.message = bot.get_partial_messageable(
+                channel_id, guild_id=guild_id
+            ).get_partial_message(message_id)
+        _ = bot.view_registry.register(
+            "ChooseDrinkView", guild_id, message_id, view
         )
-    if not tallies:
-        print("\t\t\tNo tallies in db!")
-    await bot.add_cog(DrinkHandler(bot))
+        tally_count += 1
+    if not tally_count:
+        logger.info("No tallies in db!")
+    else:
+        logger.info("loaded %d tallies", tally_count)
+
+    handler = DrinkHandler(bot)
+    # Overdue tallies are closed as soon as the cog has loaded.
+    deadlines = await bot.db.get_tally_deadlines()
+    for message_id, closes_at in deadlines:
+        handler.tally_closer.schedule(message_id, closes_at)
+    logger.info("scheduled %d tally deadline(s)", len(deadlines))
+    await bot.add_cog(handler)
@@ -0,0 +1,77 @@
+import logging
+from typing import final
+
+import discord
+from discord import Permissions, app_commands
+from discord.ext import commands
+
+from bot import PanternBot
+from role_sync import JsonRoleSource, RoleSyncer, SyncReport
+
+logger = logging.getLogger(__name__)
+
+
+@final
+class RoleSyncHandler(commands.Cog):
+    def __init__(self, bot: PanternBot, syncer: RoleSyncer | None) -> None:
+        self.bot = bot
+        self.syncer = syncer
+
+    @app_commands.command()
+    @app_commands.guild_only()
+    @app_commands.default_permissions(Permissions(administrator=True))
+    async def sync_roles(self, interaction: discord.Interaction) -> None:
+        """
+        Syncs everyone's roles in this server with the external role source.
+
+        Args:
+            interaction (discord.Interaction): The interaction object passed
+                                               from calling this.
+        """
+        if not interaction.guild:
+            raise ValueError("Cannot find guild")
+        if not self.syncer:
+            _ = await interaction.response.send_message(
+                "No role source is configured, set ROLE_SYNC_FILE.",
+                ephemeral=True,
+            )
+            return
+
+        _ = await interaction.response.send_message(
+            "Starting role sync...", ephemeral=True
+        )
+
+        async def progress(report: SyncReport) -> None:
+            text = str(report)
+            _ = await self.bot.rest.edit(
+                interaction.id,
+                lambda: interaction.edit_original_response(content=text),
+            )
+
+        report = await self.syncer.sync_guild(
+            interaction.guild,
+            await self.bot.db.get_config_messages(),
+            progress,
+        )
+        logger.info("%s: %s", interaction.guild.name, report)
+        # Through the same edit queue as the progress updates, so it
+        # replaces one that is still waiting instead of racing it.
+        _ = await self.bot.rest.edit(
+            interaction.id,
+            lambda: interaction.edit_original_response(content=str(report)),
+        )
+
+
+# ----------------------MAIN PROGRAM----------------------
+# This setup is required for the cog to setup and run,
+# and is run when the cog is loaded with bot.load_extensions().
+async def setup(bot: PanternBot) -> None:
+    logger.info("cogs.role_sync_handler begin loading")
+    role_sync_file = bot.config.role_sync_file
+    if role_sync_file:
+        logger.info("reading roles from: %s", role_sync_file)
+        syncer = RoleSyncer(JsonRoleSource(role_sync_file), rest=bot.rest)
+    else:
+        logger.info("no role source configured, syncing disabled")
+        syncer = None
+    await bot.add_cog(RoleSyncHandler(bot, syncer))
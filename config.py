@@ -0,0 +1,75 @@
+from os import environ
+from typing import final
+
+from dotenv import load_dotenv
+
+from db_handler import DEFAULT_SQLITE_PROFILE
+
+# Defaults for the optional settings.
+DEFAULT_BACKUP_INTERVAL_HOURS = 6.0
+DEFAULT_BACKUP_KEEP = 7
+DEFAULT_METRICS_HOST = "0.0.0.0"
+
+
+@final
+class Config:
+    """All settings for the bot, read from the environment."""
+
+    def __init__(
+        self,
+        token: str,
+        db_file: str,
+        role_sync_file: str | None = None,
+        backup_dir: str | None = None,
+        backup_interval_hours: float = DEFAULT_BACKUP_INTERVAL_HOURS,
+        backup_keep: int = DEFAULT_BACKUP_KEEP,
+        metrics_port: int | None = None,
+        metrics_host: str = DEFAULT_METRICS_HOST,
+        traffic_record_file: str | None = None,
+        sqlite_profile: str = DEFAULT_SQLITE_PROFILE,
+        db_partitions: int = 0,
+    ) -> None:
+        self.token = token
+        self.db_file = db_file
+        self.role_sync_file = role_sync_file
+        self.backup_dir = backup_dir
+        self.backup_interval_hours = backup_interval_hours
+        self.backup_keep = backup_keep
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.traffic_record_file = traffic_record_file
+        self.sqlite_profile = sqlite_profile
+        self.db_partitions = db_partitions
+
+    @classmethod
+    def from_environ(cls) -> "Config":
+        """
+        Reads the config from the environment, after loading any .env file.
+
+        Throws:
+            KeyError: If TOKEN or DB_FILE isn't set.
+        """
+        _ = load_dotenv()
+        return cls(
+            token=environ["TOKEN"],
+            db_file=environ["DB_FILE"],
+            role_sync_file=environ.get("ROLE_SYNC_FILE") or None,
+            backup_dir=environ.get("BACKUP_DIR") or None,
+            backup_interval_hours=float(
+                environ.get(
+                    "BACKUP_INTERVAL_HOURS", DEFAULT_BACKUP_INTERVAL_HOURS
+                )
+            ),
+            backup_keep=int(environ.get("BACKUP_KEEP", DEFAULT_BACKUP_KEEP)),
+            metrics_port=(
+                int(environ["METRICS_PORT"])
+                if environ.get("METRICS_PORT")
+                else None
+            ),
+            metrics_host=environ.get("METRICS_HOST", DEFAULT_METRICS_HOST),
+            traffic_record_file=environ.get("TRAFFIC_RECORD_FILE") or None,
+            sqlite_profile=environ.get(
+                "SQLITE_PROFILE", DEFAULT_SQLITE_PROFILE
+            ),
+            db_partitions=int(environ.get("DB_PARTITIONS") or 0),
+        )
@@ -1,19 +1,247 @@
 import asyncio
-from sqlite3 import Error
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from sqlite3 import Error, Row
 from typing import final
 
 import asqlite
 
-from helpers import CogSetting, RoleMapping
+from helpers import (
+    CogSetting,
+    DrinkNameIndex,
+    RoleMapping,
+    RoleMappingIndex,
+)
+from metrics import metrics
+
+# Drink rollup tables and the size of their time buckets in seconds.
+DRINK_STATS_TABLES = {
+    "drink_stats_hourly": 60 * 60,
+    "drink_stats_daily": 60 * 60 * 24,
+}
+
+# Rollup table of how many of each drink every user has had.
+USER_DRINK_STATS_TABLE = "drink_stats_user"
+# Tables that triggers on drunk_drinks keep up to date.
+ROLLUP_TABLES = (*DRINK_STATS_TABLES, USER_DRINK_STATS_TABLE)
+
+logger = logging.getLogger(__name__)
+
+# Tables that only hold data for a single guild, in the order they can be
+# filled in. Votes come after the drinks they reference, and the rollups
+# last since adding votes fills them in.
+GUILD_TABLES = (
+    "drink_options",
+    "drunk_drinks",
+    "tallies",
+    "settings",
+    *ROLLUP_TABLES,
+)
+
+# Votes point at the drink they are for, and go away with it.
+DRUNK_DRINKS_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    "id" INTEGER PRIMARY KEY NOT NULL,
+    "guild_id" INTEGER NOT NULL,
+    "message_id" INTEGER NOT NULL,
+    "user_id" INTEGER NOT NULL,
+    "drink_id" INTEGER NOT NULL
+        REFERENCES drink_options (id) ON DELETE CASCADE,
+    "created_at" INTEGER,
+    "updated_at" INTEGER,
+    UNIQUE(guild_id, message_id, user_id)
+);
+"""
+
+# How many connections DBHandler.connect keeps open.
+CONNECTION_POOL_SIZE = 4
+
+# How many rows the iterating read queries fetch from the database at a time.
+READ_CHUNK_SIZE = 500
+
+
+def _row_to_dict(row: Row) -> dict[str, str | int]:
+    """Convert a result row into a dict of {field_name: value}."""
+    return {key: row[key] for key in row.keys()}
+
+
+@final
+class SqliteProfile:
+    """
+    SQLite settings traded off between durability and speed. asqlite puts
+    every connection in WAL mode, which the pool relies on to read while
+    writing, so every profile keeps it.
+    """
+
+    def __init__(
+        self,
+        synchronous: str,
+        cache_size_kib: int,
+        mmap_size: int,
+        temp_store: str,
+        page_size: int,
+        journal_mode: str = "WAL",
+    ) -> None:
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.temp_store = temp_store
+        # Only takes effect when the database file is created.
+        self.page_size = page_size
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """Set the profile on a connection."""
+        _ = conn.execute(f"PRAGMA journal_mode = {self.journal_mode};")
+        _ = conn.execute(f"PRAGMA synchronous = {self.synchronous};")
+        # Negative sizes are in KiB rather than pages.
+        _ = conn.execute(f"PRAGMA cache_size = -{self.cache_size_kib};")
+        _ = conn.execute(f"PRAGMA mmap_size = {self.mmap_size};")
+        _ = conn.execute(f"PRAGMA temp_store = {self.temp_store};")
+        # Off by default in SQLite, votes rely on it to go away with their
+        # drink.
+        _ = conn.execute("PRAGMA foreign_keys = ON;")
+
+
+SQLITE_PROFILES = {
+    # SQLite's own defaults, every commit is synced to disk.
+    "durable": SqliteProfile(
+        synchronous="FULL",
+        cache_size_kib=2 * 1024,
+        mmap_size=0,
+        temp_store="DEFAULT",
+        page_size=4096,
+    ),
+    # Commits are synced at checkpoints only, which in WAL mode can lose
+    # the last commits on power loss but never corrupts the database.
+    "balanced": SqliteProfile(
+        synchronous="NORMAL",
+        cache_size_kib=16 * 1024,
+        mmap_size=64 * 1024 * 1024,
+        temp_store="MEMORY",
+        page_size=4096,
+    ),
+    # Never syncs, leaving it to the OS. A power loss or OS crash can
+    # corrupt the database, so only use this with regular backups.
+    "throughput": SqliteProfile(
+        synchronous="OFF",
+        cache_size_kib=64 * 1024,
+        mmap_size=256 * 1024 * 1024,
+        temp_store="MEMORY",
+        page_size=8192,
+    ),
+}
+DEFAULT_SQLITE_PROFILE = "balanced"
 
 
 @final
 class DBHandler:
-    def __init__(self, db_file: str) -> None:
+    def __init__(
+        self, db_file: str, profile: str = DEFAULT_SQLITE_PROFILE
+    ) -> None:
+        """
+        Args:
+            db_file (str): Path to the database file.
+            profile (str): Name of the SQLITE_PROFILES entry to use.
+
+        Throws:
+            ValueError: If there is no profile with that name.
+        """
+        if profile not in SQLITE_PROFILES:
+            raise ValueError(
+                f"Unknown SQLite profile {profile}, "
+                + f"expected one of {', '.join(SQLITE_PROFILES)}"
+            )
         self.db_file = db_file
+        self.profile_name = profile
+        self.profile: SqliteProfile = SQLITE_PROFILES[profile]
+        # Filled by load_role_mappings and kept in sync by the role config
+        # methods, so lookups never have to go to the database.
+        self.role_mappings: RoleMappingIndex = RoleMappingIndex()
+        self._role_mappings_loaded: bool = False
+        # Drink names per guild for autocomplete. Filled by
+        # load_drink_names and kept in sync by the drink option methods.
+        self.drink_names: dict[int, DrinkNameIndex] = {}
+        self._pool: asqlite.Pool | None = None
+        self._pending_writes: int = 0
+        self._writes_done: asyncio.Event = asyncio.Event()
+        self._writes_done.set()
+
+    @property
+    def db_files(self) -> list[str]:
+        """Every database file, for backups."""
+        return [self.db_file]
+
+    async def connect(self) -> None:
+        """Open a pool of connections that is reused by every query until
+        close is called. Without it every query opens its own connection."""
+        if not self._pool:
+            logger.info("using SQLite profile %s", self.profile_name)
+            self._pool = await asqlite.create_pool(
+                self.db_file,
+                size=CONNECTION_POOL_SIZE,
+                init=self.profile.apply,
+            )
+
+    async def flush(self) -> None:
+        """Wait until every write that has been started is finished."""
+        _ = await self._writes_done.wait()
+
+    async def close(self) -> None:
+        """Finish pending writes, checkpoint the WAL into the database file
+        and close the connection pool."""
+        await self.flush()
+        checkpoint = await self._execute_read_query(
+            "PRAGMA wal_checkpoint(TRUNCATE);"
+        )
+        if checkpoint and checkpoint["busy"]:
+            logger.warning("WAL checkpoint was blocked, WAL not truncated")
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[asqlite.Connection]:
+        """Get a connection from the pool, or a new one if there's no pool."""
+        if self._pool:
+            async with self._pool.acquire() as conn:
+                yield conn
+        else:
+            async with asqlite.connect(
+                self.db_file, init=self.profile.apply
+            ) as conn:
+                yield conn
+
+    @contextmanager
+    def _timed_query(self, kind: str) -> Iterator[None]:
+        """Record how long a query takes in the metrics."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.observe_query(kind, time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def _tracked_write(self) -> AsyncIterator[None]:
+        """Keep count of running writes so flush can wait for them."""
+        self._pending_writes += 1
+        self._writes_done.clear()
+        try:
+            yield
+        finally:
+            self._pending_writes -= 1
+            if not self._pending_writes:
+                self._writes_done.set()
 
     async def create_tables(self) -> None:
         """Initialize database if it doesn't exist"""
+        if not os.path.exists(self.db_file):
+            await asyncio.to_thread(self._create_database_file)
+
         create_drinks_table = """
         CREATE TABLE IF NOT EXISTS drink_options (
             "id" INTEGER PRIMARY KEY NOT NULL,
@@ -22,31 +250,52 @@ class DBHandler:
             UNIQUE(guild_id, name)
         );
         """
-        await self._execute_query(create_drinks_table)
-        print("created drinks table")
+        _ = await self._execute_query(create_drinks_table)
+        logger.info("created drinks table")
 
-        create_drunk_table = """
-        CREATE TABLE IF NOT EXISTS drunk_drinks (
-            "id" INTEGER PRIMARY KEY NOT NULL,
-            "guild_id" INTEGER NOT NULL,
-            "message_id" INTEGER NOT NULL,
-            "user_id" INTEGER NOT NULL,
-            "name" TEXT NOT NULL,
-            UNIQUE(guild_id, message_id, user_id)
-        );
-        """
-        await self._execute_query(create_drunk_table)
-        print("created drunk_table")
+        _ = await self._execute_query(
+            DRUNK_DRINKS_TABLE.format(table="drunk_drinks")
+        )
+        await self._add_column_if_missing(
+            "drunk_drinks", "created_at", "INTEGER"
+        )
+        await self._add_column_if_missing(
+            "drunk_drinks", "updated_at", "INTEGER"
+        )
+        await self._migrate_drunk_drinks_to_drink_ids()
+        _ = await self._execute_query(
+            """
+            CREATE INDEX IF NOT EXISTS drunk_drinks_drink_id
+            ON drunk_drinks (drink_id);
+            """
+        )
+        # Covers paging through a user's votes newest first, so a page is
+        # one range of the index no matter how many votes come before it.
+        _ = await self._execute_query(
+            """
+            CREATE INDEX IF NOT EXISTS drunk_drinks_user
+            ON drunk_drinks (guild_id, user_id, id, drink_id, created_at);
+            """
+        )
+        logger.info("created drunk_table")
 
         create_tallies_table = """
         CREATE TABLE IF NOT EXISTS tallies (
             "id" INTEGER PRIMARY KEY NOT NULL,
             "guild_id" INTEGER NOT NULL,
-            "message_id" INTEGER UNIQUE  NOT NULL
+            "message_id" INTEGER UNIQUE  NOT NULL,
+            "created_at" INTEGER,
+            "updated_at" INTEGER,
+            "channel_id" INTEGER,
+            "closes_at" INTEGER
         );
         """
-        await self._execute_query(create_tallies_table)
-        print("created tallies table")
+        _ = await self._execute_query(create_tallies_table)
+        await self._add_column_if_missing("tallies", "created_at", "INTEGER")
+        await self._add_column_if_missing("tallies", "updated_at", "INTEGER")
+        await self._add_column_if_missing("tallies", "channel_id", "INTEGER")
+        await self._add_column_if_missing("tallies", "closes_at", "INTEGER")
+        logger.info("created tallies table")
 
         create_role_config_table = """
         CREATE TABLE IF NOT EXISTS role_configs (
@@ -56,8 +305,8 @@ class DBHandler:
             "discord_role_id" INTEGER NOT NULL
         );
         """
-        await self._execute_query(create_role_config_table)
-        print("created role config table")
+        _ = await self._execute_query(create_role_config_table)
+        logger.info("created role config table")
 
         create_settings_table = """
         CREATE TABLE IF NOT EXISTS settings (
@@ -69,25 +318,340 @@ class DBHandler:
             UNIQUE(guild_id, cog, config_name)
         );
         """
-        await self._execute_query(create_settings_table)
-        print("created settings table")
+        _ = await self._execute_query(create_settings_table)
+        logger.info("created settings table")
+
+        await self._create_drink_stats_tables()
+        await self._create_user_drink_stats_table()
+        logger.info("created drink stats tables")
+
+    def _create_database_file(self) -> None:
+        """Create an empty database file with the profile's page size. The
+        page size has to be set before the database switches to WAL mode,
+        which asqlite does on every connection."""
+        conn = sqlite3.connect(self.db_file)
+        try:
+            _ = conn.execute(f"PRAGMA page_size = {self.profile.page_size};")
+            _ = conn.execute("PRAGMA journal_mode = WAL;")
+        finally:
+            conn.close()
+
+    async def _add_column_if_missing(
+        self, table: str, column: str, declaration: str
+    ) -> None:
+        """Add a column to an existing table if it isn't already there. Used
+        to migrate databases created before the column existed.
+
+        Args:
+            table (str): The table to migrate.
+            column (str): The name of the column.
+            declaration (str): The SQL type declaration of the column.
+        """
+        columns = await self._execute_multiple_read_query(
+            f"PRAGMA table_info({table});"
+        )
+        if columns and column in [str(entry["name"]) for entry in columns]:
+            return
+        _ = await self._execute_query(
+            f'ALTER TABLE {table} ADD COLUMN "{column}" {declaration};'
+        )
+
+    async def _migrate_drunk_drinks_to_drink_ids(self) -> None:
+        """Rebuild a drunk_drinks table from before votes referenced
+        drink_options by id, which stored the drink name on every vote.
+        SQLite can't change a column in place, so the votes are copied into
+        a new table that then replaces the old one, all in one transaction.
+
+        Votes for drinks that have since been removed from drink_options
+        are dropped, the same as votes are now when their drink is removed.
+        The rollup tables are left as they are.
+        """
+        columns = await self._execute_multiple_read_query(
+            "PRAGMA table_info(drunk_drinks);"
+        )
+        if not columns or "name" not in [
+            str(entry["name"]) for entry in columns
+        ]:
+            return
+
+        logger.info("migrating drunk_drinks to drink ids")
+        async with self._tracked_write(), self._connection() as conn:
+            async with conn.transaction():
+                _ = await conn.execute(
+                    DRUNK_DRINKS_TABLE.format(table="drunk_drinks_migrated")
+                )
+                _ = await conn.execute(
+                    """
+                    INSERT INTO drunk_drinks_migrated (
+                        id, guild_id, message_id, user_id, drink_id,
+                        created_at, updated_at
+                    )
+                    SELECT
+                        drunk.id, drunk.guild_id, drunk.message_id,
+                        drunk.user_id, drink.id, drunk.created_at,
+                        drunk.updated_at
+                    FROM drunk_drinks AS drunk
+                    JOIN drink_options AS drink
+                        ON drink.guild_id = drunk.guild_id
+                        AND drink.name = drunk.name;
+                    """
+                )
+                orphaned = await conn.fetchone(
+                    """
+                    SELECT
+                        (SELECT COUNT(*) FROM drunk_drinks)
+                        - (SELECT COUNT(*) FROM drunk_drinks_migrated)
+                        AS count;
+                    """
+                )
+                # Also drops the old triggers, they are created again for
+                # the new table by _create_drink_stats_tables.
+                _ = await conn.execute("DROP TABLE drunk_drinks;")
+                _ = await conn.execute(
+                    "ALTER TABLE drunk_drinks_migrated RENAME TO drunk_drinks;"
+                )
+        if orphaned and orphaned["count"]:
+            logger.warning(
+                "dropped %d vote(s) for drinks that no longer exist",
+                orphaned["count"],
+            )
+
+    async def _create_drink_stats_tables(self) -> None:
+        """Create the hourly and daily drink rollup tables along with the
+        triggers that keep them up to date whenever drunk_drinks changes.
+
+        Votes without a created_at timestamp (from before timestamps were
+        added) are left out of the rollups since we don't know when they
+        happened.
+
+        The rollups are keyed by drink name rather than id so the history
+        of a drink outlives it. Removing a drink deletes its votes after the
+        drink itself, so the name lookup comes up empty and the counts are
+        left alone.
+        """
+        for table, bucket_size in DRINK_STATS_TABLES.items():
+            create_rollup_table = f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                "guild_id" INTEGER NOT NULL,
+                "bucket_start" INTEGER NOT NULL,
+                "name" TEXT NOT NULL,
+                "count" INTEGER NOT NULL,
+                PRIMARY KEY(guild_id, bucket_start, name)
+            ) WITHOUT ROWID;
+            """
+            _ = await self._execute_query(create_rollup_table)
+
+            # The triggers below all bump a (guild, bucket, drink) counter,
+            # the bucket being the start of the hour/day the vote was cast.
+            increment = f"""
+                INSERT INTO {table} (guild_id, bucket_start, name, count)
+                SELECT
+                    NEW.guild_id,
+                    NEW.created_at - NEW.created_at % {bucket_size},
+                    name,
+                    1
+                FROM drink_options
+                WHERE id = NEW.drink_id
+                ON CONFLICT(guild_id, bucket_start, name)
+                DO UPDATE SET count = count + 1;
+            """
+            decrement = f"""
+                UPDATE {table}
+                SET count = count - 1
+                WHERE guild_id = OLD.guild_id
+                AND
+                    bucket_start =
+                        OLD.created_at - OLD.created_at % {bucket_size}
+                AND
+                    name = (
+                        SELECT name FROM drink_options WHERE id = OLD.drink_id
+                    );
+            """
+            insert_trigger = f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_on_insert
+            AFTER INSERT ON drunk_drinks
+            WHEN NEW.created_at IS NOT NULL
+            BEGIN
+                {increment}
+            END;
+            """
+            update_trigger = f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_on_update
+            AFTER UPDATE OF drink_id ON drunk_drinks
+            WHEN OLD.created_at IS NOT NULL AND OLD.drink_id != NEW.drink_id
+            BEGIN
+                {decrement}
+                {increment}
+            END;
+            """
+            delete_trigger = f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_on_delete
+            AFTER DELETE ON drunk_drinks
+            WHEN OLD.created_at IS NOT NULL
+            BEGIN
+                {decrement}
+            END;
+            """
+            _ = await self._execute_query(insert_trigger)
+            _ = await self._execute_query(update_trigger)
+            _ = await self._execute_query(delete_trigger)
+
+        # Touch the tally whenever someone votes on it.
+        for event, row in (
+            ("INSERT", "NEW"),
+            ("UPDATE", "NEW"),
+            ("DELETE", "OLD"),
+        ):
+            touch_tally_trigger = f"""
+            CREATE TRIGGER IF NOT EXISTS tallies_touch_on_vote_{event.lower()}
+            AFTER {event} ON drunk_drinks
+            BEGIN
+                UPDATE tallies
+                SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE message_id = {row}.message_id;
+            END;
+            """
+            _ = await self._execute_query(touch_tally_trigger)
+
+    async def _create_user_drink_stats_table(self) -> None:
+        """Create the rollup of how many of each drink every user has had,
+        along with the triggers that keep it up to date. Like the other
+        rollups it is keyed by drink name, so removed drinks stay in it.
+
+        Votes from before the table existed are counted in when it is
+        created, in the same transaction as the triggers so none are
+        counted twice.
+        """
+        table = USER_DRINK_STATS_TABLE
+        increment = f"""
+            INSERT INTO {table} (guild_id, user_id, name, count)
+            SELECT NEW.guild_id, NEW.user_id, name, 1
+            FROM drink_options
+            WHERE id = NEW.drink_id
+            ON CONFLICT(guild_id, user_id, name)
+            DO UPDATE SET count = count + 1;
+        """
+        decrement = f"""
+            UPDATE {table}
+            SET count = count - 1
+            WHERE guild_id = OLD.guild_id
+            AND
+                user_id = OLD.user_id
+            AND
+                name = (
+                    SELECT name FROM drink_options WHERE id = OLD.drink_id
+                );
+        """
+        async with self._tracked_write(), self._connection() as conn:
+            async with conn.transaction():
+                exists = await conn.fetchone(
+                    "SELECT 1 FROM sqlite_master WHERE name = ?;", (table,)
+                )
+                if not exists:
+                    _ = await conn.execute(
+                        f"""
+                        CREATE TABLE {table} (
+                            "guild_id" INTEGER NOT NULL,
+                            "user_id" INTEGER NOT NULL,
+                            "name" TEXT NOT NULL,
+                            "count" INTEGER NOT NULL,
+                            PRIMARY KEY(guild_id, user_id, name)
+                        ) WITHOUT ROWID;
+                        """
+                    )
+                    _ = await conn.execute(
+                        f"""
+                        INSERT INTO {table} (guild_id, user_id, name, count)
+                        SELECT
+                            drunk.guild_id, drunk.user_id, drink.name,
+                            COUNT(*)
+                        FROM drunk_drinks AS drunk
+                        JOIN drink_options AS drink
+                            ON drink.id = drunk.drink_id
+                        GROUP BY drunk.guild_id, drunk.user_id, drink.name;
+                        """
+                    )
+                # Created whether or not the table was, migrating
+                # drunk_drinks drops its triggers.
+                _ = await conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_on_insert
+                    AFTER INSERT ON drunk_drinks
+                    BEGIN
+                        {increment}
+                    END;
+                    """
+                )
+                _ = await conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_on_update
+                    AFTER UPDATE OF drink_id ON drunk_drinks
+                    WHEN OLD.drink_id != NEW.drink_id
+                    BEGIN
+                        {decrement}
+                        {increment}
+                    END;
+                    """
+                )
+                _ = await conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_on_delete
+                    AFTER DELETE ON drunk_drinks
+                    BEGIN
+                        {decrement}
+                    END;
+                    """
+                )
 
     async def _execute_query(
-        self, query: str, vars: tuple[str | int, ...] = ()
-    ) -> None:
+        self, query: str, vars: tuple[str | int | None, ...] = ()
+    ) -> bool:
         """Execute a query in the database.
 
         Args:
             query (str): The SQL query string.
             vars (tuple): The query string fill in vars.
+
+        Returns:
+            bool: If the query succeeded.
         """
-        async with asqlite.connect(self.db_file) as conn:
-            async with conn.cursor() as cursor:
+        with self._timed_query("write"):
+            async with self._tracked_write(), self._connection() as conn:
+                async with conn.cursor() as cursor:
+                    try:
+                        _ = await cursor.execute(query, vars)
+                        await conn.commit()
+                        return True
+                    except Error as e:
+                        metrics.db_errors += 1
+                        logger.error("the error %s occured", e)
+                        return False
+
+    async def _execute_many_query(
+        self, query: str, vars_list: list[tuple[str | int, ...]]
+    ) -> bool:
+        """Execute a query once for every set of vars in a single
+        transaction. Either every query goes through or none of them do.
+
+        Args:
+            query (str): The SQL query string.
+            vars_list (list[tuple]): The query string fill in vars, one tuple
+                                     per query.
+
+        Returns:
+            bool: If the queries succeeded.
+        """
+        with self._timed_query("write_many"):
+            async with self._tracked_write(), self._connection() as conn:
                 try:
-                    _ = await cursor.execute(query, vars)
-                    await conn.commit()
+                    async with conn.transaction():
+                        async with conn.cursor() as cursor:
+                            _ = await cursor.executemany(query, vars_list)
+                    return True
                 except Error as e:
-                    print(f"the error {e} occured")
+                    metrics.db_errors += 1
+                    logger.error("the error %s occured", e)
+                    return False
 
     async def _execute_read_query(
         self, query: str, vars: tuple[str | int, ...] = ()
@@ -103,19 +667,18 @@ class DBHandler:
             dict: Key value pairs with data from the query results.
                   form: {field_name: value}
         """
-        async with asqlite.connect(self.db_file) as conn:
-            async with conn.cursor() as cursor:
-                try:
-                    _ = await cursor.execute(query, vars)
-                    result = await cursor.fetchone()
-                    if not result:
-                        return None
-                    pairs = {}
-                    for key in result.keys():
-                        pairs[key] = result.__getitem__(key)
-                    return pairs
-                except Error as e:
-                    print(f"The error '{e}' occurred")
+        with self._timed_query("read"):
+            async with self._connection() as conn:
+                async with conn.cursor() as cursor:
+                    try:
+                        _ = await cursor.execute(query, vars)
+                        result = await cursor.fetchone()
+                        if not result:
+                            return None
+                        return _row_to_dict(result)
+                    except Error as e:
+                        metrics.db_errors += 1
+                        logger.error("The error '%s' occurred", e)
 
     async def _execute_multiple_read_query(
         self, query: str, vars: tuple[str | int, ...] = ()
@@ -130,22 +693,91 @@ class DBHandler:
         Returns:
             list[dict]: list of key value pairs with data from the query
                         results. form: [{field_name: value}]"""
-        async with asqlite.connect(self.db_file) as conn:
+        with self._timed_query("read_many"):
+            async with self._connection() as conn:
+                async with conn.cursor() as cursor:
+                    try:
+                        _ = await cursor.execute(query, vars)
+                        result = await cursor.fetchall()
+                        if not result:
+                            return None
+                        return [_row_to_dict(entry) for entry in result]
+                    except Error as e:
+                        metrics.db_errors += 1
+                        logger.error("The error '%s' occurred", e)
+
+    async def _iterate_read_query(
+        self,
+        query: str,
+        vars: tuple[str | int, ...] = (),
+        chunk_size: int = READ_CHUNK_SIZE,
+    ) -> AsyncIterator[dict[str, str | int]]:
+        """Execute a query in the database and yield the found entries one at
+        a time as dictionaries. Rows are fetched chunk_size at a time, so only
+        one chunk is ever held in memory, and the event loop gets to run
+        between chunks.
+
+        Args:
+            query (str): The SQL query string.
+            vars (tuple): The query string fill in vars.
+            chunk_size (int): How many rows to fetch from the database at a
+                              time.
+
+        Yields:
+            dict: Key value pairs with data from one result row.
+                  form: {field_name: value}
+        """
+        async with self._connection() as conn:
             async with conn.cursor() as cursor:
                 try:
                     _ = await cursor.execute(query, vars)
-                    result = await cursor.fetchall()
-                    if not result:
-                        return None
-                    output = []
-                    for entry in result:
-                        pairs = {}
-                        for key in entry.keys():
-                            pairs[key] = entry.__getitem__(key)
-                        output.append(pairs)
-                    return output
+                    while rows := await cursor.fetchmany(chunk_size):
+                        for row in rows:
+                            yield _row_to_dict(row)
                 except Error as e:
-                    print(f"The error '{e}' occurred")
+                    metrics.db_errors += 1
+                    logger.error("The error '%s' occurred", e)
+
+    async def _iterate_keyset_query(
+        self,
+        query: str,
+        vars: tuple[str | int, ...] = (),
+        key: str = "id",
+        after: int = 0,
+        page_size: int = READ_CHUNK_SIZE,
+    ) -> AsyncIterator[dict[str, str | int]]:
+        """Walk through a query page by page using keyset pagination, yielding
+        entries one at a time as dictionaries. Each page is its own short
+        query, so no read transaction is held open between pages, and each
+        page is found through the index on key instead of an OFFSET scan.
+
+        The query must select the key column, end its WHERE clause with
+        `<key> > ?`, order by the key and end with `LIMIT ?`. The last key
+        seen and the page size are appended to vars.
+
+        Args:
+            query (str): The SQL query string.
+            vars (tuple): The query string fill in vars, excluding the key
+                          and limit.
+            key (str): The column to paginate on.
+            after (int): Only yield entries with a key larger than this.
+            page_size (int): How many entries to fetch per page.
+
+        Yields:
+            dict: Key value pairs with data from one result row.
+                  form: {field_name: value}
+        """
+        while True:
+            page = await self._execute_multiple_read_query(
+                query, (*vars, after, page_size)
+            )
+            if not page:
+                return
+            for entry in page:
+                yield entry
+            if len(page) < page_size:
+                return
+            after = int(page[-1][key])
 
     # ------------------------------------------------------
 
@@ -158,13 +790,14 @@ class DBHandler:
             guild_id(int): The id of the guild to search for.
 
         Returns:
-            list[str]: A list of drink names.
+            list[str]: A list of drink names, sorted by name.
 
         """
 
         drink_query = """
             SELECT * FROM drink_options
-            WHERE guild_id = ?;
+            WHERE guild_id = ?
+            ORDER BY name;
         """
 
         drinks = await self._execute_multiple_read_query(
@@ -216,13 +849,16 @@ class DBHandler:
                 VALUES
                     (?, ?);
             """
-            await self._execute_query(
+            if await self._execute_query(
                 drink_create_query,
                 (
                     guild_id,
                     drink_name,
                 ),
-            )
+            ):
+                self.drink_names.setdefault(
+                    guild_id, DrinkNameIndex()
+                ).add(drink_name)
 
     async def remove_drink_option(
         self, guild_id: int, drink_name: str
@@ -240,13 +876,94 @@ class DBHandler:
             AND
                 name = ?;
         """
-        await self._execute_query(
+        if await self._execute_query(
             drink_remove_query,
             (
                 guild_id,
                 drink_name,
             ),
-        )
+        ) and (drink_names := self.drink_names.get(guild_id)):
+            drink_names.remove(drink_name)
+
+    async def add_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> list[str]:
+        """
+        Adds several drink options to the list of valid ones for the given
+        guild in one go. Names that already exist are skipped.
+
+        Args:
+            guild_id (int): The id of the guild.
+            drink_names (list[str]): The names of the drinks to add.
+
+        Returns:
+            list[str]: The names that were actually added.
+        """
+        existing = set(await self.get_drink_option_list(guild_id))
+        new_names = [
+            name
+            for name in dict.fromkeys(drink_names)
+            if name not in existing
+        ]
+        if not new_names:
+            return []
+
+        drink_create_query = """
+            INSERT OR IGNORE INTO
+                drink_options (guild_id, name)
+            VALUES
+                (?, ?);
+        """
+        if not await self._execute_many_query(
+            drink_create_query, [(guild_id, name) for name in new_names]
+        ):
+            return []
+        drink_index = self.drink_names.setdefault(guild_id, DrinkNameIndex())
+        for name in new_names:
+            drink_index.add(name)
+        return new_names
+
+    async def remove_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> None:
+        """
+        Removes several drink options from the list of valid ones for the
+        given guild in one go.
+
+        Args:
+            guild_id (int): The id of the guild.
+            drink_names (list[str]): The names of the drinks to remove.
+        """
+        drink_remove_query = """
+            DELETE FROM drink_options
+            WHERE guild_id = ?
+            AND
+                name = ?;
+        """
+        if await self._execute_many_query(
+            drink_remove_query, [(guild_id, name) for name in drink_names]
+        ) and (drink_index := self.drink_names.get(guild_id)):
+            for name in drink_names:
+                drink_index.remove(name)
+
+    async def load_drink_names(self) -> None:
+        """
+        Loads the drink options of every guild into the in memory drink name
+        indexes. Only needs to be run once at startup, after that the indexes
+        are kept up to date by add_drink_option and remove_drink_option.
+        """
+        get_drinks_query = """
+            SELECT id, guild_id, name
+            FROM drink_options
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?;
+        """
+        self.drink_names.clear()
+        async for drink in self._iterate_keyset_query(get_drinks_query):
+            self.drink_names.setdefault(
+                int(drink["guild_id"]), DrinkNameIndex()
+            ).add(str(drink["name"]))
 
     async def set_drunk_drink(
         self, guild_id: int, message_id: int, user_id: int, drink_name: str
@@ -264,39 +981,42 @@ class DBHandler:
 
         Returns:
             bool: If a new entry was added.
-        """
-        # TODO: We might want to check that only valid drinks can be entered
-        # into the system. This is not a user facing function, so it should be
-        # fine, but you never know...
 
+        Throws:
+            ValueError: If there is no drink with that name in the guild,
+                        like when it was removed after the tally was sent.
+                        "nothing" is never a drink.
+        """
         if drink_name == "nothing":
-            print(
-                "Error: Tried adding empty drink to database for message: "
-                + str(message_id)
-            )
-            return False
+            raise ValueError("nothing is not a drink")
+        # Looks up the drink and the user's current vote in one go.
         current_drink_query = """
-            SELECT * FROM drunk_drinks
+            SELECT drink.id AS drink_id, drunk.drink_id AS current_drink_id
+            FROM drink_options AS drink
+            LEFT JOIN drunk_drinks AS drunk
+                ON drunk.guild_id = drink.guild_id
+                AND drunk.message_id = ?
+                AND drunk.user_id = ?
             WHERE
-                guild_id = ?
+                drink.guild_id = ?
             AND
-                message_id = ?
-            AND
-                user_id = ?
+                drink.name = ?
         """
         current_drink = await self._execute_read_query(
-            current_drink_query, (guild_id, message_id, user_id)
+            current_drink_query, (message_id, user_id, guild_id, drink_name)
         )
+        if not current_drink:
+            raise ValueError(f"{drink_name} is not a drink in the guild")
 
-        if current_drink:
-            if current_drink["name"] == drink_name:
+        if current_drink["current_drink_id"] is not None:
+            if current_drink["current_drink_id"] == current_drink["drink_id"]:
                 return False
             else:
                 new_entry = False
                 # Replace current drink
                 drink_add_query = """
                     UPDATE drunk_drinks
-                    SET name = ?
+                    SET drink_id = ?, updated_at = ?
                     WHERE
                         guild_id = ?
                     AND
@@ -306,17 +1026,22 @@ class DBHandler:
                 """
         else:
             new_entry = True
+            # ?2 is reused so created_at and updated_at start out equal.
             drink_add_query = """
                 INSERT INTO
-                    drunk_drinks (name, guild_id, message_id, user_id)
+                    drunk_drinks (
+                        drink_id, updated_at, guild_id, message_id, user_id,
+                        created_at
+                    )
                 VALUES
-                    (?, ?, ?, ?)
+                    (?1, ?2, ?3, ?4, ?5, ?2)
             """
 
-        await self._execute_query(
+        _ = await self._execute_query(
             drink_add_query,
             (
-                drink_name,
+                current_drink["drink_id"],
+                int(time.time()),
                 guild_id,
                 message_id,
                 user_id,
@@ -344,7 +1069,7 @@ class DBHandler:
             AND
                 user_id = ?;
         """
-        await self._execute_query(
+        _ = await self._execute_query(
             drink_remove_query,
             (
                 guild_id,
@@ -367,10 +1092,13 @@ class DBHandler:
             dict[str, list[int]]: A dict mapping the name of drinks to all
             users who selected that drink
         """
+        # Grouped on the drink id, the names are only joined in at the end.
         get_drinks_query = """
-            SELECT user_id, name
-            FROM drunk_drinks
-            WHERE message_id = ?;
+            SELECT drunk.user_id, drink.name
+            FROM drunk_drinks AS drunk
+            JOIN drink_options AS drink ON drink.id = drunk.drink_id
+            WHERE drunk.message_id = ?
+            ORDER BY drunk.drink_id;
         """
         drunk_list = await self._execute_multiple_read_query(
             get_drinks_query, (message_id,)
@@ -387,48 +1115,193 @@ class DBHandler:
 
         return res
 
-    async def get_all_tallies(self) -> list[tuple[int, int]]:
+    async def get_all_tallies(self) -> list[tuple[int, int, int | None]]:
         """
         Returns a list of all tallies in the database.
 
         Returns:
-            list[tuple[int, int]]: Contains (message_id, guild_id).
+            list[tuple[int, int, int | None]]: Contains (message_id,
+            guild_id, channel_id). The channel is None for tallies created
+            before it was stored.
+        """
+        return [tally async for tally in self.iterate_all_tallies()]
+
+    async def iterate_all_tallies(
+        self,
+    ) -> AsyncIterator[tuple[int, int, int | None]]:
+        """
+        Iterates over all tallies in the database without loading them all
+        into memory at once.
+
+        Yields:
+            tuple[int, int, int | None]: Contains (message_id, guild_id,
+            channel_id). The channel is None for tallies created before it
+            was stored.
+        """
+        get_tally_query = """
+            SELECT id, message_id, guild_id, channel_id
+            FROM tallies
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?;
+        """
+        async for tally in self._iterate_keyset_query(get_tally_query):
+            if not isinstance(tally["message_id"], int) or not isinstance(
+                tally["guild_id"], int
+            ):
+                logger.warning(
+                    "unexpected values in tallies table, "
+                    + "attempting to continue without it"
+                )
+                continue
+            channel_id = tally["channel_id"]
+            yield (
+                tally["message_id"],
+                tally["guild_id"],
+                channel_id if isinstance(channel_id, int) else None,
+            )
+
+    async def get_latest_tally(self, guild_id: int) -> int | None:
+        """
+        Gets the most recently created tally in a guild.
+
+        Args:
+            guild_id (int): The guild to search in.
+
+        Returns:
+            int | None: The message id of the tally, if there is one.
         """
         get_tally_query = """
-            SELECT message_id, guild_id
-            FROM tallies;
+            SELECT message_id
+            FROM tallies
+            WHERE guild_id = ?
+            ORDER BY id DESC
+            LIMIT 1;
+        """
+        tally = await self._execute_read_query(get_tally_query, (guild_id,))
+        if not tally:
+            return None
+        return int(tally["message_id"])
+
+    async def count_tallies(self) -> int:
+        """
+        Counts the open tallies in every guild.
+
+        Returns:
+            int: The amount of tallies.
         """
-        tallies = await self._execute_multiple_read_query(
-            get_tally_query,
+        count = await self._execute_read_query(
+            "SELECT COUNT(*) AS count FROM tallies;"
         )
-        res: list[tuple[int, int]] = []
-        if tallies:
-            for tally in tallies:
-                if not isinstance(tally["message_id"], int) or not isinstance(
-                    tally["guild_id"], int
-                ):
-                    print(
-                        "unexpected values in tallies table, "
-                        + "attempting to continue without it"
-                    )
-                    continue
-                res.append((tally["message_id"], tally["guild_id"]))
-        return res
+        return int(count["count"]) if count else 0
+
+    async def has_guild_data(self) -> bool:
+        """
+        Checks if any guild has data in the database.
 
-    async def create_tally(self, message_id: int, guild_id: int):
+        Returns:
+            bool: If any of the GUILD_TABLES has rows.
+        """
+        found = await self._execute_read_query(
+            "SELECT "
+            + " OR ".join(
+                f"EXISTS (SELECT 1 FROM {table})" for table in GUILD_TABLES
+            )
+            + " AS found;"
+        )
+        return bool(found and found["found"])
+
+    async def ping(self) -> bool:
+        """
+        Checks that the database can be queried.
+
+        Returns:
+            bool: If the database answered.
+        """
+        return await self._execute_read_query("SELECT 1 AS ok;") is not None
+
+    async def create_tally(
+        self,
+        message_id: int,
+        guild_id: int,
+        channel_id: int | None = None,
+        closes_at: int | None = None,
+    ):
         """
         Creates a tally in the database
 
         Args:
             message_id (int): The message id of the tally.
             guild_id (int): The guild id of the tally.
+            channel_id (int | None): The channel the tally message is in.
+            closes_at (int | None): Unix timestamp of when the tally closes
+                                    on its own, if it does.
         """
         create_tally_query = """
-            INSERT INTO tallies
-                (message_id, guild_id)
-            VALUES (?, ?);
+            INSERT INTO tallies (
+                message_id, guild_id, created_at, updated_at, channel_id,
+                closes_at
+            )
+            VALUES (?1, ?2, ?3, ?3, ?4, ?5);
+        """
+        _ = await self._execute_query(
+            create_tally_query,
+            (message_id, guild_id, int(time.time()), channel_id, closes_at),
+        )
+
+    async def get_tally_deadlines(self) -> list[tuple[int, int]]:
+        """
+        Gets every tally that closes on its own.
+
+        Returns:
+            list[tuple[int, int]]: Contains (message_id, closes_at).
+        """
+        deadlines = await self._execute_multiple_read_query(
+            """
+            SELECT message_id, closes_at
+            FROM tallies
+            WHERE closes_at IS NOT NULL;
+            """
+        )
+        if not deadlines:
+            return []
+        return [
+            (int(deadline["message_id"]), int(deadline["closes_at"]))
+            for deadline in deadlines
+        ]
+
+    async def count_votes(
+        self, tallies: list[tuple[int, int]]
+    ) -> dict[int, int]:
         """
-        await self._execute_query(create_tally_query, (message_id, guild_id))
+        Counts the votes on several tallies in one query.
+
+        Args:
+            tallies (list[tuple[int, int]]): Contains (guild_id, message_id).
+
+        Returns:
+            dict[int, int]: Maps message ids to how many votes the tally
+            got. Tallies without votes are left out.
+        """
+        if not tallies:
+            return {}
+        conditions = " OR ".join(
+            ["(guild_id = ? AND message_id = ?)"] * len(tallies)
+        )
+        counts = await self._execute_multiple_read_query(
+            f"""
+            SELECT message_id, COUNT(*) AS count
+            FROM drunk_drinks
+            WHERE {conditions}
+            GROUP BY message_id;
+            """,
+            tuple(id for tally in tallies for id in tally),
+        )
+        if not counts:
+            return {}
+        return {
+            int(count["message_id"]): int(count["count"]) for count in counts
+        }
 
     async def remove_tally(self, message_id: int):
         """
@@ -437,13 +1310,164 @@ class DBHandler:
         Args:
             message_id (int): The message_id for the tally.
         """
+        await self.remove_tallies([message_id])
+
+    async def remove_tallies(self, message_ids: list[int]) -> None:
+        """
+        Removes several tallies from the database in one transaction.
+
+        Args:
+            message_ids (list[int]): The message ids of the tallies.
+        """
         remove_tally_query = """
             DELETE FROM tallies
+            WHERE message_id = ?;
+        """
+        _ = await self._execute_many_query(
+            remove_tally_query, [(message_id,) for message_id in message_ids]
+        )
+
+    async def get_drink_stats(
+        self, guild_id: int, start: int, end: int, hourly: bool = False
+    ) -> dict[str, int]:
+        """
+        Gets how many of each drink was drunk in a guild during a time span.
+        This reads from the rollup tables so it stays fast no matter how many
+        votes have been cast over the years.
+
+        Args:
+            guild_id (int): The guild to get stats for.
+            start (int): Unix timestamp of the start of the span (inclusive).
+            end (int): Unix timestamp of the end of the span (exclusive).
+            hourly (bool): Use hourly buckets instead of daily ones. Gives
+                           a more exact span for short time periods.
+
+        Returns:
+            dict[str, int]: A dict mapping drink names to how many were drunk,
+            sorted with the most drunk drink first.
+        """
+        table = "drink_stats_hourly" if hourly else "drink_stats_daily"
+        bucket_size = DRINK_STATS_TABLES[table]
+        get_stats_query = f"""
+            SELECT name, SUM(count) AS total
+            FROM {table}
             WHERE guild_id = ?
             AND
-                message_id = ?
+                bucket_start >= ?
+            AND
+                bucket_start < ?
+            GROUP BY name
+            HAVING total > 0
+            ORDER BY total DESC;
+        """
+        stats = await self._execute_multiple_read_query(
+            get_stats_query,
+            (guild_id, start - start % bucket_size, end),
+        )
+        res: dict[str, int] = {}
+        if stats:
+            for stat in stats:
+                res[str(stat["name"])] = int(stat["total"])
+        return res
+
+    async def get_user_drink_stats(
+        self, guild_id: int, user_id: int
+    ) -> dict[str, int]:
+        """
+        Gets how many of each drink a user has had in a guild, from a rollup
+        so it doesn't matter how many votes they have cast. Drinks that have
+        since been removed are still counted.
+
+        Args:
+            guild_id (int): The guild to get stats for.
+            user_id (int): The user to get stats for.
+
+        Returns:
+            dict[str, int]: A dict mapping drink names to how many the user
+            had, sorted with the most drunk drink first.
+        """
+        get_stats_query = f"""
+            SELECT name, count
+            FROM {USER_DRINK_STATS_TABLE}
+            WHERE guild_id = ?
+            AND
+                user_id = ?
+            AND
+                count > 0
+            ORDER BY count DESC;
+        """
+        stats = await self._execute_multiple_read_query(
+            get_stats_query, (guild_id, user_id)
+        )
+        res: dict[str, int] = {}
+        if stats:
+            for stat in stats:
+                res[str(stat["name"])] = int(stat["count"])
+        return res
+
+    async def get_drink_history(
+        self,
+        guild_id: int,
+        user_id: int,
+        limit: int,
+        before: int | None = None,
+    ) -> tuple[list[tuple[str, int | None]], int | None]:
+        """
+        Gets a page of the drinks a user has logged in a guild, newest
+        first. Pages are read from the drunk_drinks_user index starting
+        where the last one ended, rather than skipping an offset, so the
+        last page of a long history is as quick as the first.
+
+        Args:
+            guild_id (int): The guild to look in.
+            user_id (int): The user whose drinks to get.
+            limit (int): The most drinks on a page.
+            before (int | None): The cursor returned with the previous page,
+                                 None for the first page.
+
+        Returns:
+            tuple[list[tuple[str, int | None]], int | None]: The drinks on
+            the page as (drink name, created_at), and the cursor of the next
+            page, None if this is the last one. created_at is None for votes
+            from before it was stored.
+        """
+        # One row more than asked for tells if there is a next page.
+        get_history_query = """
+            SELECT drunk.id, drink.name, drunk.created_at
+            FROM drunk_drinks AS drunk
+            JOIN drink_options AS drink ON drink.id = drunk.drink_id
+            WHERE drunk.guild_id = ?
+            AND
+                drunk.user_id = ?
+            AND
+                drunk.id < ?
+            ORDER BY drunk.id DESC
+            LIMIT ?;
         """
-        await self._execute_query(remove_tally_query, (message_id,))
+        rows = await self._execute_multiple_read_query(
+            get_history_query,
+            (
+                guild_id,
+                user_id,
+                # Larger than any row id.
+                before if before is not None else 2**63 - 1,
+                limit + 1,
+            ),
+        )
+        if not rows:
+            return [], None
+        page = rows[:limit]
+        history: list[tuple[str, int | None]] = []
+        for row in page:
+            created_at = row["created_at"]
+            history.append(
+                (
+                    str(row["name"]),
+                    created_at if isinstance(created_at, int) else None,
+                )
+            )
+        next_cursor = int(page[-1]["id"]) if len(rows) > limit else None
+        return history, next_cursor
 
     # ------------------------------------------------------
     # role config system:
@@ -465,10 +1489,13 @@ class DBHandler:
             VALUES
                 (?, ?, ?)
         """
-        await self._execute_query(
+        if await self._execute_query(
             add_config_message_query,
             (message_id, role_id, discord_role_id),
-        )
+        ):
+            self.role_mappings.add(
+                RoleMapping(message_id, role_id, discord_role_id)
+            )
 
     async def update_role_config(
         self, message_id: int, discord_role_id: int
@@ -488,10 +1515,11 @@ class DBHandler:
         WHERE
             message_id = ?
         """
-        await self._execute_query(
+        if await self._execute_query(
             update_role_config_query,
             (discord_role_id, message_id),
-        )
+        ):
+            self.role_mappings.update_discord_role(message_id, discord_role_id)
 
     async def remove_role_config(self, message_id: int) -> None:
         """
@@ -504,10 +1532,26 @@ class DBHandler:
             DELETE FROM role_configs
             WHERE message_id = ?
         """
-        await self._execute_query(
+        if await self._execute_query(
             remove_config_message_query,
             (message_id,),
-        )
+        ):
+            _ = self.role_mappings.remove(message_id)
+
+    async def load_role_mappings(self) -> RoleMappingIndex:
+        """
+        Loads all role mapping configs into the in memory index. Only needs
+        to be run once at startup, after that the index is kept up to date
+        by create_role_config, update_role_config and remove_role_config.
+
+        Returns:
+            RoleMappingIndex: The loaded index.
+        """
+        self.role_mappings.clear()
+        async for mapping in self.iterate_config_messages():
+            self.role_mappings.add(mapping)
+        self._role_mappings_loaded = True
+        return self.role_mappings
 
     async def get_config_messages(self) -> list[RoleMapping]:
         """
@@ -516,30 +1560,36 @@ class DBHandler:
         Returns:
             list[RoleMapping]: A list of role mappings.
         """
+        if not self._role_mappings_loaded:
+            _ = await self.load_role_mappings()
+        return list(self.role_mappings)
+
+    async def iterate_config_messages(self) -> AsyncIterator[RoleMapping]:
+        """
+        Iterates over all role mapping configs without loading them all into
+        memory at once.
+
+        Yields:
+            RoleMapping: A role mapping.
+        """
         get_config_message_query = """
             SELECT message_id, role_id, discord_role_id
             FROM role_configs
         """
-        config_messages = await self._execute_multiple_read_query(
+        async for message in self._iterate_read_query(
             get_config_message_query
-        )
-        return_list: list[RoleMapping] = []
-        if config_messages:
-            for message in config_messages:
-                if (
-                    not isinstance(message["message_id"], int)
-                    or not isinstance(message["role_id"], str)
-                    or not isinstance(message["discord_role_id"], int)
-                ):
-                    return return_list
-                return_list.append(
-                    RoleMapping(
-                        message["message_id"],
-                        message["role_id"],
-                        message["discord_role_id"],
-                    )
-                )
-        return return_list
+        ):
+            if (
+                not isinstance(message["message_id"], int)
+                or not isinstance(message["role_id"], str)
+                or not isinstance(message["discord_role_id"], int)
+            ):
+                return
+            yield RoleMapping(
+                message["message_id"],
+                message["role_id"],
+                message["discord_role_id"],
+            )
 
     # ------------------------------------------------------
     # settings system:
@@ -563,7 +1613,7 @@ class DBHandler:
             VALUES
                 (?, ?, ?, ?)
         """
-        await self._execute_query(
+        _ = await self._execute_query(
             set_setting_query,
             (guild_id, cog.value, setting_name, value),
         )
@@ -590,7 +1640,7 @@ class DBHandler:
             AND
                 config_name = ?
         """
-        await self._execute_query(
+        _ = await self._execute_query(
             update_setting_query,
             (value, guild_id, cog.value, setting_name),
         )
@@ -639,6 +1689,30 @@ class DBHandler:
         Returns:
             dict[int, str]: A dict mapping guils_id to value.
         """
+        return_dict: dict[int, str] = {
+            guild_id: value
+            async for guild_id, value in self.iterate_settings(
+                cog, setting_name
+            )
+        }
+        if not return_dict:
+            return None
+        return return_dict
+
+    async def iterate_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> AsyncIterator[tuple[int, str]]:
+        """
+        Iterates over the value of a setting in every guild without loading
+        them all into memory at once.
+
+        Args:
+            cog (SettingsCog): The cog to get settings for.
+            setting_name (str): The setting to get.
+
+        Yields:
+            tuple[int, str]: Contains (guild_id, value).
+        """
         get_setting_query = """
             SELECT guild_id, value FROM
                 settings
@@ -647,26 +1721,30 @@ class DBHandler:
             AND
                 cog = ?
         """
-        db_return = await self._execute_multiple_read_query(
+        async for setting in self._iterate_read_query(
             get_setting_query, (setting_name, cog.value)
-        )
-        if not db_return:
-            return None
-        return_dict: dict[int, str] = {}
-        for setting in db_return:
-            return_dict[int(setting["guild_id"])] = str(setting["value"])
-        return return_dict
+        ):
+            yield (int(setting["guild_id"]), str(setting["value"]))
 
 
 if __name__ == "__main__":
-    print("Creating tables if they don't exist")
-
     from os import environ
 
     from dotenv import load_dotenv
 
+    from logging_config import setup_logging
+    from storage import open_database
+
     _ = load_dotenv()
+    listener = setup_logging()
+    logger.info("Creating tables if they don't exist")
+
     db_file = environ["DB_FILE"]
 
-    dbHandler = DBHandler(db_file)
+    dbHandler = open_database(
+        db_file,
+        int(environ.get("DB_PARTITIONS") or 0),
+        environ.get("SQLITE_PROFILE", DEFAULT_SQLITE_PROFILE),
+    )
     asyncio.run(dbHandler.create_tables())
+    listener.stop()
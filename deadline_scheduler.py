@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import final
+
+logger = logging.getLogger(__name__)
+
+# Most keys handed to the callback at once.
+MAX_BATCH = 100
+# Longest the scheduler sleeps before looking at the clock again, in case
+# the wall clock jumps.
+MAX_SLEEP = 60.0
+# Seconds before keys whose callback failed are tried again, doubling on
+# every failure in a row up to MAX_RETRY_DELAY.
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 300.0
+
+
+@final
+class DeadlineScheduler:
+    """
+    Runs a callback for keys once their deadline has passed, from a single
+    task. Deadlines are kept in a heap, so scheduling and taking the next
+    deadline are O(log n) no matter how many are pending. Rescheduled
+    deadlines are left in the heap and skipped when they come up. Keys that
+    are due at the same time are handed over in batches, and a batch whose
+    callback fails is scheduled again with a backoff.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[list[int]], Awaitable[None]],
+        max_batch: int = MAX_BATCH,
+    ) -> None:
+        """
+        Args:
+            callback (Callable): Called with a batch of keys whose
+                                 deadlines have passed.
+            max_batch (int): Most keys to pass to one callback.
+        """
+        self.callback = callback
+        self.max_batch = max_batch
+        # (deadline, key)
+        self._heap: list[tuple[float, int]] = []
+        # key: deadline, the current deadline of every pending key
+        self._deadlines: dict[int, float] = {}
+        # key: how many times in a row the callback failed for it
+        self._failures: dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(
+            self._run(), name="deadline-scheduler"
+        )
+
+    def stop(self) -> None:
+        if self._task:
+            _ = self._task.cancel()
+            self._task = None
+
+    def schedule(self, key: int, deadline: float) -> None:
+        """
+        Run the callback for a key at a unix timestamp, replacing any
+        earlier deadline for the key.
+        """
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if self._heap[0] == (deadline, key):
+            # Sooner than what the task is sleeping towards.
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _pop_due(self, now: float) -> list[int]:
+        due: list[int] = []
+        while self._heap and len(due) < self.max_batch:
+            deadline, key = self._heap[0]
+            if deadline > now:
+                break
+            _ = heapq.heappop(self._heap)
+            # Skip entries that were rescheduled.
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = MAX_SLEEP
+            if self._heap:
+                delay = min(max(self._heap[0][0] - time.time(), 0), delay)
+            try:
+                _ = await asyncio.wait_for(self._wakeup.wait(), delay)
+            except TimeoutError:
+                pass
+
+            while due := self._pop_due(time.time()):
+                try:
+                    await self.callback(due)
+                except Exception:
+                    logger.exception(
+                        "Failed handling %d deadline(s)", len(due)
+                    )
+                    self._retry(due)
+                else:
+                    for key in due:
+                        _ = self._failures.pop(key, None)
+
+    def _retry(self, keys: list[int]) -> None:
+        """Schedule keys whose callback failed again, backing off."""
+        now = time.time()
+        for key in keys:
+            if key in self._deadlines:
+                # Rescheduled while the callback ran.
+                continue
+            failures = self._failures.get(key, 0) + 1
+            self._failures[key] = failures
+            delay = min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+            self.schedule(key, now + delay)
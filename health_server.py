@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import math
+from typing import TYPE_CHECKING, final
+
+from aiohttp import web
+
+from memory import memory_usage, resident_memory
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from bot import PanternBot
+
+logger = logging.getLogger(__name__)
+
+# Loop lag in seconds above which the bot is reported as unhealthy.
+HEALTHY_LOOP_LAG = 1.0
+# Seconds to wait for the database to answer a health check.
+DB_PING_TIMEOUT = 2.0
+
+
+@final
+class HealthServer:
+    """
+    Small HTTP server on the bot's own event loop serving /healthz for
+    orchestrator probes and /metrics in Prometheus text format. Since it
+    shares the loop with the bot, a stalled loop also stalls the probe,
+    which is what we want the orchestrator to notice.
+    """
+
+    def __init__(self, bot: "PanternBot", host: str, port: int) -> None:
+        self.bot = bot
+        self.host = host
+        self.port = port
+        app = web.Application()
+        _ = app.router.add_get("/healthz", self.healthz)
+        _ = app.router.add_get("/metrics", self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+
+    async def start(self) -> None:
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(
+            "serving health and metrics on %s:%d", self.host, self.port
+        )
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+    async def healthz(self, _request: web.Request) -> web.Response:
+        gateway = (
+            self.bot.is_ready()
+            and not self.bot.is_closed()
+            and math.isfinite(self.bot.latency)
+        )
+        try:
+            database = await asyncio.wait_for(
+                self.bot.db.ping(), DB_PING_TIMEOUT
+            )
+        except TimeoutError:
+            database = False
+        loop_lag = self.bot.loop_monitor.last_lag
+        healthy = gateway and database and loop_lag < HEALTHY_LOOP_LAG
+        return web.Response(
+            status=200 if healthy else 503,
+            content_type="application/json",
+            text=json.dumps(
+                {
+                    "healthy": healthy,
+                    "gateway": gateway,
+                    "database": database,
+                    "loop_lag": loop_lag,
+                }
+            ),
+        )
+
+    async def metrics(self, _request: web.Request) -> web.Response:
+        monitor = self.bot.loop_monitor
+        gauges: dict[str, float] = {
+            "pantern_open_tallies": await self.bot.db.count_tallies(),
+            "pantern_guilds": len(self.bot.guilds),
+            "pantern_gateway_latency_seconds": (
+                self.bot.latency if math.isfinite(self.bot.latency) else -1
+            ),
+            "pantern_loop_lag_seconds": monitor.last_lag,
+            "pantern_loop_lag_max_seconds": monitor.max_lag,
+            "pantern_view_store_views": len(self.bot.persistent_views),
+        }
+        for kind, count in self.bot.view_registry.counts().items():
+            gauges[f'pantern_live_views{{kind="{kind}"}}'] = count
+        for priority, depth in self.bot.rest.depth().items():
+            name = f'pantern_rest_queue_depth{{priority="{priority}"}}'
+            gauges[name] = depth
+        gauges["pantern_rest_in_flight"] = self.bot.rest.in_flight
+        usage = memory_usage(self.bot)
+        for subsystem, subsystem_usage in usage.items():
+            name = f'pantern_memory_objects{{subsystem="{subsystem}"}}'
+            gauges[name] = subsystem_usage.objects
+        for subsystem, subsystem_usage in usage.items():
+            name = f'pantern_memory_bytes{{subsystem="{subsystem}"}}'
+            gauges[name] = subsystem_usage.size
+        if (resident := resident_memory()) is not None:
+            gauges["pantern_process_resident_bytes"] = resident
+        return web.Response(
+            content_type="text/plain",
+            charset="utf-8",
+            text=metrics.render(gauges),
+        )
@@ -1,9 +1,13 @@
+from bisect import bisect_left, insort
+from collections.abc import Iterator
 from enum import Enum
 from typing import final
 
 
 @final
 class RoleMapping:
+    __slots__ = ("message_id", "role_id", "discord_role_id")
+
     def __init__(
         self, message_id: int, role_id: str, discord_role_id: int
     ) -> None:
@@ -12,6 +16,115 @@ class RoleMapping:
         self.discord_role_id = discord_role_id
 
 
+@final
+class RoleMappingIndex:
+    """
+    All role mappings kept in memory, indexed by message id, LDAP role id
+    and discord role id so lookups don't need to scan every mapping.
+    """
+
+    def __init__(self) -> None:
+        self.by_message_id: dict[int, RoleMapping] = {}
+        self.by_role_id: dict[str, RoleMapping] = {}
+        # Several LDAP roles can map to the same discord role.
+        self.by_discord_role_id: dict[int, list[RoleMapping]] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_message_id)
+
+    def __iter__(self) -> Iterator[RoleMapping]:
+        return iter(self.by_message_id.values())
+
+    def add(self, mapping: RoleMapping) -> None:
+        """Add a mapping, replacing any mapping with the same message id."""
+        _ = self.remove(mapping.message_id)
+        self.by_message_id[mapping.message_id] = mapping
+        self.by_role_id[mapping.role_id] = mapping
+        self.by_discord_role_id.setdefault(
+            mapping.discord_role_id, []
+        ).append(mapping)
+
+    def remove(self, message_id: int) -> RoleMapping | None:
+        """Remove the mapping with the given message id, if there is one."""
+        mapping = self.by_message_id.pop(message_id, None)
+        if not mapping:
+            return None
+        _ = self.by_role_id.pop(mapping.role_id, None)
+        same_role = self.by_discord_role_id.get(mapping.discord_role_id, [])
+        if mapping in same_role:
+            same_role.remove(mapping)
+        if not same_role:
+            _ = self.by_discord_role_id.pop(mapping.discord_role_id, None)
+        return mapping
+
+    def update_discord_role(
+        self, message_id: int, discord_role_id: int
+    ) -> None:
+        """Point the mapping with the given message id to a new role."""
+        mapping = self.remove(message_id)
+        if mapping:
+            mapping.discord_role_id = discord_role_id
+            self.add(mapping)
+
+    def clear(self) -> None:
+        self.by_message_id.clear()
+        self.by_role_id.clear()
+        self.by_discord_role_id.clear()
+
+
+@final
+class DrinkNameIndex:
+    """
+    A guild's drink names kept sorted (case insensitively) so all names
+    starting with a prefix can be found with a binary search.
+    """
+
+    def __init__(self) -> None:
+        # (casefolded name, name) pairs, sorted.
+        self._entries: list[tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        entry = (name.casefold(), name)
+        index = bisect_left(self._entries, entry)
+        return index < len(self._entries) and self._entries[index] == entry
+
+    def add(self, name: str) -> None:
+        if name not in self:
+            insort(self._entries, (name.casefold(), name))
+
+    def remove(self, name: str) -> None:
+        entry = (name.casefold(), name)
+        index = bisect_left(self._entries, entry)
+        if index < len(self._entries) and self._entries[index] == entry:
+            del self._entries[index]
+
+    def starting_with(self, prefix: str, limit: int) -> list[str]:
+        """
+        Gets drink names starting with prefix, ignoring case.
+
+        Args:
+            prefix (str): What the names should start with.
+            limit (int): The max amount of names to return.
+
+        Returns:
+            list[str]: Up to limit matching names in alphabetical order.
+        """
+        key = prefix.casefold()
+        names: list[str] = []
+        index = bisect_left(self._entries, (key,))
+        while (
+            len(names) < limit
+            and index < len(self._entries)
+            and self._entries[index][0].startswith(key)
+        ):
+            names.append(self._entries[index][1])
+            index += 1
+        return names
+
+
 class CogSetting(Enum):
     DRINKS_HANDLER = 0
     CONFIGURE_DRINKS_HANDLER = 1
@@ -0,0 +1,455 @@
+import itertools
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import AsyncIterator
+from typing import final
+
+from db_handler import DRINK_STATS_TABLES
+from helpers import CogSetting, DrinkNameIndex, RoleMapping, RoleMappingIndex
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@final
+class _Vote:
+    __slots__ = ("id", "user_id", "drink_id", "created_at")
+
+    def __init__(
+        self, id: int, user_id: int, drink_id: int, created_at: int
+    ) -> None:
+        self.id = id
+        self.user_id = user_id
+        self.drink_id = drink_id
+        self.created_at = created_at
+
+
+def _vote_id(vote: _Vote) -> int:
+    return vote.id
+
+
+@final
+class _Tally:
+    __slots__ = ("guild_id", "channel_id", "closes_at")
+
+    def __init__(
+        self, guild_id: int, channel_id: int | None, closes_at: int | None
+    ) -> None:
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.closes_at = closes_at
+
+
+@final
+class InMemoryDBHandler:
+    """
+    Keeps everything in dicts and indexes instead of a database, and
+    forgets it all when the process exits. Behaves like DBHandler down to
+    the rollups and the constraint errors it logs, so load tests and
+    benchmarks can run against it to tell how much of a callback's latency
+    is storage.
+
+    Every method finishes without awaiting anything, so there are no
+    concurrent writes to guard against.
+    """
+
+    def __init__(self) -> None:
+        self.profile_name = "memory"
+        self.role_mappings: RoleMappingIndex = RoleMappingIndex()
+        self.drink_names: dict[int, DrinkNameIndex] = {}
+        self._drink_id_counter = itertools.count(1)
+        # drink id -> (guild id, name), and guild id -> name -> drink id.
+        self._drinks: dict[int, tuple[int, str]] = {}
+        self._drink_ids: dict[int, dict[str, int]] = {}
+        self._vote_id_counter = itertools.count(1)
+        # (guild id, message id) -> user id -> vote.
+        self._votes: dict[tuple[int, int], dict[int, _Vote]] = {}
+        # (guild id, user id) -> the user's votes, sorted by id.
+        self._user_votes: dict[tuple[int, int], list[_Vote]] = {}
+        # drink id -> (guild id, message id, user id) of its votes, so
+        # removing a drink finds its votes without a scan.
+        self._votes_by_drink: dict[int, set[tuple[int, int, int]]] = {}
+        # message id -> tally, in the order they were created.
+        self._tallies: dict[int, _Tally] = {}
+        # guild id -> message ids of its tallies, in the order they were
+        # created.
+        self._tallies_by_guild: dict[int, dict[int, None]] = {}
+        # rollup table -> guild id -> bucket start -> drink name -> count.
+        self._drink_stats: dict[str, dict[int, dict[int, Counter[str]]]] = {
+            table: {} for table in DRINK_STATS_TABLES
+        }
+        # (guild id, user id) -> drink name -> count.
+        self._user_drink_stats: dict[tuple[int, int], Counter[str]] = {}
+        # (cog, setting name) -> guild id -> value.
+        self._settings: dict[tuple[int, str], dict[int, str]] = {}
+
+    @property
+    def db_files(self) -> list[str]:
+        """Nothing is stored on disk, so there is nothing to back up."""
+        return []
+
+    def _constraint_failed(self, constraint: str) -> None:
+        """Count and log a write that breaks a unique constraint, like
+        DBHandler does for the error SQLite gives it."""
+        metrics.db_errors += 1
+        logger.error(
+            "the error UNIQUE constraint failed: %s occured", constraint
+        )
+
+    async def connect(self) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def create_tables(self) -> None:
+        pass
+
+    async def has_guild_data(self) -> bool:
+        return bool(
+            self._drinks
+            or self._votes
+            or self._tallies
+            or self._settings
+            or any(self._drink_stats.values())
+        )
+
+    async def ping(self) -> bool:
+        return True
+
+    # ------------------------------------------------------
+
+    # Drink system:
+    async def get_drink_option_list(self, guild_id: int) -> list[str]:
+        # Sorted by name, like DBHandler.
+        return sorted(self._drink_ids.get(guild_id, {}))
+
+    async def add_drink_option(self, guild_id: int, drink_name: str) -> None:
+        """
+        Throws:
+            ValueError: If there is already a drink with that name in the
+                        guild.
+        """
+        if drink_name in self._drink_ids.get(guild_id, {}):
+            raise ValueError(
+                f"Duplicate drinks {drink_name} in server: {guild_id}"
+            )
+        self._add_drink(guild_id, drink_name)
+
+    def _add_drink(self, guild_id: int, drink_name: str) -> None:
+        drink_id = next(self._drink_id_counter)
+        self._drinks[drink_id] = (guild_id, drink_name)
+        self._drink_ids.setdefault(guild_id, {})[drink_name] = drink_id
+        self.drink_names.setdefault(guild_id, DrinkNameIndex()).add(
+            drink_name
+        )
+
+    async def remove_drink_option(
+        self, guild_id: int, drink_name: str
+    ) -> None:
+        drink_ids = self._drink_ids.get(guild_id, {})
+        drink_id = drink_ids.pop(drink_name, None)
+        if drink_id is None:
+            return
+        if not drink_ids:
+            del self._drink_ids[guild_id]
+        del self._drinks[drink_id]
+        if drink_names := self.drink_names.get(guild_id):
+            drink_names.remove(drink_name)
+        # The votes go with the drink, but like in SQLite the drink is gone
+        # by then so the rollups keep their history.
+        for vote_guild_id, message_id, user_id in self._votes_by_drink.pop(
+            drink_id, set()
+        ):
+            self._delete_vote((vote_guild_id, message_id), user_id)
+
+    async def add_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> list[str]:
+        existing = self._drink_ids.get(guild_id, {})
+        new_names = [
+            name
+            for name in dict.fromkeys(drink_names)
+            if name not in existing
+        ]
+        for name in new_names:
+            self._add_drink(guild_id, name)
+        return new_names
+
+    async def remove_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> None:
+        for name in drink_names:
+            await self.remove_drink_option(guild_id, name)
+
+    async def load_drink_names(self) -> None:
+        self.drink_names.clear()
+        for guild_id, name in self._drinks.values():
+            self.drink_names.setdefault(guild_id, DrinkNameIndex()).add(name)
+
+    def _count_vote(self, guild_id: int, vote: _Vote, change: int) -> None:
+        """Add change to the rollups of the drink a vote is for."""
+        drink = self._drinks.get(vote.drink_id)
+        if not drink:
+            return
+        for table, bucket_size in DRINK_STATS_TABLES.items():
+            buckets = self._drink_stats[table].setdefault(guild_id, {})
+            bucket_start = vote.created_at - vote.created_at % bucket_size
+            buckets.setdefault(bucket_start, Counter())[drink[1]] += change
+        self._user_drink_stats.setdefault(
+            (guild_id, vote.user_id), Counter()
+        )[drink[1]] += change
+
+    def _delete_vote(self, tally: tuple[int, int], user_id: int) -> None:
+        votes = self._votes.get(tally, {})
+        vote = votes.pop(user_id, None)
+        if not vote:
+            return
+        if not votes:
+            del self._votes[tally]
+        self._votes_by_drink.get(vote.drink_id, set()).discard(
+            (*tally, user_id)
+        )
+        user_votes = self._user_votes[(tally[0], user_id)]
+        del user_votes[bisect_left(user_votes, vote.id, key=_vote_id)]
+        if not user_votes:
+            del self._user_votes[(tally[0], user_id)]
+        self._count_vote(tally[0], vote, -1)
+
+    async def set_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int, drink_name: str
+    ) -> bool:
+        if drink_name == "nothing":
+            raise ValueError("nothing is not a drink")
+        drink_id = self._drink_ids.get(guild_id, {}).get(drink_name)
+        if drink_id is None:
+            raise ValueError(f"{drink_name} is not a drink in the guild")
+
+        votes = self._votes.setdefault((guild_id, message_id), {})
+        vote = votes.get(user_id)
+        if vote:
+            if vote.drink_id == drink_id:
+                return False
+            self._count_vote(guild_id, vote, -1)
+            self._votes_by_drink[vote.drink_id].discard(
+                (guild_id, message_id, user_id)
+            )
+            vote.drink_id = drink_id
+            new_entry = False
+        else:
+            vote = _Vote(
+                next(self._vote_id_counter),
+                user_id,
+                drink_id,
+                int(time.time()),
+            )
+            votes[user_id] = vote
+            # Ids only go up, so appending keeps the list sorted.
+            self._user_votes.setdefault((guild_id, user_id), []).append(vote)
+            new_entry = True
+        self._votes_by_drink.setdefault(drink_id, set()).add(
+            (guild_id, message_id, user_id)
+        )
+        self._count_vote(guild_id, vote, 1)
+        return new_entry
+
+    async def remove_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int
+    ) -> None:
+        self._delete_vote((guild_id, message_id), user_id)
+
+    async def get_tally(
+        self, message_id: int, guild_id: int
+    ) -> dict[str, list[int]]:
+        votes = self._votes.get((guild_id, message_id), {})
+        res: dict[str, list[int]] = {}
+        # Grouped in drink id order, like DBHandler.
+        for user_id, vote in sorted(
+            votes.items(), key=lambda entry: entry[1].drink_id
+        ):
+            res.setdefault(self._drinks[vote.drink_id][1], []).append(user_id)
+        return res
+
+    async def get_all_tallies(self) -> list[tuple[int, int, int | None]]:
+        return [tally async for tally in self.iterate_all_tallies()]
+
+    async def iterate_all_tallies(
+        self,
+    ) -> AsyncIterator[tuple[int, int, int | None]]:
+        for message_id, tally in list(self._tallies.items()):
+            yield (message_id, tally.guild_id, tally.channel_id)
+
+    async def get_latest_tally(self, guild_id: int) -> int | None:
+        message_ids = self._tallies_by_guild.get(guild_id)
+        if not message_ids:
+            return None
+        return next(reversed(message_ids))
+
+    async def count_tallies(self) -> int:
+        return len(self._tallies)
+
+    async def create_tally(
+        self,
+        message_id: int,
+        guild_id: int,
+        channel_id: int | None = None,
+        closes_at: int | None = None,
+    ) -> None:
+        if message_id in self._tallies:
+            self._constraint_failed("tallies.message_id")
+            return
+        self._tallies[message_id] = _Tally(guild_id, channel_id, closes_at)
+        self._tallies_by_guild.setdefault(guild_id, {})[message_id] = None
+
+    async def get_tally_deadlines(self) -> list[tuple[int, int]]:
+        return [
+            (message_id, tally.closes_at)
+            for message_id, tally in self._tallies.items()
+            if tally.closes_at is not None
+        ]
+
+    async def count_votes(
+        self, tallies: list[tuple[int, int]]
+    ) -> dict[int, int]:
+        counts: dict[int, int] = {}
+        for guild_id, message_id in tallies:
+            if votes := self._votes.get((guild_id, message_id)):
+                counts[message_id] = len(votes)
+        return counts
+
+    async def remove_tally(self, message_id: int) -> None:
+        await self.remove_tallies([message_id])
+
+    async def remove_tallies(self, message_ids: list[int]) -> None:
+        # Like in DBHandler, only the tallies go, not their votes.
+        for message_id in message_ids:
+            tally = self._tallies.pop(message_id, None)
+            if not tally:
+                continue
+            guild_tallies = self._tallies_by_guild[tally.guild_id]
+            del guild_tallies[message_id]
+            if not guild_tallies:
+                del self._tallies_by_guild[tally.guild_id]
+
+    async def get_drink_stats(
+        self, guild_id: int, start: int, end: int, hourly: bool = False
+    ) -> dict[str, int]:
+        table = "drink_stats_hourly" if hourly else "drink_stats_daily"
+        bucket_size = DRINK_STATS_TABLES[table]
+        first_bucket = start - start % bucket_size
+        totals: Counter[str] = Counter()
+        for bucket_start, counts in self._drink_stats[table].get(
+            guild_id, {}
+        ).items():
+            if first_bucket <= bucket_start < end:
+                totals.update(counts)
+        return {
+            name: total
+            for name, total in totals.most_common()
+            if total > 0
+        }
+
+    async def get_user_drink_stats(
+        self, guild_id: int, user_id: int
+    ) -> dict[str, int]:
+        counts = self._user_drink_stats.get((guild_id, user_id), Counter())
+        return {
+            name: count for name, count in counts.most_common() if count > 0
+        }
+
+    async def get_drink_history(
+        self,
+        guild_id: int,
+        user_id: int,
+        limit: int,
+        before: int | None = None,
+    ) -> tuple[list[tuple[str, int | None]], int | None]:
+        user_votes = self._user_votes.get((guild_id, user_id), [])
+        end = (
+            len(user_votes)
+            if before is None
+            else bisect_left(user_votes, before, key=_vote_id)
+        )
+        page = user_votes[max(end - limit, 0) : end][::-1]
+        history: list[tuple[str, int | None]] = [
+            (self._drinks[vote.drink_id][1], vote.created_at) for vote in page
+        ]
+        next_cursor = page[-1].id if page and end > limit else None
+        return history, next_cursor
+
+    # ------------------------------------------------------
+    # role config system, the index is all there is:
+    async def create_role_config(
+        self, message_id: int, role_id: str, discord_role_id: int
+    ) -> None:
+        if message_id in self.role_mappings.by_message_id:
+            self._constraint_failed("role_configs.message_id")
+        elif role_id in self.role_mappings.by_role_id:
+            self._constraint_failed("role_configs.role_id")
+        else:
+            self.role_mappings.add(
+                RoleMapping(message_id, role_id, discord_role_id)
+            )
+
+    async def update_role_config(
+        self, message_id: int, discord_role_id: int
+    ) -> None:
+        self.role_mappings.update_discord_role(message_id, discord_role_id)
+
+    async def remove_role_config(self, message_id: int) -> None:
+        _ = self.role_mappings.remove(message_id)
+
+    async def load_role_mappings(self) -> RoleMappingIndex:
+        return self.role_mappings
+
+    async def get_config_messages(self) -> list[RoleMapping]:
+        return list(self.role_mappings)
+
+    async def iterate_config_messages(self) -> AsyncIterator[RoleMapping]:
+        for mapping in list(self.role_mappings):
+            yield mapping
+
+    # ------------------------------------------------------
+    # settings system:
+    async def set_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None:
+        values = self._settings.setdefault((cog.value, setting_name), {})
+        if guild_id in values:
+            self._constraint_failed(
+                "settings.guild_id, settings.cog, settings.config_name"
+            )
+            return
+        values[guild_id] = value
+
+    async def update_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None:
+        values = self._settings.get((cog.value, setting_name), {})
+        if guild_id in values:
+            values[guild_id] = value
+
+    async def get_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str
+    ) -> str | None:
+        return self._settings.get((cog.value, setting_name), {}).get(
+            guild_id
+        )
+
+    async def get_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> dict[int, str] | None:
+        return dict(self._settings.get((cog.value, setting_name), {})) or None
+
+    async def iterate_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> AsyncIterator[tuple[int, str]]:
+        for setting in list(
+            self._settings.get((cog.value, setting_name), {}).items()
+        ):
+            yield setting
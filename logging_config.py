@@ -0,0 +1,136 @@
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from os import environ
+from typing import final, override
+
+# Level used for every logger that isn't given one in LOG_LEVELS.
+DEFAULT_LEVEL = "INFO"
+# Levels used for specific loggers unless overridden in LOG_LEVELS.
+DEFAULT_LOGGER_LEVELS = {
+    "discord": "INFO",
+    "discord.http": "WARNING",
+}
+# At most RATE_LIMIT_BURST records with the same logger and message are let
+# through every RATE_LIMIT_INTERVAL seconds, the rest are dropped. Errors
+# and worse are never dropped.
+RATE_LIMIT_INTERVAL = 10.0
+RATE_LIMIT_BURST = 5
+
+
+@final
+class JsonFormatter(logging.Formatter):
+    """Formats records as one json object per line."""
+
+    @override
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, str | int] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+@final
+class RateLimitFilter(logging.Filter):
+    """
+    Drops records below ERROR once the same message (by logger and
+    unformatted message) has been logged burst times within interval
+    seconds. Keeps a hot path that warns on every call from flooding the
+    logs.
+    """
+
+    def __init__(
+        self,
+        interval: float = RATE_LIMIT_INTERVAL,
+        burst: int = RATE_LIMIT_BURST,
+    ) -> None:
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # (logger name, message) -> (start of window, records in window)
+        self._windows: dict[tuple[str, object], tuple[float, int]] = {}
+        self._next_prune = time.monotonic() + interval
+
+    @override
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now)
+        window_start, count = self._windows.get(key, (now, 0))
+        if now - window_start >= self.interval:
+            window_start, count = now, 0
+        self._windows[key] = (window_start, count + 1)
+        return count < self.burst
+
+    def _prune(self, now: float) -> None:
+        """Forget windows that have run out, at most once per interval."""
+        self._windows = {
+            key: window
+            for key, window in self._windows.items()
+            if now - window[0] < self.interval
+        }
+        self._next_prune = now + self.interval
+
+
+def _parse_levels(raw: str) -> dict[str, str]:
+    """Parses "name=LEVEL,other.name=LEVEL" into {name: LEVEL}."""
+    levels: dict[str, str] = {}
+    for entry in raw.split(","):
+        if "=" in entry:
+            name, level = entry.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> QueueListener:
+    """
+    Sets up logging for the whole bot. Records are put on a queue by the
+    logging call and written to stdout by a background thread, so logging
+    never blocks the event loop on a slow log pipe.
+
+    Configured with the environment variables:
+        LOG_LEVEL: The default level, INFO if not set.
+        LOG_LEVELS: Per logger levels, like "db_handler=DEBUG,discord=WARNING".
+        LOG_FORMAT: "json" for one json object per line, plain text otherwise.
+
+    Returns:
+        QueueListener: The started listener, stop it on shutdown to flush
+                       the remaining records.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    if environ.get("LOG_FORMAT", "").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)-8s %(name)s: %(message)s"
+            )
+        )
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(environ.get("LOG_LEVEL", DEFAULT_LEVEL).upper())
+    levels = DEFAULT_LOGGER_LEVELS | _parse_levels(
+        environ.get("LOG_LEVELS", "")
+    )
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque
+from typing import final
+
+logger = logging.getLogger(__name__)
+
+# Seconds between lag samples.
+SAMPLE_INTERVAL = 0.25
+# Lag in seconds above which the loop counts as blocked and the blocking
+# stack is captured.
+LAG_THRESHOLD = 0.1
+# Upper bounds (in seconds) of the lag histogram buckets. Anything larger
+# ends up in a final overflow bucket.
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# How many captured blocking stacks to keep.
+KEPT_STACKS = 10
+
+
+@final
+class BlockedStack:
+    """The stack of the event loop thread while it was blocked."""
+
+    def __init__(self, captured_at: float, blocked_for: float, stack: str):
+        self.captured_at = captured_at
+        self.blocked_for = blocked_for
+        self.stack = stack
+
+
+@final
+class LoopMonitor:
+    """
+    Measures event loop lag by checking how late a periodic sleep wakes up,
+    and keeps a histogram of it. A watchdog thread notices when the loop
+    hasn't checked in for longer than the threshold and captures the loop
+    thread's stack, showing what was blocking it.
+    """
+
+    def __init__(
+        self,
+        interval: float = SAMPLE_INTERVAL,
+        threshold: float = LAG_THRESHOLD,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.bucket_counts: list[int] = [0] * (len(LAG_BUCKETS) + 1)
+        self.sample_count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.blocked_stacks: deque[BlockedStack] = deque(maxlen=KEPT_STACKS)
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start sampling on the running loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample(), name="loop-monitor")
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            _ = self._task.cancel()
+            self._task = None
+
+    def record(self, lag: float) -> None:
+        """Add a lag sample to the histogram."""
+        self.bucket_counts[bisect_left(LAG_BUCKETS, lag)] += 1
+        self.sample_count += 1
+        self.total_lag += lag
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    async def _sample(self) -> None:
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record(max(now - before - self.interval, 0.0))
+
+    def _watch(self) -> None:
+        captured_heartbeat: float | None = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            # Only capture once per block, the loop is stuck on the same
+            # thing until the heartbeat moves again.
+            if blocked_for < self.threshold or heartbeat == captured_heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id or 0)
+            if not frame:
+                continue
+            captured_heartbeat = heartbeat
+            stack = "".join(traceback.format_stack(frame))
+            self.blocked_stacks.append(
+                BlockedStack(time.time(), blocked_for, stack)
+            )
+            logger.warning(
+                "Event loop blocked for over %.3fs at:\n%s", blocked_for, stack
+            )
+
+    def summary(self) -> str:
+        """A human readable summary of the lag histogram."""
+        if not self.sample_count:
+            return "No lag samples yet."
+        lines = [
+            f"samples: {self.sample_count}, "
+            + f"mean: {self.total_lag / self.sample_count * 1000:.1f}ms, "
+            + f"max: {self.max_lag * 1000:.1f}ms, "
+            + f"last: {self.last_lag * 1000:.1f}ms",
+        ]
+        lower = 0.0
+        for upper, count in zip(
+            (*LAG_BUCKETS, float("inf")), self.bucket_counts
+        ):
+            if count:
+                lines.append(
+                    f"{lower * 1000:>6.0f}-{upper * 1000:<6.0f}ms: {count}"
+                )
+            lower = upper
+        lines.append(f"blocking stacks captured: {len(self.blocked_stacks)}")
+        return "\n".join(lines)
@@ -0,0 +1,331 @@
+import asyncio
+import os
+import sys
+import tracemalloc
+from collections import deque
+from collections.abc import Iterable, Mapping
+from functools import cache
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import TYPE_CHECKING, Any, final
+
+import discord
+from discord import ui
+from discord.state import ConnectionState
+
+from db_handler import DBHandler
+from in_memory_db import InMemoryDBHandler
+from partitioned_db import PartitionedDBHandler
+from rest_scheduler import RestScheduler
+
+if TYPE_CHECKING:
+    from bot import PanternBot
+
+# How many items of a container are sized, the rest are assumed to be the
+# same size on average. Objects of a kind tend to be alike, so a small
+# sample is close enough and keeps /metrics cheap.
+SIZE_SAMPLE = 20
+# How many references deep sizing follows.
+SIZE_DEPTH = 6
+# Frames kept per allocation while tracing. More frames point closer to
+# the cause but make tracing slower and use more memory.
+TRACE_FRAMES = 10
+# How many allocation sites a trace diff lists.
+TRACE_LIMIT = 50
+
+# Objects that belong to another subsystem or to the whole bot. Sizing
+# stops at them, so one subsystem isn't charged for everything it can
+# reach, like every view reaching the whole client through the database.
+SHARED_TYPES: tuple[type, ...] = (
+    discord.Client,
+    ConnectionState,
+    discord.Guild,
+    discord.Member,
+    discord.User,
+    discord.ClientUser,
+    discord.Role,
+    discord.Message,
+    discord.abc.GuildChannel,
+    discord.Thread,
+    discord.Emoji,
+    ui.View,
+    ui.LayoutView,
+    asyncio.AbstractEventLoop,
+    DBHandler,
+    PartitionedDBHandler,
+    InMemoryDBHandler,
+    RestScheduler,
+)
+# Never sized at all, they are shared by everything.
+_CODE_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    BuiltinFunctionType,
+    MethodType,
+)
+_LEAF_TYPES = (str, bytes, bytearray, int, float, bool, type(None))
+
+
+@final
+class SubsystemUsage:
+    """How many objects a subsystem holds and about how much memory."""
+
+    def __init__(self, objects: int, size: int) -> None:
+        self.objects = objects
+        self.size = size
+
+
+def _references(obj: Any) -> tuple[int, Iterable[Any]]:
+    """How many objects obj refers to, and those objects."""
+    if isinstance(obj, Mapping):
+        mapping: Mapping[Any, Any] = obj
+        return 2 * len(mapping), (
+            item for pair in mapping.items() for item in pair
+        )
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        container: Iterable[Any] = obj
+        return len(obj), container
+    references: list[Any] = []
+    if hasattr(obj, "__dict__"):
+        references.extend(vars(obj).values())
+    for slot in _slots(type(obj)):
+        if hasattr(obj, slot):
+            references.append(getattr(obj, slot))
+    return len(references), references
+
+
+@cache
+def _slots(cls: type) -> tuple[str, ...]:
+    """The names of every slot of a class, including inherited ones."""
+    names: list[str] = []
+    for base in cls.__mro__:
+        slots = getattr(base, "__slots__", ())
+        for slot in (slots,) if isinstance(slots, str) else slots:
+            if slot not in ("__dict__", "__weakref__"):
+                names.append(slot)
+    return tuple(names)
+
+
+def approximate_size(
+    obj: Any,
+    stop: tuple[type, ...] = SHARED_TYPES,
+    depth: int = SIZE_DEPTH,
+    seen: set[int] | None = None,
+) -> int:
+    """
+    Approximate how much memory an object and what it refers to takes.
+    Only the first SIZE_SAMPLE items of a container are sized, and the
+    rest are assumed to be the same size on average, so this stays cheap
+    for large caches.
+
+    Args:
+        obj (Any): The object to size.
+        stop (tuple[type, ...]): Objects of these types that obj refers to
+                                 are left out.
+        depth (int): How many references deep to follow.
+        seen (set[int] | None): Ids of objects that are already counted,
+                                shared between calls so objects they have
+                                in common are only counted once.
+
+    Returns:
+        int: The approximate size in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0 or isinstance(obj, _LEAF_TYPES):
+        return size
+
+    count, references = _references(obj)
+    sized = 0
+    references_size = 0
+    for reference in references:
+        if sized == SIZE_SAMPLE:
+            break
+        sized += 1
+        if isinstance(reference, (*stop, *_CODE_TYPES)):
+            continue
+        references_size += approximate_size(reference, stop, depth - 1, seen)
+    if sized:
+        size += references_size * count // sized
+    return size
+
+
+def _usage(objects: Iterable[Any], count: int) -> SubsystemUsage:
+    """Size a sample of a subsystem's objects and scale it up to count."""
+    seen: set[int] = set()
+    sized = 0
+    size = 0
+    for obj in objects:
+        if sized == SIZE_SAMPLE:
+            break
+        size += approximate_size(obj, seen=seen)
+        sized += 1
+    return SubsystemUsage(count, size * count // sized if sized else 0)
+
+
+def _views(bot: "PanternBot") -> list[ui.View | ui.LayoutView]:
+    """Every view the bot listens to that it can see, each once. Views
+    that time out, like the tally info buttons, aren't exposed by
+    discord.py and so aren't counted."""
+    views = {id(view): view for view in bot.persistent_views}
+    for view in bot.view_registry.views():
+        views.setdefault(id(view), view)
+    return list(views.values())
+
+
+def memory_usage(bot: "PanternBot") -> dict[str, SubsystemUsage]:
+    """
+    Counts the objects the bot holds on to, by subsystem, along with
+    their approximate size.
+
+    Returns:
+        dict[str, SubsystemUsage]: The usage of each subsystem, views are
+        split up by their class.
+    """
+    usage: dict[str, SubsystemUsage] = {}
+
+    views_by_class: dict[str, list[ui.View | ui.LayoutView]] = {}
+    for view in _views(bot):
+        views_by_class.setdefault(type(view).__name__, []).append(view)
+    for name, views in sorted(views_by_class.items()):
+        usage[f"views.{name}"] = _usage(views, len(views))
+    usage["view_registry"] = SubsystemUsage(
+        len(bot.view_registry), approximate_size(bot.view_registry)
+    )
+
+    members = (member for guild in bot.guilds for member in guild.members)
+    usage["guilds"] = _usage(bot.guilds, len(bot.guilds))
+    usage["members"] = _usage(
+        members, sum(len(guild.members) for guild in bot.guilds)
+    )
+    usage["users"] = _usage(bot.users, len(bot.users))
+    usage["messages"] = _usage(bot.cached_messages, len(bot.cached_messages))
+
+    usage["drink_names"] = SubsystemUsage(
+        sum(len(names) for names in bot.db.drink_names.values()),
+        approximate_size(dict(bot.db.drink_names)),
+    )
+    usage["role_mappings"] = SubsystemUsage(
+        len(bot.db.role_mappings), approximate_size(bot.db.role_mappings)
+    )
+    usage["rest_queue"] = SubsystemUsage(
+        sum(bot.rest.depth().values()), approximate_size(bot.rest)
+    )
+    return usage
+
+
+def resident_memory() -> int | None:
+    """The resident set size of the process in bytes, if it can be read."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def format_usage(usage: dict[str, SubsystemUsage]) -> str:
+    """A table of the usage, biggest subsystem first."""
+    lines = [f"{'subsystem':<28}{'objects':>10}{'size':>12}"]
+    for name, subsystem in sorted(
+        usage.items(), key=lambda entry: entry[1].size, reverse=True
+    ):
+        lines.append(
+            f"{name:<28}{subsystem.objects:>10}"
+            + f"{format_bytes(subsystem.size):>12}"
+        )
+    resident = resident_memory()
+    if resident is not None:
+        lines.append(f"\nresident memory: {format_bytes(resident)}")
+    return "\n".join(lines)
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+@final
+class AllocationTracer:
+    """
+    Traces allocations with tracemalloc on demand, and diffs snapshots
+    against a baseline taken when tracing started. Growth between the
+    baseline and a diff that doesn't go away points at a leak. Tracing
+    slows allocations down, so it is only on while someone is looking.
+    """
+
+    def __init__(self, frames: int = TRACE_FRAMES) -> None:
+        self.frames = frames
+        self._baseline: tracemalloc.Snapshot | None = None
+        # If tracing was started here, rather than by PYTHONTRACEMALLOC or
+        # someone else, and so should be stopped here too.
+        self._started_tracing = False
+
+    @property
+    def tracing(self) -> bool:
+        return self._baseline is not None
+
+    async def start(self) -> None:
+        """Start tracing and take the baseline."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._baseline = await asyncio.to_thread(_take_snapshot)
+
+    def stop(self) -> None:
+        self._baseline = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    async def diff(self, limit: int = TRACE_LIMIT) -> tuple[int, str]:
+        """
+        Compare the allocations now against the baseline.
+
+        Args:
+            limit (int): How many allocation sites to list.
+
+        Returns:
+            tuple[int, str]: How many bytes more are allocated than at the
+            baseline, and the allocation sites that grew the most.
+
+        Throws:
+            RuntimeError: If tracing hasn't been started.
+        """
+        baseline = self._baseline
+        if not baseline:
+            raise RuntimeError("Not tracing")
+
+        def compare() -> tuple[int, str]:
+            stats = _take_snapshot().compare_to(baseline, "traceback")
+            growth = sum(stat.size_diff for stat in stats)
+            report: list[str] = []
+            for stat in stats[:limit]:
+                report.append(
+                    f"{format_bytes(stat.size_diff):>12} "
+                    + f"({stat.count_diff:+} blocks), "
+                    + f"now {format_bytes(stat.size)}:"
+                )
+                report.extend(
+                    f"    {line}"
+                    for line in stat.traceback.format(most_recent_first=True)
+                )
+            return growth, "\n".join(report)
+
+        return await asyncio.to_thread(compare)
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    # Leave out what tracing itself allocates.
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+    )
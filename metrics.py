@@ -0,0 +1,129 @@
+from bisect import bisect_left
+from typing import final
+
+# Upper bounds (in seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@final
+class Histogram:
+    """A Prometheus style histogram with fixed buckets."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        """Render in Prometheus text format, labels like 'kind="read"'."""
+        lines: list[str] = []
+        cumulative = 0
+        for upper, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{upper}"}} {cumulative}'
+            )
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+@final
+class Metrics:
+    """
+    Counters and histograms for the whole bot. Recording is just a few dict
+    and list updates, so it's cheap enough to do on every interaction and
+    query.
+    """
+
+    def __init__(self) -> None:
+        # Interaction latency (receipt to callback finished) by handler.
+        self.interactions: dict[str, Histogram] = {}
+        # Query latency by kind of query.
+        self.db_queries: dict[str, Histogram] = {}
+        self.db_errors: int = 0
+        # Time outgoing requests spend queued, by priority.
+        self.rest_waits: dict[str, Histogram] = {}
+        self.rest_coalesced: int = 0
+        # (duration in seconds, size in bytes) of the last backup, by
+        # database file.
+        self.backups: dict[str, tuple[float, int]] = {}
+        self.backup_failures: int = 0
+
+    def observe_interaction(self, handler: str, seconds: float) -> None:
+        self.interactions.setdefault(handler, Histogram()).observe(seconds)
+
+    def observe_query(self, kind: str, seconds: float) -> None:
+        self.db_queries.setdefault(kind, Histogram()).observe(seconds)
+
+    def observe_rest_wait(self, priority: str, seconds: float) -> None:
+        self.rest_waits.setdefault(priority, Histogram()).observe(seconds)
+
+    def observe_backup(self, db_file: str, seconds: float, size: int) -> None:
+        self.backups[db_file] = (seconds, size)
+
+    def render(self, gauges: dict[str, float]) -> str:
+        """
+        Render every metric in Prometheus text format.
+
+        Args:
+            gauges (dict[str, float]): Extra point in time values to include,
+                                       mapping metric name, with any labels,
+                                       to value.
+
+        Returns:
+            str: The metrics page.
+        """
+        lines = [
+            "# TYPE pantern_interaction_seconds histogram",
+        ]
+        for handler, histogram in sorted(self.interactions.items()):
+            lines += histogram.render(
+                "pantern_interaction_seconds", f'handler="{handler}"'
+            )
+        lines.append("# TYPE pantern_db_query_seconds histogram")
+        for kind, histogram in sorted(self.db_queries.items()):
+            lines += histogram.render(
+                "pantern_db_query_seconds", f'kind="{kind}"'
+            )
+        lines.append("# TYPE pantern_db_errors_total counter")
+        lines.append(f"pantern_db_errors_total {self.db_errors}")
+        lines.append("# TYPE pantern_rest_wait_seconds histogram")
+        for priority, histogram in sorted(self.rest_waits.items()):
+            lines += histogram.render(
+                "pantern_rest_wait_seconds", f'priority="{priority}"'
+            )
+        lines.append("# TYPE pantern_rest_coalesced_total counter")
+        lines.append(f"pantern_rest_coalesced_total {self.rest_coalesced}")
+        lines.append("# TYPE pantern_backup_duration_seconds gauge")
+        for db_file, (seconds, _) in sorted(self.backups.items()):
+            lines.append(
+                f'pantern_backup_duration_seconds{{database="{db_file}"}}'
+                + f" {seconds}"
+            )
+        lines.append("# TYPE pantern_backup_size_bytes gauge")
+        for db_file, (_, size) in sorted(self.backups.items()):
+            lines.append(
+                f'pantern_backup_size_bytes{{database="{db_file}"}} {size}'
+            )
+        lines.append("# TYPE pantern_backup_failures_total counter")
+        lines.append(f"pantern_backup_failures_total {self.backup_failures}")
+        typed: set[str] = set()
+        for name, value in gauges.items():
+            base_name = name.partition("{")[0]
+            if base_name not in typed:
+                typed.add(base_name)
+                lines.append(f"# TYPE {base_name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# The metrics of this process.
+metrics = Metrics()
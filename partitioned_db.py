@@ -0,0 +1,545 @@
+import argparse
+import asyncio
+import glob
+import itertools
+import logging
+import os
+import re
+import sqlite3
+from collections.abc import AsyncIterator, Iterator, Mapping
+from contextlib import closing
+from typing import final, override
+
+from db_handler import (
+    DEFAULT_SQLITE_PROFILE,
+    GUILD_TABLES,
+    ROLLUP_TABLES,
+    DBHandler,
+)
+from helpers import CogSetting, DrinkNameIndex, RoleMapping, RoleMappingIndex
+
+logger = logging.getLogger(__name__)
+
+
+def partition_file(db_file: str, index: int) -> str:
+    """The path of a partition, next to the main database file."""
+    root, ext = os.path.splitext(db_file)
+    return f"{root}.p{index}{ext}"
+
+
+def _existing_partition_files(db_file: str) -> list[str]:
+    root, ext = os.path.splitext(db_file)
+    # The glob also matches backups, should they be kept next to the
+    # database.
+    name = re.compile(re.escape(root) + r"\.p\d+" + re.escape(ext))
+    return [
+        path
+        for path in glob.glob(f"{glob.escape(root)}.p*{glob.escape(ext)}")
+        if name.fullmatch(path)
+    ]
+
+
+@final
+class _PartitionedDrinkNames(Mapping[int, DrinkNameIndex]):
+    """The drink name indexes of every partition, as one read only mapping.
+    Each partition keeps its own indexes up to date, this only looks up a
+    guild in the partition it lives in."""
+
+    def __init__(self, db: "PartitionedDBHandler") -> None:
+        self._db = db
+
+    @override
+    def __getitem__(self, guild_id: int) -> DrinkNameIndex:
+        return self._db.partition(guild_id).drink_names[guild_id]
+
+    @override
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(
+            partition.drink_names for partition in self._db.partitions
+        )
+
+    @override
+    def __len__(self) -> int:
+        return sum(
+            len(partition.drink_names) for partition in self._db.partitions
+        )
+
+
+@final
+class PartitionedDBHandler:
+    """
+    Spreads guilds over several database files, each with its own
+    connection pool and so its own writer. A burst of votes in one guild
+    only holds the write lock of its own partition, and the other guilds
+    keep writing to theirs.
+
+    Guilds are hashed into a fixed number of partitions, which live next to
+    the main database file as <name>.p<n>.sqlite. The main file keeps what
+    isn't tied to a guild, like role configs. Changing the number of
+    partitions moves guilds between them, so it can't be changed once
+    there is data; migrate_to_partitions splits a single file database.
+
+    Has the same methods as DBHandler and can be used in its place.
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        partitions: int,
+        profile: str = DEFAULT_SQLITE_PROFILE,
+    ) -> None:
+        """
+        Args:
+            db_file (str): Path to the main database file.
+            partitions (int): How many partitions to spread guilds over.
+            profile (str): Name of the SQLITE_PROFILES entry to use.
+
+        Throws:
+            ValueError: If partitions isn't positive, if other partitions
+                        already exist next to db_file or if there is no
+                        profile with that name.
+        """
+        if partitions < 1:
+            raise ValueError("Need at least one partition")
+        existing = len(_existing_partition_files(db_file))
+        if existing and existing != partitions:
+            raise ValueError(
+                f"{db_file} has {existing} partition(s), not {partitions}. "
+                + "The number of partitions can't be changed."
+            )
+        self.db_file = db_file
+        self.main = DBHandler(db_file, profile)
+        self.partitions: list[DBHandler] = [
+            DBHandler(partition_file(db_file, index), profile)
+            for index in range(partitions)
+        ]
+        self.profile_name = self.main.profile_name
+        self.drink_names: Mapping[int, DrinkNameIndex] = (
+            _PartitionedDrinkNames(self)
+        )
+
+    @property
+    def db_files(self) -> list[str]:
+        """Every database file, the main one first."""
+        return [self.main.db_file] + [
+            partition.db_file for partition in self.partitions
+        ]
+
+    @property
+    def role_mappings(self) -> RoleMappingIndex:
+        return self.main.role_mappings
+
+    def partition(self, guild_id: int) -> DBHandler:
+        """The partition holding a guild's data."""
+        return self.partitions[guild_id % len(self.partitions)]
+
+    @property
+    def _handlers(self) -> list[DBHandler]:
+        return [self.main, *self.partitions]
+
+    async def connect(self) -> None:
+        _ = await asyncio.gather(
+            *(handler.connect() for handler in self._handlers)
+        )
+
+    async def flush(self) -> None:
+        _ = await asyncio.gather(
+            *(handler.flush() for handler in self._handlers)
+        )
+
+    async def close(self) -> None:
+        _ = await asyncio.gather(
+            *(handler.close() for handler in self._handlers)
+        )
+
+    async def create_tables(self) -> None:
+        """
+        Initialize the main database and every partition.
+
+        Throws:
+            RuntimeError: If the main database still holds guild data, which
+                          has to be moved with migrate_to_partitions first.
+        """
+        for handler in self._handlers:
+            await handler.create_tables()
+        if await self.main.has_guild_data():
+            raise RuntimeError(
+                f"{self.db_file} still has guild data, split it into "
+                + "partitions with `uv run partitioned_db.py` first"
+            )
+
+    async def has_guild_data(self) -> bool:
+        return any(
+            await asyncio.gather(
+                *(handler.has_guild_data() for handler in self._handlers)
+            )
+        )
+
+    async def ping(self) -> bool:
+        return all(
+            await asyncio.gather(
+                *(handler.ping() for handler in self._handlers)
+            )
+        )
+
+    # ------------------------------------------------------
+
+    # Drink system:
+    async def get_drink_option_list(self, guild_id: int) -> list[str]:
+        return await self.partition(guild_id).get_drink_option_list(guild_id)
+
+    async def add_drink_option(self, guild_id: int, drink_name: str) -> None:
+        await self.partition(guild_id).add_drink_option(guild_id, drink_name)
+
+    async def remove_drink_option(
+        self, guild_id: int, drink_name: str
+    ) -> None:
+        await self.partition(guild_id).remove_drink_option(
+            guild_id, drink_name
+        )
+
+    async def add_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> list[str]:
+        return await self.partition(guild_id).add_drink_options(
+            guild_id, drink_names
+        )
+
+    async def remove_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> None:
+        await self.partition(guild_id).remove_drink_options(
+            guild_id, drink_names
+        )
+
+    async def load_drink_names(self) -> None:
+        _ = await asyncio.gather(
+            *(partition.load_drink_names() for partition in self.partitions)
+        )
+
+    async def set_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int, drink_name: str
+    ) -> bool:
+        return await self.partition(guild_id).set_drunk_drink(
+            guild_id, message_id, user_id, drink_name
+        )
+
+    async def remove_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int
+    ) -> None:
+        await self.partition(guild_id).remove_drunk_drink(
+            guild_id, message_id, user_id
+        )
+
+    async def get_tally(
+        self, message_id: int, guild_id: int
+    ) -> dict[str, list[int]]:
+        return await self.partition(guild_id).get_tally(message_id, guild_id)
+
+    async def get_all_tallies(self) -> list[tuple[int, int, int | None]]:
+        return [tally async for tally in self.iterate_all_tallies()]
+
+    async def iterate_all_tallies(
+        self,
+    ) -> AsyncIterator[tuple[int, int, int | None]]:
+        for partition in self.partitions:
+            async for tally in partition.iterate_all_tallies():
+                yield tally
+
+    async def get_latest_tally(self, guild_id: int) -> int | None:
+        return await self.partition(guild_id).get_latest_tally(guild_id)
+
+    async def count_tallies(self) -> int:
+        return sum(
+            await asyncio.gather(
+                *(partition.count_tallies() for partition in self.partitions)
+            )
+        )
+
+    async def create_tally(
+        self,
+        message_id: int,
+        guild_id: int,
+        channel_id: int | None = None,
+        closes_at: int | None = None,
+    ):
+        await self.partition(guild_id).create_tally(
+            message_id, guild_id, channel_id, closes_at
+        )
+
+    async def get_tally_deadlines(self) -> list[tuple[int, int]]:
+        deadlines = await asyncio.gather(
+            *(
+                partition.get_tally_deadlines()
+                for partition in self.partitions
+            )
+        )
+        return list(itertools.chain.from_iterable(deadlines))
+
+    async def count_votes(
+        self, tallies: list[tuple[int, int]]
+    ) -> dict[int, int]:
+        by_partition: dict[int, list[tuple[int, int]]] = {}
+        for guild_id, message_id in tallies:
+            by_partition.setdefault(
+                guild_id % len(self.partitions), []
+            ).append((guild_id, message_id))
+        counts = await asyncio.gather(
+            *(
+                self.partitions[index].count_votes(partition_tallies)
+                for index, partition_tallies in by_partition.items()
+            )
+        )
+        return {
+            message_id: count
+            for partition_counts in counts
+            for message_id, count in partition_counts.items()
+        }
+
+    async def remove_tally(self, message_id: int):
+        await self.remove_tallies([message_id])
+
+    async def remove_tallies(self, message_ids: list[int]) -> None:
+        # Tallies are only known by message id here, so every partition
+        # deletes them. The deletes go through the message_id index, and
+        # tallies are closed far less often than they are voted on.
+        _ = await asyncio.gather(
+            *(
+                partition.remove_tallies(message_ids)
+                for partition in self.partitions
+            )
+        )
+
+    async def get_drink_stats(
+        self, guild_id: int, start: int, end: int, hourly: bool = False
+    ) -> dict[str, int]:
+        return await self.partition(guild_id).get_drink_stats(
+            guild_id, start, end, hourly
+        )
+
+    async def get_user_drink_stats(
+        self, guild_id: int, user_id: int
+    ) -> dict[str, int]:
+        return await self.partition(guild_id).get_user_drink_stats(
+            guild_id, user_id
+        )
+
+    async def get_drink_history(
+        self,
+        guild_id: int,
+        user_id: int,
+        limit: int,
+        before: int | None = None,
+    ) -> tuple[list[tuple[str, int | None]], int | None]:
+        return await self.partition(guild_id).get_drink_history(
+            guild_id, user_id, limit, before
+        )
+
+    # ------------------------------------------------------
+    # role config system, role configs aren't tied to a guild so they live
+    # in the main database:
+    async def create_role_config(
+        self, message_id: int, role_id: str, discord_role_id: int
+    ) -> None:
+        await self.main.create_role_config(
+            message_id, role_id, discord_role_id
+        )
+
+    async def update_role_config(
+        self, message_id: int, discord_role_id: int
+    ) -> None:
+        await self.main.update_role_config(message_id, discord_role_id)
+
+    async def remove_role_config(self, message_id: int) -> None:
+        await self.main.remove_role_config(message_id)
+
+    async def load_role_mappings(self) -> RoleMappingIndex:
+        return await self.main.load_role_mappings()
+
+    async def get_config_messages(self) -> list[RoleMapping]:
+        return await self.main.get_config_messages()
+
+    async def iterate_config_messages(self) -> AsyncIterator[RoleMapping]:
+        async for mapping in self.main.iterate_config_messages():
+            yield mapping
+
+    # ------------------------------------------------------
+    # settings system:
+    async def set_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None:
+        await self.partition(guild_id).set_setting(
+            guild_id, cog, setting_name, value
+        )
+
+    async def update_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None:
+        await self.partition(guild_id).update_setting(
+            guild_id, cog, setting_name, value
+        )
+
+    async def get_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str
+    ) -> str | None:
+        return await self.partition(guild_id).get_setting(
+            guild_id, cog, setting_name
+        )
+
+    async def get_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> dict[int, str] | None:
+        return_dict: dict[int, str] = {
+            guild_id: value
+            async for guild_id, value in self.iterate_settings(
+                cog, setting_name
+            )
+        }
+        if not return_dict:
+            return None
+        return return_dict
+
+    async def iterate_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> AsyncIterator[tuple[int, str]]:
+        for partition in self.partitions:
+            async for setting in partition.iterate_settings(
+                cog, setting_name
+            ):
+                yield setting
+
+
+def _table_columns(conn: sqlite3.Connection, schema: str, table: str) -> str:
+    columns = conn.execute(f"PRAGMA {schema}.table_info({table});").fetchall()
+    return ", ".join(f'"{column[1]}"' for column in columns)
+
+
+def _count_rows(db_file: str) -> dict[str, int]:
+    with closing(sqlite3.connect(db_file)) as conn:
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+            for table in GUILD_TABLES
+        }
+
+
+def _copy_partition(
+    source_file: str, target_file: str, index: int, partitions: int
+) -> None:
+    """Copy the guilds that hash to a partition into it, in one
+    transaction. Row ids are kept, so votes still point at their drinks."""
+    with closing(sqlite3.connect(target_file)) as conn:
+        # Hashed in Python rather than SQL so it can't disagree with
+        # PartitionedDBHandler.partition, SQLite's % keeps the sign.
+        conn.create_function(
+            "partition_of",
+            1,
+            lambda guild_id: guild_id % partitions,
+            deterministic=True,
+        )
+        _ = conn.execute("PRAGMA foreign_keys = ON;")
+        _ = conn.execute("ATTACH DATABASE ? AS source;", (source_file,))
+        with conn:
+            for table in GUILD_TABLES:
+                if table in ROLLUP_TABLES:
+                    # Copying the votes filled these in from the votes that
+                    # are left, the source also has the history of closed
+                    # tallies and removed drinks.
+                    _ = conn.execute(f"DELETE FROM {table};")
+                columns = _table_columns(conn, "source", table)
+                _ = conn.execute(
+                    f"""
+                    INSERT INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table}
+                    WHERE partition_of(guild_id) = ?;
+                    """,
+                    (index,),
+                )
+        _ = conn.execute("DETACH DATABASE source;")
+
+
+def _clear_guild_data(db_file: str) -> None:
+    """Remove the guild data that was moved into partitions from the main
+    database, in one transaction, and give the space back."""
+    with closing(sqlite3.connect(db_file)) as conn:
+        with conn:
+            for table in GUILD_TABLES:
+                _ = conn.execute(f"DELETE FROM {table};")
+        _ = conn.execute("VACUUM;")
+
+
+async def migrate_to_partitions(
+    db_file: str, partitions: int, profile: str = DEFAULT_SQLITE_PROFILE
+) -> dict[str, int]:
+    """
+    Splits a single file database into partitions. The main database is
+    brought up to date first, then every partition is filled in its own
+    transaction. The guild data is only removed from the main database once
+    every row has been found in a partition, so if anything goes wrong the
+    main database still has everything and the partitions can be deleted.
+    Don't run this while the bot is running.
+
+    Args:
+        db_file (str): Path to the database file.
+        partitions (int): How many partitions to spread guilds over.
+        profile (str): Name of the SQLITE_PROFILES entry to use.
+
+    Returns:
+        dict[str, int]: How many rows of each table were moved.
+
+    Throws:
+        ValueError: If the database is already partitioned.
+        RuntimeError: If rows went missing while copying.
+    """
+    if _existing_partition_files(db_file):
+        raise ValueError(f"{db_file} is already partitioned")
+    await DBHandler(db_file, profile).create_tables()
+    db = PartitionedDBHandler(db_file, partitions, profile)
+    for partition in db.partitions:
+        await partition.create_tables()
+
+    for index, partition in enumerate(db.partitions):
+        await asyncio.to_thread(
+            _copy_partition, db_file, partition.db_file, index, partitions
+        )
+        logger.info("filled partition %s", partition.db_file)
+
+    expected = await asyncio.to_thread(_count_rows, db_file)
+    copied = dict.fromkeys(GUILD_TABLES, 0)
+    for partition in db.partitions:
+        for table, count in (
+            await asyncio.to_thread(_count_rows, partition.db_file)
+        ).items():
+            copied[table] += count
+    if copied != expected:
+        raise RuntimeError(
+            f"Rows went missing, expected {expected} but copied {copied}"
+        )
+
+    await asyncio.to_thread(_clear_guild_data, db_file)
+    return copied
+
+
+if __name__ == "__main__":
+    from os import environ
+
+    from dotenv import load_dotenv
+
+    _ = load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Split a single file database into partitions."
+    )
+    _ = parser.add_argument("partitions", type=int)
+    _ = parser.add_argument("--db-file", default=environ.get("DB_FILE"))
+    _ = parser.add_argument(
+        "--profile",
+        default=environ.get("SQLITE_PROFILE", DEFAULT_SQLITE_PROFILE),
+    )
+    args = parser.parse_args()
+    if not args.db_file:
+        parser.error("set DB_FILE or pass --db-file")
+    logging.basicConfig(level=logging.INFO)
+    moved = asyncio.run(
+        migrate_to_partitions(args.db_file, args.partitions, args.profile)
+    )
+    for table, count in moved.items():
+        print(f"{table:<20} {count} row(s)")
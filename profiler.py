@@ -0,0 +1,97 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import final
+
+# Seconds between stack samples.
+SAMPLE_INTERVAL = 0.005
+# How many functions to include in the cumulative stats.
+STATS_LIMIT = 60
+
+
+@final
+class StackSampler:
+    """
+    Samples the stack of one thread from a background thread and counts
+    how often each stack is seen, for flame graphs.
+    """
+
+    def __init__(
+        self, thread_id: int, interval: float = SAMPLE_INTERVAL
+    ) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame:
+                self.stacks[_collapse(frame)] += 1
+
+    def collapsed(self) -> str:
+        """The samples in collapsed stack format, one stack per line."""
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+
+def _collapse(frame: FrameType | None) -> str:
+    """Turn a frame and its callers into "outer;...;inner"."""
+    names: list[str] = []
+    while frame:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}"
+            + f":{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+async def profile_loop(seconds: float) -> tuple[str, str]:
+    """
+    Profiles everything that runs on the event loop for a while. Nothing is
+    hooked in before or after, so there's no overhead outside of this call.
+
+    Args:
+        seconds (float): How long to profile for.
+
+    Returns:
+        tuple[str, str]: The cumulative stats, and the sampled stacks in
+                         collapsed stack format.
+    """
+    profile = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    profile.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+        sampler.stop()
+
+    stats = io.StringIO()
+    _ = (
+        pstats.Stats(profile, stream=stats)
+        .sort_stats(pstats.SortKey.CUMULATIVE)
+        .print_stats(STATS_LIMIT)
+    )
+    return stats.getvalue(), sampler.collapsed()
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+from typing import Any, final
+
+from metrics import metrics
+
+# Most background requests (anything but interaction responses) in flight
+# at once.
+MAX_IN_FLIGHT = 4
+# Extra requests interaction responses may have in flight on top of that,
+# so they never wait for background requests to finish.
+INTERACTION_RESERVE = 4
+
+
+class Priority(IntEnum):
+    """Order outgoing requests are sent in, lowest first."""
+
+    # Responses and followups to interactions, users are waiting on these.
+    INTERACTION = 0
+    # Background work that has to happen, like role edits and syncs.
+    NORMAL = 1
+    # Message edits that only change how something looks. Coalesced, so
+    # only the latest edit of a message is sent.
+    COSMETIC = 2
+
+
+@final
+class _Request:
+    def __init__(
+        self,
+        priority: Priority,
+        call: Callable[[], Awaitable[Any]],
+        key: int | None,
+    ) -> None:
+        self.priority = priority
+        self.call = call
+        self.key = key
+        self.queued_at = time.perf_counter()
+        self.future: asyncio.Future[Any] = (
+            asyncio.get_running_loop().create_future()
+        )
+
+
+@final
+class RestScheduler:
+    """
+    Sends outgoing Discord requests in priority order. Background requests
+    share a small number of slots, so a storm of edits can only ever hold
+    a few of discord.py's rate limit slots and leaves room for interaction
+    responses, which also get reserved slots of their own. Cosmetic edits
+    to the same message are coalesced while they wait.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        interaction_reserve: int = INTERACTION_RESERVE,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.interaction_reserve = interaction_reserve
+        self.in_flight = 0
+        self.coalesced = 0
+        # (priority, sequence, request)
+        self._queue: list[tuple[int, int, _Request]] = []
+        self._sequence = itertools.count()
+        # key: queued cosmetic edit of that message
+        self._pending_edits: dict[int, _Request] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def run[T](
+        self, priority: Priority, call: Callable[[], Awaitable[T]]
+    ) -> T:
+        """
+        Send a request once its turn comes up.
+
+        Args:
+            priority (Priority): How urgent the request is.
+            call (Callable): Makes the request when called.
+
+        Returns:
+            T: What the request returned.
+        """
+        request = _Request(priority, call, None)
+        self._enqueue(request)
+        return await request.future
+
+    async def edit[T](
+        self, message_id: int, call: Callable[[], Awaitable[T]]
+    ) -> T:
+        """
+        Send a cosmetic edit of a message. If an edit of the message is
+        already waiting it is replaced by this one, and both callers get
+        the result of this edit.
+
+        Args:
+            message_id (int): The message being edited.
+            call (Callable): Makes the edit when called.
+
+        Returns:
+            T: What the edit that was sent returned.
+        """
+        pending = self._pending_edits.get(message_id)
+        if pending:
+            pending.call = call
+            self.coalesced += 1
+            metrics.rest_coalesced += 1
+            return await asyncio.shield(pending.future)
+        request = _Request(Priority.COSMETIC, call, message_id)
+        self._pending_edits[message_id] = request
+        self._enqueue(request)
+        return await asyncio.shield(request.future)
+
+    def depth(self) -> dict[str, int]:
+        """How many requests of each priority are waiting."""
+        depths = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, _ in self._queue:
+            depths[Priority(priority).name.lower()] += 1
+        return depths
+
+    def _enqueue(self, request: _Request) -> None:
+        heapq.heappush(
+            self._queue, (request.priority, next(self._sequence), request)
+        )
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queue:
+            priority, _, request = self._queue[0]
+            limit = self.max_in_flight
+            if priority == Priority.INTERACTION:
+                limit += self.interaction_reserve
+            if self.in_flight >= limit:
+                return
+            _ = heapq.heappop(self._queue)
+            if request.key is not None:
+                del self._pending_edits[request.key]
+            self.in_flight += 1
+            metrics.observe_rest_wait(
+                request.priority.name.lower(),
+                time.perf_counter() - request.queued_at,
+            )
+            task = asyncio.create_task(self._send(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, request: _Request) -> None:
+        try:
+            result = await request.call()
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self._dispatch()
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Protocol, final
+
+import discord
+
+from helpers import RoleMapping
+from rest_scheduler import Priority, RestScheduler
+
+logger = logging.getLogger(__name__)
+
+# Default amount of member edits to have in flight at the same time.
+SYNC_WORKERS = 4
+# Default upper bound on member edits sent per second. discord.py still
+# handles the actual rate limit buckets, this just keeps us from running
+# into them (and starving the rest of the bot) in the first place.
+SYNC_EDITS_PER_SECOND = 5.0
+# How often (in seconds) progress is reported while a sync is running.
+PROGRESS_INTERVAL = 5.0
+
+
+class RoleSource(Protocol):
+    """Somewhere to read the wanted role membership from."""
+
+    async def get_role_members(self) -> dict[str, set[int]]:
+        """
+        Gets who should have which external role.
+
+        Returns:
+            dict[str, set[int]]: A dict mapping external (LDAP) role ids to
+            the discord user ids that should have that role.
+        """
+        ...
+
+
+@final
+class JsonRoleSource:
+    """
+    Reads role membership from a json file of the form
+    {"<LDAP role id>": [<discord user id>, ...]}. Stand-in until we can talk
+    to LDAP directly.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    async def get_role_members(self) -> dict[str, set[int]]:
+        return await asyncio.to_thread(self._read)
+
+    def _read(self) -> dict[str, set[int]]:
+        with open(self.path, encoding="utf-8") as file:
+            raw: dict[str, list[int]] = json.load(file)
+        return {
+            role_id: {int(user_id) for user_id in user_ids}
+            for role_id, user_ids in raw.items()
+        }
+
+
+@final
+class RoleEdit:
+    """The roles that need to change for a single member."""
+
+    def __init__(
+        self, member_id: int, add: set[int], remove: set[int]
+    ) -> None:
+        self.member_id = member_id
+        self.add = add
+        self.remove = remove
+
+
+@final
+class SyncReport:
+    """Progress and timing of a role sync."""
+
+    def __init__(self, member_count: int, edits: list[RoleEdit]) -> None:
+        self.member_count = member_count
+        self.planned = len(edits)
+        self.roles_added = sum(len(edit.add) for edit in edits)
+        self.roles_removed = sum(len(edit.remove) for edit in edits)
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds since the sync started, or how long it took if done."""
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at
+
+    def __str__(self) -> str:
+        state = "done" if self.finished_at else "running"
+        return (
+            f"Role sync {state}: {self.done + self.failed}/{self.planned} "
+            + f"members edited ({self.failed} failed) out of "
+            + f"{self.member_count} checked, +{self.roles_added} "
+            + f"-{self.roles_removed} roles in {self.duration:.1f}s"
+        )
+
+
+def diff_roles(
+    current: dict[int, set[int]],
+    desired: dict[int, set[int]],
+    managed: set[int],
+) -> list[RoleEdit]:
+    """
+    Works out the smallest set of edits that brings every member's managed
+    roles in line with the wanted ones. Roles that aren't managed by the sync
+    are never touched, and members that are already correct get no edit.
+
+    Args:
+        current (dict[int, set[int]]): Member id to the discord role ids they
+                                       currently have.
+        desired (dict[int, set[int]]): Member id to the managed discord role
+                                       ids they should have.
+        managed (set[int]): The discord role ids that the sync manages.
+
+    Returns:
+        list[RoleEdit]: One edit per member that needs changes.
+    """
+    edits: list[RoleEdit] = []
+    for member_id, roles in current.items():
+        have = roles & managed
+        want = desired.get(member_id, set()) & managed
+        if have != want:
+            edits.append(RoleEdit(member_id, want - have, have - want))
+    return edits
+
+
+def desired_discord_roles(
+    role_members: dict[str, set[int]], mappings: list[RoleMapping]
+) -> dict[int, set[int]]:
+    """
+    Translates external role membership into discord role membership.
+
+    Args:
+        role_members (dict[str, set[int]]): External role id to the discord
+                                            user ids that have it.
+        mappings (list[RoleMapping]): The external to discord role mappings.
+
+    Returns:
+        dict[int, set[int]]: Member id to the discord role ids they should
+        have.
+    """
+    desired: dict[int, set[int]] = {}
+    for mapping in mappings:
+        for user_id in role_members.get(mapping.role_id, set()):
+            desired.setdefault(user_id, set()).add(mapping.discord_role_id)
+    return desired
+
+
+@final
+class _RateLimiter:
+    """Spaces out calls so no more than per_second go through each second."""
+
+    def __init__(self, per_second: float) -> None:
+        self._interval = 1 / per_second
+        self._next = 0.0
+
+    async def wait(self) -> None:
+        now = time.monotonic()
+        delay = self._next - now
+        self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@final
+class RoleSyncer:
+    def __init__(
+        self,
+        source: RoleSource,
+        workers: int = SYNC_WORKERS,
+        edits_per_second: float = SYNC_EDITS_PER_SECOND,
+        rest: RestScheduler | None = None,
+    ) -> None:
+        self.source = source
+        self.workers = workers
+        self.edits_per_second = edits_per_second
+        # Member edits go through the scheduler when given, so they queue
+        # behind interaction responses.
+        self.rest = rest
+
+    async def sync_guild(
+        self,
+        guild: discord.Guild,
+        mappings: list[RoleMapping],
+        progress: Callable[[SyncReport], Awaitable[None]] | None = None,
+    ) -> SyncReport:
+        """
+        Syncs the roles of every member in a guild with the role source.
+        Only mappings whose discord role exists in the guild are used.
+
+        Args:
+            guild (discord.Guild): The guild to sync.
+            mappings (list[RoleMapping]): All role mappings.
+            progress (Callable): Called with the report every
+                                 PROGRESS_INTERVAL seconds while running.
+                                 The last call has finished by the time
+                                 this returns.
+
+        Returns:
+            SyncReport: The final report of the sync.
+        """
+        guild_mappings = [
+            mapping
+            for mapping in mappings
+            if guild.get_role(mapping.discord_role_id)
+        ]
+        managed = {mapping.discord_role_id for mapping in guild_mappings}
+        desired = desired_discord_roles(
+            await self.source.get_role_members(), guild_mappings
+        )
+        if not guild.chunked:
+            _ = await guild.chunk()
+        current = {
+            member.id: {role.id for role in member.roles}
+            for member in guild.members
+        }
+        edits = diff_roles(current, desired, managed)
+        report = SyncReport(len(current), edits)
+
+        queue: asyncio.Queue[RoleEdit] = asyncio.Queue()
+        for edit in edits:
+            queue.put_nowait(edit)
+        limiter = _RateLimiter(self.edits_per_second)
+        workers = [
+            asyncio.create_task(self._worker(guild, queue, limiter, report))
+            for _ in range(min(self.workers, len(edits)))
+        ]
+        stop_reporting = asyncio.Event()
+        reporter = (
+            asyncio.create_task(
+                self._report_progress(report, progress, stop_reporting)
+            )
+            if progress
+            else None
+        )
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                _ = worker.cancel()
+            if reporter:
+                # Let a progress update that is being sent finish, so it
+                # can't land after whatever the caller reports next.
+                stop_reporting.set()
+                await reporter
+        report.finished_at = time.monotonic()
+        return report
+
+    async def _worker(
+        self,
+        guild: discord.Guild,
+        queue: asyncio.Queue[RoleEdit],
+        limiter: _RateLimiter,
+        report: SyncReport,
+    ) -> None:
+        while True:
+            edit = await queue.get()
+            try:
+                member = guild.get_member(edit.member_id)
+                if member:
+                    await limiter.wait()
+                    await self._apply(guild, member, edit)
+                report.done += 1
+            except discord.HTTPException as e:
+                logger.warning(
+                    "Failed to sync roles for %s: %s", edit.member_id, e
+                )
+                report.failed += 1
+            except Exception:
+                # Keep the worker alive, or queue.join() never returns.
+                logger.exception(
+                    "Unexpected error syncing roles for %s", edit.member_id
+                )
+                report.failed += 1
+            finally:
+                queue.task_done()
+
+    async def _apply(
+        self, guild: discord.Guild, member: discord.Member, edit: RoleEdit
+    ) -> None:
+        # A single member edit with the full role list covers both adding
+        # and removing, instead of one request per changed role.
+        roles = [
+            role
+            for role in member.roles
+            if not role.is_default() and role.id not in edit.remove
+        ]
+        for role_id in edit.add:
+            role = guild.get_role(role_id)
+            if role:
+                roles.append(role)
+        if self.rest:
+            _ = await self.rest.run(
+                Priority.NORMAL,
+                lambda: member.edit(roles=roles, reason="Role sync"),
+            )
+        else:
+            _ = await member.edit(roles=roles, reason="Role sync")
+
+    async def _report_progress(
+        self,
+        report: SyncReport,
+        progress: Callable[[SyncReport], Awaitable[None]],
+        stop: asyncio.Event,
+    ) -> None:
+        while True:
+            try:
+                _ = await asyncio.wait_for(stop.wait(), PROGRESS_INTERVAL)
+                return
+            except TimeoutError:
+                pass
+            try:
+                await progress(report)
+            except discord.HTTPException as e:
+                logger.warning("Failed to report role sync progress: %s", e)
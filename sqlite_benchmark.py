@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections.abc import Awaitable
+
+from db_handler import SQLITE_PROFILES
+from storage import open_database
+
+# Drinks on offer in every benchmark guild.
+DRINKS = [f"drink {i}" for i in range(20)]
+
+
+async def _timed(coros: list[Awaitable[object]]) -> float:
+    """Run coroutines concurrently, returning how many finished a second."""
+    start = time.perf_counter()
+    _ = await asyncio.gather(*coros)
+    return len(coros) / (time.perf_counter() - start)
+
+
+async def benchmark_profile(
+    profile: str, guilds: int, votes: int, reads: int, partitions: int = 0
+) -> dict[str, float]:
+    """
+    Runs our workload against a fresh database using one profile: a burst
+    of votes spread over a tally per guild, followed by the reads that
+    commands do. The votes are sent all at once, like when everyone picks a
+    drink at the end of a sittning.
+
+    Returns:
+        dict[str, float]: Operations per second for each part of the
+                          workload.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(
+            os.path.join(directory, "benchmark.sqlite"), partitions, profile
+        )
+        await db.create_tables()
+        await db.connect()
+        try:
+            for guild_id in range(guilds):
+                _ = await db.add_drink_options(guild_id, DRINKS)
+                await db.create_tally(guild_id, guild_id)
+
+            rng = random.Random(0)
+            results = {
+                "votes": await _timed(
+                    [
+                        db.set_drunk_drink(
+                            vote % guilds,
+                            vote % guilds,
+                            vote,
+                            rng.choice(DRINKS),
+                        )
+                        for vote in range(votes)
+                    ]
+                ),
+                "changed votes": await _timed(
+                    [
+                        db.set_drunk_drink(
+                            vote % guilds,
+                            vote % guilds,
+                            vote,
+                            rng.choice(DRINKS),
+                        )
+                        for vote in range(0, votes, 2)
+                    ]
+                ),
+                "tally reads": await _timed(
+                    [
+                        db.get_tally(read % guilds, read % guilds)
+                        for read in range(reads)
+                    ]
+                ),
+                "stats reads": await _timed(
+                    [
+                        db.get_drink_stats(read % guilds, 0, 2**40)
+                        for read in range(reads)
+                    ]
+                ),
+            }
+        finally:
+            await db.close()
+    return results
+
+
+async def main(guilds: int, votes: int, reads: int, partitions: int) -> None:
+    for profile in SQLITE_PROFILES:
+        results = await benchmark_profile(
+            profile, guilds, votes, reads, partitions
+        )
+        print(
+            f"{profile:<12}"
+            + "".join(
+                f"{name}: {rate:>8.0f}/s  " for name, rate in results.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the SQLite profiles on the drink workload."
+    )
+    _ = parser.add_argument("--guilds", type=int, default=10)
+    _ = parser.add_argument("--votes", type=int, default=2000)
+    _ = parser.add_argument("--reads", type=int, default=2000)
+    _ = parser.add_argument(
+        "--partitions",
+        type=int,
+        default=0,
+        help="Spread the guilds over this many database files.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args.guilds, args.votes, args.reads, args.partitions))
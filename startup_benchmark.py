@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, final, override
+
+import discord
+
+from bot import EARLY_LOAD_EXTENSIONS, LATE_LOAD_EXTENSIONS, PanternBot
+from config import Config
+from helpers import CogSetting
+from storage import open_database
+
+# Open tallies per configured guild in the seeded databases.
+TALLIES_PER_GUILD = 10
+# Drinks on offer in every seeded guild.
+DRINKS = [f"drink {i}" for i in range(10)]
+# Startup may grow at most this fast with the amount of data: 1 is linear,
+# 2 quadratic. Fixed costs make small databases start slower than linear
+# would predict, so some leeway above 1 only catches real superlinear
+# growth.
+MAX_GROWTH_EXPONENT = 1.3
+# Default budgets for the largest database.
+DEFAULT_TIME_BUDGET = 5.0
+DEFAULT_MEMORY_BUDGET_MIB = 256.0
+DEFAULT_TALLIES = [500, 1000, 2000, 4000]
+
+
+@final
+class _StandInGuild:
+    """Just enough of a guild for the cogs to find config messages in."""
+
+    def __init__(self, bot: PanternBot, guild_id: int) -> None:
+        self._bot = bot
+        self.id = guild_id
+
+    def get_channel_or_thread(
+        self, channel_id: int
+    ) -> discord.PartialMessageable:
+        return self._bot.get_partial_messageable(
+            channel_id, guild_id=self.id
+        )
+
+
+@final
+class _StartupBot(PanternBot):
+    """A bot that never connects, with stand-ins for the guilds the late
+    cogs look up."""
+
+    @override
+    def get_guild(self, id: int, /) -> Any:
+        return _StandInGuild(self, id)
+
+
+@final
+class StartupResult:
+    """How long starting up with an amount of data took and what it used."""
+
+    def __init__(
+        self, tallies: int, guilds: int, seconds: float, peak_memory: int
+    ) -> None:
+        self.tallies = tallies
+        self.guilds = guilds
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+
+    def __str__(self) -> str:
+        return (
+            f"{self.tallies:>8} tallies {self.guilds:>6} guilds "
+            + f"{self.seconds:>8.3f}s "
+            + f"{self.peak_memory / 1024 / 1024:>8.1f} MiB peak"
+        )
+
+
+async def seed_database(db_file: str, tallies: int, partitions: int) -> int:
+    """
+    Fills a database with open tallies spread over configured guilds, each
+    with drinks, a config message, a role config and votes on its first
+    tally. Half of the tallies close on their own, far in the future.
+
+    Returns:
+        int: How many guilds were seeded.
+    """
+    db = open_database(db_file, partitions)
+    await db.create_tables()
+    await db.connect()
+    guilds = max(tallies // TALLIES_PER_GUILD, 1)
+    closes_at = int(time.time()) + 365 * 24 * 60 * 60
+    message_ids = range(guilds + 1, guilds + 1 + tallies)
+    try:
+        for guild_id in range(1, guilds + 1):
+            _ = await db.add_drink_options(guild_id, DRINKS)
+            await db.set_setting(
+                guild_id,
+                CogSetting.CONFIGURE_DRINKS_HANDLER,
+                "config_message",
+                f"{guild_id}|{guild_id}",
+            )
+            await db.create_role_config(guild_id, f"role {guild_id}", guild_id)
+        # Tallies go round robin over the guilds, the channel id being the
+        # guild id.
+        _ = await asyncio.gather(
+            *(
+                db.create_tally(
+                    message_id,
+                    message_id % guilds + 1,
+                    message_id % guilds + 1,
+                    closes_at if message_id % 2 else None,
+                )
+                for message_id in message_ids
+            )
+        )
+        _ = await asyncio.gather(
+            *(
+                db.set_drunk_drink(
+                    message_id % guilds + 1,
+                    message_id,
+                    user_id,
+                    DRINKS[user_id],
+                )
+                for message_id in message_ids[:guilds]
+                for user_id in range(len(DRINKS))
+            )
+        )
+    finally:
+        await db.close()
+    return guilds
+
+
+async def measure_startup(
+    db_file: str, partitions: int, trace_memory: bool
+) -> tuple[float, int]:
+    """
+    Starts a bot against a database up to the point it would be ready:
+    setup_hook, which loads the early cogs, followed by the late cogs that
+    are loaded once connected.
+
+    Args:
+        db_file (str): The seeded database.
+        partitions (int): How many partitions the database has.
+        trace_memory (bool): Measure the peak memory, which slows startup
+                             down, so the time isn't meaningful then.
+
+    Returns:
+        tuple[float, int]: Seconds to ready, and the peak memory allocated
+        in bytes if traced.
+
+    Throws:
+        RuntimeError: If a cog failed to load.
+    """
+    bot = _StartupBot(
+        Config(token="", db_file=db_file, db_partitions=partitions), "!"
+    )
+    # Entering the bot sets up its event loop without logging in.
+    async with bot:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        await bot.setup_hook()
+        await bot.load_extensions(LATE_LOAD_EXTENSIONS)
+        seconds = time.perf_counter() - start
+        peak_memory = 0
+        if trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        missing = set(EARLY_LOAD_EXTENSIONS + LATE_LOAD_EXTENSIONS) - set(
+            bot.extensions
+        )
+        if missing:
+            raise RuntimeError(f"Failed to load {', '.join(sorted(missing))}")
+    return seconds, peak_memory
+
+
+async def benchmark_startup(
+    tallies: int, partitions: int = 0
+) -> StartupResult:
+    """Seed a fresh database with an amount of tallies and measure starting
+    up against it."""
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, "startup.sqlite")
+        guilds = await seed_database(db_file, tallies, partitions)
+        seconds, _ = await measure_startup(db_file, partitions, False)
+        _, peak_memory = await measure_startup(db_file, partitions, True)
+    return StartupResult(tallies, guilds, seconds, peak_memory)
+
+
+def growth_exponent(results: list[StartupResult]) -> float:
+    """
+    How startup time grows with the number of tallies, as the slope of a
+    least squares fit on a log-log scale: about 1 when it grows linearly,
+    2 when quadratically.
+    """
+    xs = [math.log(result.tallies) for result in results]
+    ys = [math.log(result.seconds) for result in results]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum(
+        (x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)
+    ) / sum((x - x_mean) ** 2 for x in xs)
+
+
+async def main(
+    tallies: list[int],
+    partitions: int,
+    time_budget: float,
+    memory_budget_mib: float,
+) -> bool:
+    results: list[StartupResult] = []
+    for count in sorted(tallies):
+        result = await benchmark_startup(count, partitions)
+        print(result)
+        results.append(result)
+
+    passed = True
+    if len(results) > 1:
+        exponent = growth_exponent(results)
+        print(f"startup grows with tallies^{exponent:.2f}")
+        if exponent > MAX_GROWTH_EXPONENT:
+            print(f"FAIL: grows faster than tallies^{MAX_GROWTH_EXPONENT}")
+            passed = False
+    largest = results[-1]
+    if largest.seconds > time_budget:
+        print(f"FAIL: took over the {time_budget}s budget")
+        passed = False
+    if largest.peak_memory > memory_budget_mib * 1024 * 1024:
+        print(f"FAIL: used over the {memory_budget_mib} MiB budget")
+        passed = False
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure how startup scales with stored tallies and "
+        + "guilds, failing if it grows superlinearly or goes over budget."
+    )
+    _ = parser.add_argument(
+        "--tallies", type=int, nargs="+", default=DEFAULT_TALLIES
+    )
+    _ = parser.add_argument("--partitions", type=int, default=0)
+    _ = parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=DEFAULT_TIME_BUDGET,
+        help="Most seconds the largest database may take to start.",
+    )
+    _ = parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=DEFAULT_MEMORY_BUDGET_MIB,
+        help="Most MiB the largest database may allocate while starting.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(
+        0
+        if asyncio.run(
+            main(
+                args.tallies,
+                args.partitions,
+                args.time_budget,
+                args.memory_budget,
+            )
+        )
+        else 1
+    )
@@ -0,0 +1,184 @@
+from collections.abc import AsyncIterator, Mapping
+from typing import Protocol
+
+from db_handler import DEFAULT_SQLITE_PROFILE, DBHandler
+from helpers import CogSetting, DrinkNameIndex, RoleMapping, RoleMappingIndex
+from in_memory_db import InMemoryDBHandler
+from partitioned_db import PartitionedDBHandler
+
+# DB_FILE value that keeps everything in memory instead of in SQLite.
+IN_MEMORY_DB_FILE = ":memory:"
+
+
+class Storage(Protocol):
+    """
+    What the cogs need from storage. DBHandler keeps it in a SQLite file,
+    PartitionedDBHandler spreads it over several and InMemoryDBHandler
+    keeps it in dicts. See DBHandler for what each method does; every
+    implementation has to pass the checks in test_storage.py.
+    """
+
+    @property
+    def db_files(self) -> list[str]:
+        """Every database file, for backups."""
+        ...
+
+    @property
+    def drink_names(self) -> Mapping[int, DrinkNameIndex]:
+        """Drink names per guild for autocomplete, kept up to date by the
+        drink option methods once load_drink_names has run."""
+        ...
+
+    @property
+    def role_mappings(self) -> RoleMappingIndex:
+        """Every role mapping, kept up to date by the role config methods
+        once load_role_mappings has run."""
+        ...
+
+    async def connect(self) -> None: ...
+
+    async def flush(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def create_tables(self) -> None: ...
+
+    async def has_guild_data(self) -> bool: ...
+
+    async def ping(self) -> bool: ...
+
+    # Drink system:
+    async def get_drink_option_list(self, guild_id: int) -> list[str]: ...
+
+    async def add_drink_option(
+        self, guild_id: int, drink_name: str
+    ) -> None: ...
+
+    async def remove_drink_option(
+        self, guild_id: int, drink_name: str
+    ) -> None: ...
+
+    async def add_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> list[str]: ...
+
+    async def remove_drink_options(
+        self, guild_id: int, drink_names: list[str]
+    ) -> None: ...
+
+    async def load_drink_names(self) -> None: ...
+
+    async def set_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int, drink_name: str
+    ) -> bool: ...
+
+    async def remove_drunk_drink(
+        self, guild_id: int, message_id: int, user_id: int
+    ) -> None: ...
+
+    async def get_tally(
+        self, message_id: int, guild_id: int
+    ) -> dict[str, list[int]]: ...
+
+    async def get_all_tallies(self) -> list[tuple[int, int, int | None]]: ...
+
+    def iterate_all_tallies(
+        self,
+    ) -> AsyncIterator[tuple[int, int, int | None]]: ...
+
+    async def get_latest_tally(self, guild_id: int) -> int | None: ...
+
+    async def count_tallies(self) -> int: ...
+
+    async def create_tally(
+        self,
+        message_id: int,
+        guild_id: int,
+        channel_id: int | None = None,
+        closes_at: int | None = None,
+    ) -> None: ...
+
+    async def get_tally_deadlines(self) -> list[tuple[int, int]]: ...
+
+    async def count_votes(
+        self, tallies: list[tuple[int, int]]
+    ) -> dict[int, int]: ...
+
+    async def remove_tally(self, message_id: int) -> None: ...
+
+    async def remove_tallies(self, message_ids: list[int]) -> None: ...
+
+    async def get_drink_stats(
+        self, guild_id: int, start: int, end: int, hourly: bool = False
+    ) -> dict[str, int]: ...
+
+    async def get_user_drink_stats(
+        self, guild_id: int, user_id: int
+    ) -> dict[str, int]: ...
+
+    async def get_drink_history(
+        self,
+        guild_id: int,
+        user_id: int,
+        limit: int,
+        before: int | None = None,
+    ) -> tuple[list[tuple[str, int | None]], int | None]: ...
+
+    # Role config system:
+    async def create_role_config(
+        self, message_id: int, role_id: str, discord_role_id: int
+    ) -> None: ...
+
+    async def update_role_config(
+        self, message_id: int, discord_role_id: int
+    ) -> None: ...
+
+    async def remove_role_config(self, message_id: int) -> None: ...
+
+    async def load_role_mappings(self) -> RoleMappingIndex: ...
+
+    async def get_config_messages(self) -> list[RoleMapping]: ...
+
+    def iterate_config_messages(self) -> AsyncIterator[RoleMapping]: ...
+
+    # Settings system:
+    async def set_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None: ...
+
+    async def update_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str, value: str
+    ) -> None: ...
+
+    async def get_setting(
+        self, guild_id: int, cog: CogSetting, setting_name: str
+    ) -> str | None: ...
+
+    async def get_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> dict[int, str] | None: ...
+
+    def iterate_settings(
+        self, cog: CogSetting, setting_name: str
+    ) -> AsyncIterator[tuple[int, str]]: ...
+
+
+def open_database(
+    db_file: str, partitions: int = 0, profile: str = DEFAULT_SQLITE_PROFILE
+) -> Storage:
+    """
+    The storage to use for a config.
+
+    Args:
+        db_file (str): Path to the (main) database file, or
+                       IN_MEMORY_DB_FILE to keep everything in memory.
+        partitions (int): How many partitions to spread guilds over, or 0
+                          to keep everything in db_file. Ignored in memory,
+                          where there is no writer to share.
+        profile (str): Name of the SQLITE_PROFILES entry to use.
+    """
+    if db_file == IN_MEMORY_DB_FILE:
+        return InMemoryDBHandler()
+    if partitions:
+        return PartitionedDBHandler(db_file, partitions, profile)
+    return DBHandler(db_file, profile)
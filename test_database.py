@@ -1,6 +1,15 @@
 import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
 
+import deadline_scheduler
+from backup import backup_database
 from db_handler import DBHandler
+from deadline_scheduler import DeadlineScheduler
+from partitioned_db import PartitionedDBHandler, migrate_to_partitions
 
 if __name__ == "__main__":
     db = DBHandler("testing_db.sqlite")
@@ -25,3 +34,283 @@ if __name__ == "__main__":
     asyncio.run(db.remove_drink_option(-1, "testing_drink"))
     if not asyncio.run(db.get_drink_option_list(-1)) == []:
         print("drink list not empty testing might be fucked")
+
+    try:
+        asyncio.run(db.set_drunk_drink(-1, -1, -1, "testing_drink"))
+        print("votes accepted for drinks that don't exist")
+    except ValueError:
+        pass
+
+    asyncio.run(db.add_drink_options(-1, ["testing_drink", "other_drink"]))
+    asyncio.run(db.set_drunk_drink(-1, -1, -1, "testing_drink"))
+    asyncio.run(db.set_drunk_drink(-1, -1, -2, "testing_drink"))
+    if not asyncio.run(db.get_drink_stats(-1, 0, 2**40)) == {
+        "testing_drink": 2
+    }:
+        print("drink stats not counting votes")
+
+    asyncio.run(db.set_drunk_drink(-1, -1, -2, "other_drink"))
+    if not asyncio.run(db.get_drink_stats(-1, 0, 2**40, hourly=True)) == {
+        "testing_drink": 1,
+        "other_drink": 1,
+    }:
+        print("drink stats not following changed votes")
+
+    asyncio.run(db.remove_drunk_drink(-1, -1, -1))
+    asyncio.run(db.remove_drunk_drink(-1, -1, -2))
+    if not asyncio.run(db.get_drink_stats(-1, 0, 2**40)) == {}:
+        print("drink stats not following removed votes")
+
+    asyncio.run(db.set_drunk_drink(-1, -1, -1, "testing_drink"))
+    asyncio.run(db.set_drunk_drink(-1, -1, -2, "other_drink"))
+    if not asyncio.run(db.get_tally(-1, -1)) == {
+        "testing_drink": [-1],
+        "other_drink": [-2],
+    }:
+        print("tally not joining votes back to drink names")
+    asyncio.run(db.remove_drink_options(-1, ["testing_drink", "other_drink"]))
+    if asyncio.run(db.get_tally(-1, -1)):
+        print("votes not removed with their drink")
+    if not asyncio.run(db.get_drink_stats(-1, 0, 2**40)) == {
+        "testing_drink": 1,
+        "other_drink": 1,
+    }:
+        print("drink stats history lost with removed drinks")
+    for table in ("drink_stats_hourly", "drink_stats_daily"):
+        asyncio.run(
+            db._execute_query(f"DELETE FROM {table} WHERE guild_id = -1")
+        )
+
+    for message_id in range(-5, 0):
+        asyncio.run(db.create_tally(message_id, -1))
+    if not len(asyncio.run(db.get_all_tallies())) == 5:
+        print("get all tallies not finding every tally")
+
+    async def _iterate_tallies_in_pages() -> list[dict[str, str | int]]:
+        return [
+            tally
+            async for tally in db._iterate_keyset_query(
+                "SELECT id FROM tallies WHERE id > ? ORDER BY id LIMIT ?;",
+                page_size=2,
+            )
+        ]
+
+    if not len(asyncio.run(_iterate_tallies_in_pages())) == 5:
+        print("keyset pagination not finding every entry")
+
+    asyncio.run(db.create_tally(-6, -1, -1, 1000))
+    if not asyncio.run(db.get_tally_deadlines()) == [(-6, 1000)]:
+        print("tally deadlines not stored")
+    asyncio.run(db.add_drink_options(-1, ["counted_drink"]))
+    asyncio.run(db.set_drunk_drink(-1, -6, -1, "counted_drink"))
+    asyncio.run(db.set_drunk_drink(-1, -6, -2, "counted_drink"))
+    if not asyncio.run(db.count_votes([(-1, -6), (-1, -5)])) == {-6: 2}:
+        print("votes not counted per tally")
+    asyncio.run(db.remove_drink_options(-1, ["counted_drink"]))
+    for table in ("drink_stats_hourly", "drink_stats_daily"):
+        asyncio.run(
+            db._execute_query(f"DELETE FROM {table} WHERE guild_id = -1")
+        )
+
+    asyncio.run(db.remove_tally(-6))
+    asyncio.run(db.remove_tallies(list(range(-5, 0))))
+    if asyncio.run(db.get_all_tallies()):
+        print("tallies not removed")
+
+    asyncio.run(db.create_role_config(-1, "testing_role", -10))
+    asyncio.run(db.create_role_config(-1, "duplicate_message", -10))
+    asyncio.run(db.update_role_config(-1, -20))
+    mappings = asyncio.run(db.load_role_mappings())
+    if (
+        -1 not in mappings.by_message_id
+        or mappings.by_role_id["testing_role"].discord_role_id != -20
+        or -10 in mappings.by_discord_role_id
+        or "duplicate_message" in mappings.by_role_id
+    ):
+        print("role mapping index out of sync with database")
+
+    asyncio.run(db.remove_role_config(-1))
+    if len(db.role_mappings) or asyncio.run(db.load_role_mappings()):
+        print("role mapping not removed")
+
+    asyncio.run(db.add_drink_option(-1, "Testing drink"))
+    asyncio.run(db.add_drink_option(-1, "toast"))
+    asyncio.run(db.add_drink_option(-1, "water"))
+    if not db.drink_names[-1].starting_with("TE", 25) == ["Testing drink"]:
+        print("drink name index not finding drinks by prefix")
+    asyncio.run(db.remove_drink_option(-1, "toast"))
+    asyncio.run(db.load_drink_names())
+    if not db.drink_names[-1].starting_with("t", 25) == ["Testing drink"]:
+        print("drink name index not following removed drinks")
+    asyncio.run(db.remove_drink_option(-1, "Testing drink"))
+    asyncio.run(db.remove_drink_option(-1, "water"))
+
+    added = asyncio.run(
+        db.add_drink_options(-1, ["bulk_one", "bulk_two", "bulk_one"])
+    )
+    if not added == ["bulk_one", "bulk_two"]:
+        print("bulk add not adding drinks once each")
+    if asyncio.run(db.add_drink_options(-1, ["bulk_one"])):
+        print("bulk add adding duplicate drinks")
+    asyncio.run(db.remove_drink_options(-1, ["bulk_one", "bulk_two"]))
+    if not asyncio.run(db.get_drink_option_list(-1)) == []:
+        print("bulk remove not removing drinks")
+
+    async def _test_pooled_connection() -> None:
+        await db.connect()
+        await asyncio.gather(
+            *(db.add_drink_option(-1, f"pooled_{i}") for i in range(10))
+        )
+        await db.flush()
+        if not len(await db.get_drink_option_list(-1)) == 10:
+            print("pooled writes went missing")
+        await db.remove_drink_options(
+            -1, [f"pooled_{i}" for i in range(10)]
+        )
+        await db.close()
+
+    asyncio.run(_test_pooled_connection())
+    if os.path.exists("testing_db.sqlite-wal") and os.path.getsize(
+        "testing_db.sqlite-wal"
+    ):
+        print("WAL not truncated on close")
+
+    with tempfile.TemporaryDirectory() as backup_dir:
+        for _ in range(3):
+            backup = backup_database("testing_db.sqlite", backup_dir, 2)
+            time.sleep(1)
+        if not backup.size or len(os.listdir(backup_dir)) != 2:
+            print("backups not made or not rotated")
+
+    with tempfile.TemporaryDirectory() as legacy_dir:
+        legacy_file = os.path.join(legacy_dir, "legacy.sqlite")
+        legacy = sqlite3.connect(legacy_file)
+        _ = legacy.executescript(
+            """
+            CREATE TABLE drink_options (
+                "id" INTEGER PRIMARY KEY NOT NULL,
+                "guild_id" INTEGER NOT NULL,
+                "name" TEXT NOT NULL,
+                UNIQUE(guild_id, name)
+            );
+            CREATE TABLE drunk_drinks (
+                "id" INTEGER PRIMARY KEY NOT NULL,
+                "guild_id" INTEGER NOT NULL,
+                "message_id" INTEGER NOT NULL,
+                "user_id" INTEGER NOT NULL,
+                "name" TEXT NOT NULL,
+                UNIQUE(guild_id, message_id, user_id)
+            );
+            INSERT INTO drink_options (guild_id, name) VALUES (-1, 'kept');
+            INSERT INTO drunk_drinks (guild_id, message_id, user_id, name)
+            VALUES (-1, -1, -1, 'kept'), (-1, -1, -2, 'removed');
+            """
+        )
+        legacy.close()
+        legacy_db = DBHandler(legacy_file)
+        asyncio.run(legacy_db.create_tables())
+        if not asyncio.run(legacy_db.get_tally(-1, -1)) == {"kept": [-1]}:
+            print("votes not migrated to drink ids")
+
+    with tempfile.TemporaryDirectory() as partition_dir:
+        single_file = os.path.join(partition_dir, "single.sqlite")
+        single_db = DBHandler(single_file)
+
+        async def _fill_single_db() -> None:
+            await single_db.create_tables()
+            for guild_id in (-1, -2, 3):
+                await single_db.add_drink_option(guild_id, "beer")
+                await single_db.create_tally(guild_id, guild_id)
+                _ = await single_db.set_drunk_drink(
+                    guild_id, guild_id, -1, "beer"
+                )
+            await single_db.create_role_config(-1, "role", -1)
+
+        asyncio.run(_fill_single_db())
+        asyncio.run(migrate_to_partitions(single_file, 2))
+        partitioned_db = PartitionedDBHandler(single_file, 2)
+
+        async def _test_partitions() -> None:
+            await partitioned_db.create_tables()
+            await partitioned_db.load_drink_names()
+            for guild_id in (-1, -2, 3):
+                if not await partitioned_db.get_tally(
+                    guild_id, guild_id
+                ) == {"beer": [-1]}:
+                    print("votes not moved to their partition")
+                if not await partitioned_db.get_drink_stats(
+                    guild_id, 0, 2**40
+                ) == {"beer": 1}:
+                    print("drink stats not moved to their partition")
+                if not await partitioned_db.get_user_drink_stats(
+                    guild_id, -1
+                ) == {"beer": 1}:
+                    print("user drink stats not moved to their partition")
+                if not partitioned_db.drink_names.get(guild_id):
+                    print("drink names not loaded from partitions")
+            if not await partitioned_db.count_tallies() == 3:
+                print("tallies not counted over partitions")
+            if await partitioned_db.main.has_guild_data():
+                print("guild data left in main database after migration")
+            if not len(await partitioned_db.load_role_mappings()) == 1:
+                print("role configs not kept in main database")
+
+        asyncio.run(_test_partitions())
+        try:
+            _ = PartitionedDBHandler(single_file, 3)
+            print("changing the number of partitions not refused")
+        except ValueError:
+            pass
+
+    async def _test_deadline_scheduler() -> None:
+        batches: list[list[int]] = []
+        # key: how many more times closing it fails
+        failing: dict[int, int] = {}
+        tried: dict[int, list[float]] = {}
+
+        async def callback(keys: list[int]) -> None:
+            batches.append(keys)
+            for key in keys:
+                tried.setdefault(key, []).append(time.monotonic())
+            if any(failing.get(key) for key in keys):
+                for key in keys:
+                    failing[key] = max(failing.get(key, 0) - 1, 0)
+                raise RuntimeError("closing failed")
+
+        scheduler = DeadlineScheduler(callback, max_batch=2)
+        scheduler.start()
+        now = time.time()
+        for key in range(5):
+            scheduler.schedule(key, now)
+        # Rescheduled away, the stale heap entry must not fire.
+        scheduler.schedule(10, now)
+        scheduler.schedule(10, now + 3600)
+        await asyncio.sleep(0.05)
+        if not sorted(len(batch) for batch in batches) == [1, 2, 2]:
+            print(f"due keys not handed over in capped batches: {batches}")
+        if 10 in tried:
+            print("rescheduled deadline fired at its old time")
+        if not len(scheduler) == 1:
+            print("handled deadlines still pending")
+
+        batches.clear()
+        failing.update({20: 2, 21: 2})
+        scheduler.schedule(20, time.time())
+        scheduler.schedule(21, time.time())
+        await asyncio.sleep(0.4)
+        scheduler.stop()
+        if not [len(tried.get(key, [])) for key in (20, 21)] == [3, 3]:
+            print(f"failed deadlines not retried until they succeed: {tried}")
+        else:
+            first, second = (
+                tried[20][1] - tried[20][0],
+                tried[20][2] - tried[20][1],
+            )
+            if not first >= 0.05 or not second >= 2 * 0.05:
+                print("failed deadlines not retried with a backoff")
+
+    deadline_scheduler.RETRY_DELAY = 0.05
+    # The failures are on purpose, don't log them.
+    logging.disable(logging.ERROR)
+    asyncio.run(_test_deadline_scheduler())
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from db_handler import DBHandler
+from helpers import CogSetting
+from in_memory_db import InMemoryDBHandler
+from partitioned_db import PartitionedDBHandler
+from storage import Storage
+
+# Guilds that land in different partitions of a partitioned database.
+GUILDS = (-1, -2, 3)
+
+
+async def check_drinks(db: Storage, failures: list[str]) -> None:
+    guild_id = GUILDS[0]
+    if await db.get_drink_option_list(guild_id):
+        failures.append("drink list not empty in a new database")
+
+    await db.add_drink_option(guild_id, "water")
+    try:
+        await db.add_drink_option(guild_id, "water")
+        failures.append("duplicate drink added")
+    except ValueError:
+        pass
+    added = await db.add_drink_options(guild_id, ["Beer", "cider", "Beer"])
+    if not added == ["Beer", "cider"]:
+        failures.append("bulk add not adding drinks once each")
+    if await db.add_drink_options(guild_id, ["water"]):
+        failures.append("bulk add adding existing drinks")
+    if not await db.get_drink_option_list(guild_id) == [
+        "Beer",
+        "cider",
+        "water",
+    ]:
+        failures.append("drink list not sorted by name")
+    if await db.get_drink_option_list(GUILDS[1]):
+        failures.append("drinks leaking between guilds")
+    if not db.drink_names[guild_id].starting_with("C", 25) == ["cider"]:
+        failures.append("drink name index not following added drinks")
+
+    await db.add_drink_option(guild_id, "juice")
+    await db.remove_drink_option(guild_id, "juice")
+    await db.remove_drink_option(guild_id, "never added")
+    await db.load_drink_names()
+    if db.drink_names[guild_id].starting_with("j", 25):
+        failures.append("drink name index not following removed drinks")
+
+
+async def check_votes(db: Storage, failures: list[str]) -> None:
+    guild_id, other_guild_id = GUILDS[0], GUILDS[1]
+    message_id = 100
+    for vote_guild_id, drink_name, failure in (
+        (guild_id, "unknown", "votes accepted for drinks that don't exist"),
+        (guild_id, "nothing", "votes accepted for nothing"),
+        (other_guild_id, "water", "votes accepted for another guild's drinks"),
+    ):
+        try:
+            _ = await db.set_drunk_drink(
+                vote_guild_id, message_id, 1, drink_name
+            )
+            failures.append(failure)
+        except ValueError:
+            pass
+
+    if not (
+        await db.set_drunk_drink(guild_id, message_id, 1, "cider")
+        and await db.set_drunk_drink(guild_id, message_id, 2, "water")
+        and await db.set_drunk_drink(guild_id, message_id, 3, "cider")
+    ):
+        failures.append("new votes not reported as new")
+    if await db.set_drunk_drink(guild_id, message_id, 1, "cider"):
+        failures.append("repeated vote reported as new")
+    if await db.set_drunk_drink(guild_id, message_id, 2, "Beer"):
+        failures.append("changed vote reported as new")
+
+    tally = await db.get_tally(message_id, guild_id)
+    # Grouped in the order the drinks were added.
+    if not list(tally) == ["Beer", "cider"] or not {
+        name: sorted(users) for name, users in tally.items()
+    } == {"Beer": [2], "cider": [1, 3]}:
+        failures.append(f"tally not grouping votes by drink: {tally}")
+    if not await db.count_votes(
+        [(guild_id, message_id), (guild_id, message_id + 1)]
+    ) == {message_id: 3}:
+        failures.append("votes not counted per tally")
+
+    stats = await db.get_drink_stats(guild_id, 0, 2**40)
+    if not list(stats.items()) == [("cider", 2), ("Beer", 1)]:
+        failures.append(f"drink stats not following votes: {stats}")
+    if not await db.get_drink_stats(guild_id, 0, 2**40, hourly=True) == {
+        "cider": 2,
+        "Beer": 1,
+    }:
+        failures.append("hourly drink stats not following votes")
+    tomorrow = int(time.time()) + 24 * 60 * 60
+    if await db.get_drink_stats(guild_id, tomorrow, 2**40):
+        failures.append("drink stats not limited to the time span")
+
+    await db.remove_drunk_drink(guild_id, message_id, 3)
+    await db.remove_drunk_drink(guild_id, message_id, 4)
+    if not await db.get_drink_stats(guild_id, 0, 2**40) == {
+        "cider": 1,
+        "Beer": 1,
+    }:
+        failures.append("drink stats not following removed votes")
+
+    await db.remove_drink_options(guild_id, ["cider"])
+    if not await db.get_tally(message_id, guild_id) == {"Beer": [2]}:
+        failures.append("votes not removed with their drink")
+    if not await db.get_drink_stats(guild_id, 0, 2**40) == {
+        "cider": 1,
+        "Beer": 1,
+    }:
+        failures.append("drink stats history lost with removed drinks")
+    if await db.get_drink_stats(other_guild_id, 0, 2**40):
+        failures.append("drink stats leaking between guilds")
+
+
+async def check_drink_history(db: Storage, failures: list[str]) -> None:
+    guild_id = GUILDS[2]
+    _ = await db.add_drink_options(guild_id, ["tea", "coffee"])
+    for message_id in range(400, 425):
+        _ = await db.set_drunk_drink(
+            guild_id, message_id, 7, "tea" if message_id % 2 else "coffee"
+        )
+    _ = await db.set_drunk_drink(guild_id, 403, 7, "coffee")
+    await db.remove_drunk_drink(guild_id, 410, 7)
+    _ = await db.set_drunk_drink(guild_id, 400, 8, "tea")
+    # Newest first, the changed vote keeps its place.
+    expected = [
+        "tea" if message_id % 2 and message_id != 403 else "coffee"
+        for message_id in range(424, 399, -1)
+        if message_id != 410
+    ]
+
+    history: list[str] = []
+    page_sizes: list[int] = []
+    cursor: int | None = None
+    while True:
+        page, cursor = await db.get_drink_history(guild_id, 7, 10, cursor)
+        history.extend(name for name, _ in page)
+        page_sizes.append(len(page))
+        if any(created_at is None for _, created_at in page):
+            failures.append("drink history missing when drinks were logged")
+        if cursor is None or len(page_sizes) > 5:
+            break
+    if not history == expected or not page_sizes == [10, 10, 4]:
+        failures.append(f"drink history not paged newest first: {history}")
+    if not await db.get_user_drink_stats(guild_id, 7) == {
+        "coffee": 13,
+        "tea": 11,
+    }:
+        failures.append("user drink stats not following votes")
+    if not await db.get_drink_history(guild_id, 9, 10) == ([], None):
+        failures.append("drink history found for a user without votes")
+
+    await db.remove_drink_option(guild_id, "coffee")
+    page, cursor = await db.get_drink_history(guild_id, 7, 100)
+    if not [name for name, _ in page] == ["tea"] * 11 or cursor is not None:
+        failures.append("drink history not following removed drinks")
+    if not list((await db.get_user_drink_stats(guild_id, 7)).items()) == [
+        ("coffee", 13),
+        ("tea", 11),
+    ]:
+        failures.append("user drink stats history lost with removed drinks")
+    if not await db.get_user_drink_stats(guild_id, 8) == {"tea": 1}:
+        failures.append("user drink stats mixing users")
+
+
+async def check_tallies(db: Storage, failures: list[str]) -> None:
+    for message_id, guild_id in enumerate(GUILDS * 2, start=200):
+        await db.create_tally(message_id, guild_id, guild_id, message_id)
+    # Message ids are unique across Discord, so partitions only have to
+    # refuse duplicates within a guild.
+    await db.create_tally(200, GUILDS[0])
+    await db.create_tally(300, GUILDS[0])
+    if not await db.count_tallies() == 7:
+        failures.append("duplicate tallies not refused")
+    if not set(await db.get_all_tallies()) == {
+        (200, -1, -1),
+        (201, -2, -2),
+        (202, 3, 3),
+        (203, -1, -1),
+        (204, -2, -2),
+        (205, 3, 3),
+        (300, -1, None),
+    }:
+        failures.append("tallies not all found")
+    if not [tally async for tally in db.iterate_all_tallies()]:
+        failures.append("tallies not iterated")
+    if not sorted(await db.get_tally_deadlines()) == [
+        (message_id, message_id) for message_id in range(200, 206)
+    ]:
+        failures.append("tally deadlines not stored")
+    if not await db.get_latest_tally(GUILDS[0]) == 300:
+        failures.append("latest tally not the last created")
+
+    await db.remove_tallies([300, 203])
+    await db.remove_tally(201)
+    if not await db.get_latest_tally(GUILDS[0]) == 200:
+        failures.append("latest tally not following removed tallies")
+    if not await db.count_tallies() == 4:
+        failures.append("tallies not removed")
+    if await db.get_latest_tally(5):
+        failures.append("latest tally found in a guild without tallies")
+
+
+async def check_role_configs(db: Storage, failures: list[str]) -> None:
+    await db.create_role_config(1, "role", 10)
+    await db.create_role_config(1, "duplicate message", 10)
+    await db.create_role_config(2, "role", 10)
+    await db.create_role_config(3, "other role", 10)
+    await db.update_role_config(1, 20)
+    mappings = await db.load_role_mappings()
+    if (
+        not len(mappings) == 2
+        or mappings.by_role_id["role"].discord_role_id != 20
+        or "duplicate message" in mappings.by_role_id
+        or [mapping.role_id for mapping in mappings.by_discord_role_id[10]]
+        != ["other role"]
+    ):
+        failures.append("role mapping index out of sync with storage")
+    if not len(await db.get_config_messages()) == 2:
+        failures.append("role configs not all found")
+
+    await db.remove_role_config(1)
+    if not [
+        mapping.message_id async for mapping in db.iterate_config_messages()
+    ] == [3] or not len(db.role_mappings) == 1:
+        failures.append("role config not removed")
+
+
+async def check_settings(db: Storage, failures: list[str]) -> None:
+    cog = CogSetting.DRINKS_HANDLER
+    for guild_id in GUILDS:
+        await db.set_setting(guild_id, cog, "channel", str(guild_id))
+    await db.set_setting(GUILDS[0], cog, "channel", "duplicate")
+    await db.update_setting(GUILDS[1], cog, "channel", "updated")
+    await db.update_setting(GUILDS[1], cog, "never set", "updated")
+    if not await db.get_setting(GUILDS[0], cog, "channel") == "-1":
+        failures.append("setting overwritten by setting it again")
+    if not await db.get_setting(GUILDS[1], cog, "channel") == "updated":
+        failures.append("setting not updated")
+    if await db.get_setting(GUILDS[1], cog, "never set"):
+        failures.append("updating a setting that was never set stored it")
+    if await db.get_setting(
+        GUILDS[0], CogSetting.CONFIGURE_DRINKS_HANDLER, "channel"
+    ):
+        failures.append("settings leaking between cogs")
+    if not await db.get_settings(cog, "channel") == {
+        -1: "-1",
+        -2: "updated",
+        3: "3",
+    }:
+        failures.append("settings not found in every guild")
+    if await db.get_settings(cog, "never set") is not None:
+        failures.append("settings found that were never set")
+
+
+async def check_storage(db: Storage) -> list[str]:
+    """
+    Puts a fresh storage through what the cogs rely on it for.
+
+    Returns:
+        list[str]: What it got wrong.
+    """
+    failures: list[str] = []
+    await db.create_tables()
+    await db.connect()
+    try:
+        if not await db.ping():
+            failures.append("not answering pings")
+        if await db.has_guild_data():
+            failures.append("guild data in a new database")
+        await db.load_drink_names()
+        _ = await db.load_role_mappings()
+        await check_drinks(db, failures)
+        await check_votes(db, failures)
+        await check_drink_history(db, failures)
+        await check_tallies(db, failures)
+        await check_role_configs(db, failures)
+        await check_settings(db, failures)
+        await db.flush()
+        if not await db.has_guild_data():
+            failures.append("guild data not found")
+    finally:
+        await db.close()
+    return failures
+
+
+if __name__ == "__main__":
+    # Duplicates are refused on purpose, which logs errors.
+    logging.disable(logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        backends: dict[str, Storage] = {
+            "sqlite": DBHandler(os.path.join(directory, "single.sqlite")),
+            "partitioned": PartitionedDBHandler(
+                os.path.join(directory, "partitioned.sqlite"), 2
+            ),
+            "in memory": InMemoryDBHandler(),
+        }
+        for name, db in backends.items():
+            for failure in asyncio.run(check_storage(db)):
+                print(f"{name}: {failure}")
@@ -0,0 +1,528 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from typing import Any, final
+
+import discord
+from discord.ui.select import selected_values
+
+from storage import IN_MEMORY_DB_FILE
+
+logger = logging.getLogger(__name__)
+
+# Replayed tally messages get ids from here up, well clear of the small
+# anonymized ids in recordings.
+REPLAY_MESSAGE_ID_START = 10**15
+# Most seconds a recorded event waits in the file buffer before it is
+# flushed to disk.
+RECORD_FLUSH_INTERVAL = 5.0
+
+
+@final
+class TrafficRecorder:
+    """
+    Appends every interaction the bot accepts to a file, one JSON object per
+    line. Discord ids are replaced with small numbers that are only
+    consistent within one run of the bot, and no names are kept, so a
+    recording can be shared. What's left is when it happened, which handler
+    took it, and the values picked or typed (drink names, options).
+    Events are written and flushed by a thread, so the loop never waits on
+    disk.
+    """
+
+    def __init__(
+        self, path: str, flush_interval: float = RECORD_FLUSH_INTERVAL
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.event_count = 0
+        self._ids: dict[int, int] = {}
+        # Events to write, None once closed.
+        self._events: queue.SimpleQueue[dict[str, Any] | None] = (
+            queue.SimpleQueue()
+        )
+        self._file = open(path, "a", encoding="utf-8")
+        self._writer = threading.Thread(
+            target=self._write, name="traffic-recorder", daemon=True
+        )
+        self._writer.start()
+
+    def record(self, interaction: discord.Interaction, handler: str) -> None:
+        self._events.put(self._event(interaction, handler))
+        self.event_count += 1
+
+    def close(self) -> None:
+        """Write what is left and close the file. Blocks until done."""
+        self._events.put(None)
+        self._writer.join()
+
+    def _write(self) -> None:
+        with self._file:
+            next_flush = time.monotonic() + self.flush_interval
+            while True:
+                try:
+                    event = self._events.get(
+                        timeout=max(next_flush - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    pass
+                else:
+                    if event is None:
+                        return
+                    _ = self._file.write(
+                        json.dumps(event, separators=(",", ":")) + "\n"
+                    )
+                if time.monotonic() >= next_flush:
+                    self._file.flush()
+                    next_flush = time.monotonic() + self.flush_interval
+
+    def _anonymize(self, snowflake: int) -> int:
+        return self._ids.setdefault(snowflake, len(self._ids) + 1)
+
+    def _event(
+        self, interaction: discord.Interaction, handler: str
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = dict(interaction.data or {})
+        event: dict[str, Any] = {"t": round(time.time(), 3), "h": handler}
+        if interaction.guild_id:
+            event["g"] = self._anonymize(interaction.guild_id)
+        event["u"] = self._anonymize(interaction.user.id)
+        # Context menus target a message, components sit on one.
+        message_id = data.get("target_id") or (
+            interaction.message.id if interaction.message else None
+        )
+        if message_id:
+            event["m"] = self._anonymize(int(message_id))
+        values = _collect_values(data)
+        if values:
+            event["v"] = values
+        return event
+
+
+def _collect_values(data: Any) -> list[Any]:
+    """
+    The values in interaction data, in order: command options, selected
+    options and text typed into modals.
+    """
+    values: list[Any] = []
+    if isinstance(data, dict):
+        if "value" in data:
+            values.append(data["value"])
+        values.extend(data.get("values", []))
+        for key in ("options", "components", "component"):
+            values.extend(_collect_values(data.get(key)))
+    elif isinstance(data, list):
+        for item in data:
+            values.extend(_collect_values(item))
+    return values
+
+
+def load_recording(path: str) -> list[dict[str, Any]]:
+    """Read a recording, oldest event first."""
+    with open(path, encoding="utf-8") as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    events.sort(key=lambda event: event["t"])
+    return events
+
+
+@final
+class ReplayReport:
+    """Latency and throughput of a replayed recording."""
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+        self.skipped: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.duration = 0.0
+
+    @property
+    def event_count(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    def summary(self) -> str:
+        """A human readable summary of the replay."""
+        lines = [
+            f"events: {self.event_count} in {self.duration:.2f}s "
+            + f"({self.event_count / max(self.duration, 1e-9):.1f}/s), "
+            + f"errors: {sum(self.errors.values())}",
+        ]
+        for handler, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            lines.append(
+                f"{handler:<20} n={len(ordered):<6} "
+                + f"p50={_percentile(ordered, 0.5) * 1000:.1f}ms "
+                + f"p95={_percentile(ordered, 0.95) * 1000:.1f}ms "
+                + f"p99={_percentile(ordered, 0.99) * 1000:.1f}ms "
+                + f"max={ordered[-1] * 1000:.1f}ms"
+                + (
+                    f" errors={self.errors[handler]}"
+                    if self.errors[handler]
+                    else ""
+                )
+            )
+        for handler, count in sorted(self.skipped.items()):
+            lines.append(f"skipped {handler}: {count}")
+        return "\n".join(lines)
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+# Stand-ins for the Discord objects the cogs touch. They carry just enough
+# for the callbacks to run, and drop everything that would be sent.
+
+
+class _StandInUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.display_name = f"user {user_id}"
+        self.mention = f"<@{user_id}>"
+
+
+class _StandInMessage:
+    def __init__(self, message_id: int, guild: "_StandInGuild") -> None:
+        self.id = message_id
+        self.guild = guild
+
+    async def edit(self, **_kwargs: Any) -> "_StandInMessage":
+        return self
+
+
+class _StandInChannel(discord.abc.Messageable):
+    def __init__(self, channel_id: int, guild: "_StandInGuild") -> None:
+        self.id = channel_id
+        self.guild = guild
+
+    def get_partial_message(self, message_id: int) -> _StandInMessage:
+        return _StandInMessage(message_id, self.guild)
+
+
+class _StandInGuild:
+    def __init__(self, guild_id: int) -> None:
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+        self.channel = _StandInChannel(guild_id, self)
+
+    def get_member(self, _user_id: int) -> None:
+        return None
+
+    def get_role(self, _role_id: int) -> None:
+        return None
+
+    def get_channel_or_thread(self, _channel_id: int) -> _StandInChannel:
+        return self.channel
+
+
+class _StandInResponse:
+    def __init__(self) -> None:
+        self.sent: list[dict[str, Any]] = []
+
+    async def send_message(self, *args: Any, **kwargs: Any) -> None:
+        self.sent.append({"args": args, **kwargs})
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        self.sent.append({"modal": modal})
+
+    async def defer(self, **_kwargs: Any) -> None:
+        pass
+
+    def is_done(self) -> bool:
+        return bool(self.sent)
+
+
+class _StandInInteraction:
+    def __init__(
+        self,
+        replayer: "TrafficReplayer",
+        guild: _StandInGuild,
+        user_id: int,
+        message: _StandInMessage | None = None,
+    ) -> None:
+        self._replayer = replayer
+        self.client = replayer.bot
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = guild.channel
+        self.channel_id = guild.channel.id
+        self.user = _StandInUser(user_id)
+        self.message = message
+        self.response = _StandInResponse()
+
+    async def original_response(self) -> _StandInMessage:
+        return self._replayer.new_message(self.guild)
+
+
+@final
+class TrafficReplayer:
+    """
+    Feeds a recording into the cogs against a fresh database in a temporary
+    directory, with stand-ins for everything Discord. Each event runs as its
+    own task at its recorded offset divided by the speed, so bursts overlap
+    like they did live.
+    """
+
+    def __init__(self, db_file: str, speed: float = 1.0) -> None:
+        # Imported here so recording doesn't pull in the cogs.
+        from bot import PanternBot
+        from cogs.configure_drinks_handler import ConfigureDrinksHandler
+        from cogs.drinks_handler import DrinkHandler
+        from config import Config
+
+        self.speed = speed
+        self.bot = PanternBot(Config(token="", db_file=db_file), "!")
+        self.drinks = DrinkHandler(self.bot)
+        self.configure = ConfigureDrinksHandler(self.bot)
+        self.report = ReplayReport()
+        self._guilds: dict[int, _StandInGuild] = {}
+        self._tally_views: dict[int, Any] = {}
+        self._config_views: dict[int, Any] = {}
+        self._next_message_id = REPLAY_MESSAGE_ID_START
+        self._handlers: dict[
+            str, Callable[[dict[str, Any]], Awaitable[None]]
+        ] = {
+            "drink": self._drink,
+            "drank": self._drank,
+            "drank_autocomplete": self._drank_autocomplete,
+            "drinkstats": self._drinkstats,
+            "mydrinks": self._mydrinks,
+            "Tally": self._tally,
+            "ChooseDrinkView": self._choose_drink,
+            "configure_drinks": self._configure_drinks,
+            "ConfigureDrinksView": self._configure_drinks_button,
+            "AddDrinkModal": self._add_drinks,
+            "RemoveDrinkModal": self._remove_drinks,
+        }
+
+    def new_message(self, guild: _StandInGuild) -> _StandInMessage:
+        self._next_message_id += 1
+        return _StandInMessage(self._next_message_id, guild)
+
+    def _guild(self, guild_id: int) -> _StandInGuild:
+        if guild_id not in self._guilds:
+            self._guilds[guild_id] = _StandInGuild(guild_id)
+        return self._guilds[guild_id]
+
+    def _interaction(self, event: dict[str, Any]) -> Any:
+        guild = self._guild(event.get("g", 0))
+        message = (
+            _StandInMessage(event["m"], guild) if "m" in event else None
+        )
+        return _StandInInteraction(self, guild, event.get("u", 0), message)
+
+    async def replay(self, events: list[dict[str, Any]]) -> ReplayReport:
+        await self.bot.db.create_tables()
+        await self.bot.db.connect()
+        await self._seed(events)
+        try:
+            start = time.perf_counter()
+            first = events[0]["t"] if events else 0.0
+            tasks: list[asyncio.Task[None]] = []
+            for event in events:
+                if self.speed > 0:
+                    due = start + (event["t"] - first) / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self._run(event)))
+            _ = await asyncio.gather(*tasks)
+            self.report.duration = time.perf_counter() - start
+        finally:
+            await self.bot.db.close()
+        return self.report
+
+    async def _seed(self, events: list[dict[str, Any]]) -> None:
+        """
+        Add every drink picked in the recording to its guild, and every
+        tally voted on, since the recording starts with whatever the guilds
+        already had. Replayed /drink commands get new message ids, so votes
+        always go to these tallies.
+        """
+        from cogs.drinks_handler import ChooseDrinkView
+
+        drinks: dict[int, list[str]] = {}
+        tallies: dict[int, int] = {}
+        for event in events:
+            if event["h"] in ("ChooseDrinkView", "drank"):
+                names = drinks.setdefault(event.get("g", 0), [])
+                names.extend(
+                    str(value)
+                    for value in event.get("v", [])
+                    if value != "nothing" and str(value) not in names
+                )
+            if event["h"] == "ChooseDrinkView":
+                _ = tallies.setdefault(event["m"], event.get("g", 0))
+        for guild_id, names in drinks.items():
+            _ = await self.bot.db.add_drink_options(guild_id, names)
+        for message_id, guild_id in tallies.items():
+            await self.bot.db.create_tally(message_id, guild_id)
+            view = await ChooseDrinkView.create(
+                message_id, guild_id, self.bot.db
+            )
+            view.message = _StandInMessage(message_id, self._guild(guild_id))
+            self._tally_views[message_id] = view
+
+    async def _run(self, event: dict[str, Any]) -> None:
+        handler = event["h"]
+        replay = self._handlers.get(handler)
+        if not replay:
+            self.report.skipped[handler] += 1
+            return
+        start = time.perf_counter()
+        try:
+            await replay(event)
+        except Exception:
+            self.report.errors[handler] += 1
+            logger.debug("replaying %s failed", handler, exc_info=True)
+        self.report.latencies.setdefault(handler, []).append(
+            time.perf_counter() - start
+        )
+
+    async def _drink(self, event: dict[str, Any]) -> None:
+        await self.drinks.drink.callback(
+            self.drinks, self._interaction(event), *event.get("v", [])
+        )
+
+    async def _drank(self, event: dict[str, Any]) -> None:
+        await self.drinks.drank.callback(
+            self.drinks, self._interaction(event), str(event["v"][0])
+        )
+
+    async def _drank_autocomplete(self, event: dict[str, Any]) -> None:
+        _ = await self.drinks.drank_autocomplete(
+            self._interaction(event), str(event.get("v", [""])[0])
+        )
+
+    async def _drinkstats(self, event: dict[str, Any]) -> None:
+        await self.drinks.drinkstats.callback(
+            self.drinks, self._interaction(event), *event.get("v", [])
+        )
+
+    async def _mydrinks(self, event: dict[str, Any]) -> None:
+        await self.drinks.mydrinks.callback(
+            self.drinks, self._interaction(event)
+        )
+
+    async def _tally(self, event: dict[str, Any]) -> None:
+        interaction = self._interaction(event)
+        await self.drinks.tally_drinks_callback(
+            interaction, interaction.message
+        )
+
+    async def _choose_drink(self, event: dict[str, Any]) -> None:
+        view = self._tally_views[event["m"]]
+        _ = selected_values.set(
+            {view.selector.custom_id: [str(event["v"][0])]}
+        )
+        await view.selector.callback(self._interaction(event))
+
+    async def _config_view(self, event: dict[str, Any]) -> Any:
+        from cogs.configure_drinks_handler import ConfigureDrinksView
+
+        guild = self._guild(event.get("g", 0))
+        view = self._config_views.get(guild.id)
+        if not view:
+            view = await ConfigureDrinksView.create(
+                guild.id, self.bot.db, self.bot.rest
+            )
+            view.message = self.new_message(guild)
+            self._config_views[guild.id] = view
+        return view
+
+    async def _configure_drinks(self, event: dict[str, Any]) -> None:
+        await self.configure.configure_drinks.callback(
+            self.configure, self._interaction(event)
+        )
+
+    async def _configure_drinks_button(self, event: dict[str, Any]) -> None:
+        view = await self._config_view(event)
+        await view.add_drink_button(self._interaction(event))
+
+    async def _add_drinks(self, event: dict[str, Any]) -> None:
+        from cogs.configure_drinks_handler import AddDrinkModal
+
+        modal = AddDrinkModal(await self._config_view(event))
+        # discord.py has no public way to fill in a modal.
+        modal.name.component._value = "\n".join(  # pyright: ignore
+            str(value) for value in event.get("v", [])
+        )
+        await modal.on_submit(self._interaction(event))
+
+    async def _remove_drinks(self, event: dict[str, Any]) -> None:
+        from cogs.configure_drinks_handler import RemoveDrinkModal
+
+        view = await self._config_view(event)
+        modal = RemoveDrinkModal(view, view.drink_list)
+        values = [str(value) for value in event.get("v", [])]
+        if modal.large_input:
+            modal.input_name.component._value = "\n".join(  # pyright: ignore
+                values
+            )
+        else:
+            _ = selected_values.set(
+                {modal.select_name.component.custom_id: values}
+            )
+        await modal.on_submit(self._interaction(event))
+
+
+async def replay_recording(
+    path: str, speed: float = 1.0, in_memory: bool = False
+) -> ReplayReport:
+    """
+    Replay a recording against a throwaway database.
+
+    Args:
+        path (str): The recording to replay.
+        speed (float): How many times faster than recorded to replay, 0 to
+                       send every event at once.
+        in_memory (bool): Keep the data in memory rather than in SQLite.
+                          The difference in latency from a SQLite replay is
+                          the time spent in storage.
+
+    Returns:
+        ReplayReport: Latency per handler and overall throughput.
+    """
+    events = load_recording(path)
+    with tempfile.TemporaryDirectory() as directory:
+        replayer = TrafficReplayer(
+            (
+                IN_MEMORY_DB_FILE
+                if in_memory
+                else os.path.join(directory, "replay.sqlite")
+            ),
+            speed,
+        )
+        return await replayer.replay(events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded interaction traffic offline."
+    )
+    _ = parser.add_argument("recording")
+    _ = parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="times faster than recorded, 0 for as fast as possible",
+    )
+    _ = parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="keep the data in memory instead of SQLite",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(
+        asyncio.run(
+            replay_recording(args.recording, args.speed, args.in_memory)
+        ).summary()
+    )
@@ -0,0 +1,126 @@
+import logging
+from collections import Counter
+from typing import final
+
+import discord
+from discord import ui
+
+logger = logging.getLogger(__name__)
+
+PersistentView = ui.View | ui.LayoutView
+
+
+@final
+class ViewRegistry:
+    """
+    Tracks every persistent view the bot listens to by the id of the message
+    it is attached to. Views of a kind that only has one live message per
+    guild (like the config message) replace each other, and the replaced view
+    is stopped, which also takes it out of discord.py's view store. That way
+    the store only ever holds views for messages that can still be used.
+    """
+
+    def __init__(self, client: discord.Client) -> None:
+        self._client = client
+        # message_id: (kind, guild_id, view)
+        self._views: dict[int, tuple[str, int, PersistentView]] = {}
+        # (kind, guild_id): message_id, for kinds with one message per guild
+        self._current: dict[tuple[str, int], int] = {}
+
+    def register(
+        self,
+        kind: str,
+        guild_id: int,
+        message_id: int,
+        view: PersistentView,
+        replace: bool = False,
+    ) -> PersistentView | None:
+        """
+        Track a view, adding it to the view store if it isn't already.
+
+        Args:
+            kind (str): What kind of view this is, for counting.
+            guild_id (int): The guild the message is in.
+            message_id (int): The message the view is attached to.
+            view (PersistentView): The view.
+            replace (bool): If this view supersedes any earlier view of the
+                            same kind in the guild.
+
+        Returns:
+            PersistentView | None: The superseded view, already stopped.
+        """
+        superseded = None
+        if replace:
+            old_message_id = self._current.get((kind, guild_id))
+            if old_message_id is not None and old_message_id != message_id:
+                superseded = self.evict(old_message_id)
+            self._current[(kind, guild_id)] = message_id
+        self._views[message_id] = (kind, guild_id, view)
+        if not view.is_finished():
+            # Adding a view that is already stored just refreshes it.
+            self._client.add_view(view, message_id=message_id)
+        return superseded
+
+    def get(self, message_id: int) -> PersistentView | None:
+        entry = self._views.get(message_id)
+        return entry[2] if entry else None
+
+    def evict(self, message_id: int) -> PersistentView | None:
+        """Stop tracking the view on a message and stop listening to it."""
+        entry = self._views.pop(message_id, None)
+        if not entry:
+            return None
+        kind, guild_id, view = entry
+        if self._current.get((kind, guild_id)) == message_id:
+            del self._current[(kind, guild_id)]
+        # Stopping a view removes it from the view store.
+        view.stop()
+        return view
+
+    def evict_guild(self, guild_id: int) -> int:
+        """Evict every view in a guild, returning how many there were."""
+        message_ids = [
+            message_id
+            for message_id, (_, view_guild_id, _) in self._views.items()
+            if view_guild_id == guild_id
+        ]
+        for message_id in message_ids:
+            _ = self.evict(message_id)
+        return len(message_ids)
+
+    def evict_module(self, module: str) -> int:
+        """Evict every view whose class is defined in a module, returning
+        how many there were."""
+        message_ids = [
+            message_id
+            for message_id, (_, _, view) in self._views.items()
+            if type(view).__module__ == module
+        ]
+        for message_id in message_ids:
+            _ = self.evict(message_id)
+        return len(message_ids)
+
+    def prune(self) -> int:
+        """Drop views that have stopped on their own."""
+        finished = [
+            message_id
+            for message_id, (_, _, view) in self._views.items()
+            if view.is_finished()
+        ]
+        for message_id in finished:
+            _ = self.evict(message_id)
+        if finished:
+            logger.debug("pruned %d finished view(s)", len(finished))
+        return len(finished)
+
+    def counts(self) -> dict[str, int]:
+        """The number of live views of each kind."""
+        _ = self.prune()
+        return dict(Counter(kind for kind, _, _ in self._views.values()))
+
+    def views(self) -> list[PersistentView]:
+        """Every tracked view, live or not yet pruned."""
+        return [view for _, _, view in self._views.values()]
+
+    def __len__(self) -> int:
+        return len(self._views)